@@ -1,41 +1,272 @@
-from automated_trader.commons.logger import logger
+from automated_trader.api_client.decoder import HEARTBEAT, PRICE, PriceDecoder
+from automated_trader.api_client.order_pipeline import OrderPipeline
+from automated_trader.api_client.transactions import CancelEvent, FillEvent
+from automated_trader.api_client.transport import (
+    ThreadedStreamReader,
+    keep_http_responses,
+)
+from automated_trader.commons.account_cache import AccountCache
+from automated_trader.commons.candle_store import CANDLE_DTYPE, CandleStore
+from automated_trader.commons.latency import LatencyRecorder
+from automated_trader.commons.logger import logger, sampler
+from automated_trader.commons.metrics import (
+    FeedMetrics,
+    LatencyCollector,
+    RestMetrics,
+    registry,
+)
+from automated_trader.commons.order_state import OPEN, OrderStateMachine
+from automated_trader.commons.position_book import PositionBook
+from automated_trader.commons.rate_limiter import TokenBucket
+from automated_trader.commons.tick_buffer import (
+    TickRingBuffer,
+    format_time_ns,
+    parse_time_ns,
+)
+from automated_trader.commons.tick_recorder import TickRecorder
 from automated_trader.commons.trading_utils import (
     determine_position_sizing,
-    get_open_positions,
+    exit_criteria_met,
 )
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from time import perf_counter_ns
+import asyncio
+import atexit
+import configparser
+import json
+import numpy as np
+import os
+import pandas as pd
+import re
+import time
 import tpqoa
+import v20
 
 from v20.transaction import StopLossDetails, ClientExtensions
 from v20.transaction import TrailingStopLossDetails, TakeProfitDetails
 
 
 class OANDAClient(tpqoa.tpqoa):
+    # OANDA allows 120 REST requests per second per connection, the bucket is
+    # shared by every client of the process and stays below that
+    rate_limiter = TokenBucket(rate=100, capacity=20)
+    # threads fetching historical data at the same time
+    fetch_workers = 8
+    # most candles v20 returns for a single request
+    max_candles = 5000
+    # duration and errors of the REST requests of every client
+    rest_metrics = RestMetrics(registry)
+
     def __init__(self, file_path):
         super().__init__(file_path)
+        self.use_configured_hosts(file_path)
+        self.rest_metrics.instrument(self.ctx)
+        self.rest_metrics.instrument(keep_http_responses(self.ctx_stream))
+        # seconds the candle requests of every instrument waited for tokens
+        self.rate_limited = {}
+        self.use_candle_store(file_path)
         self.instruments = self.get_override_instruments()
         self.account_summary = self.get_account_summary()
         logger.log(20, f"Account Summary: \n{self.account_summary}")
 
+    def use_configured_hosts(self, file_path):
+        """Points the v20 contexts at the hosts of the config file, if it has any
+
+        Optional keys of the [oanda] section, eg. for the local simulator:
+            hostname = 127.0.0.1
+            stream_hostname = 127.0.0.1 (defaults to hostname)
+            port = 8080
+            ssl = false
+        """
+        config = configparser.ConfigParser()
+        config.read(file_path)
+        if "oanda" not in config or "hostname" not in config["oanda"]:
+            return
+        section = config["oanda"]
+        port = section.getint("port", 443)
+        ssl = section.getboolean("ssl", True)
+        self.ctx = v20.Context(
+            section["hostname"],
+            port,
+            ssl=ssl,
+            token=section["access_token"],
+            poll_timeout=10,
+        )
+        self.ctx_stream = v20.Context(
+            section.get("stream_hostname", section["hostname"]),
+            port,
+            ssl=ssl,
+            token=section["access_token"],
+        )
+
+    def use_candle_store(self, file_path):
+        """Opens the candle store in the candle_cache directory of the [oanda]
+        section, .candle_cache by default.  Every host and account gets a
+        directory of its own, candles of the simulator or of another account
+        never end up in the history of the live one.
+        """
+        config = configparser.ConfigParser()
+        config.read(file_path)
+        directory = ".candle_cache"
+        if "oanda" in config:
+            directory = config["oanda"].get("candle_cache", directory)
+        key = re.sub(r"[^\w.-]", "_", f"{self.ctx.hostname}-{self.account_id}")
+        self.candle_store = CandleStore(os.path.join(directory, key))
+
     def get_override_instruments(self):
         """Gets list of instruments in pair1_pair2 format"""
         ins = self.get_instruments()
         return [element[1] for element in ins]
 
     def get_historical_data(self, instrument: str, granularity: str):
-        """Gathers historical data for specified timeframe for specified Pairing"""
+        """Gathers historical data for specified timeframe for specified Pairing
+
+        Completed candles are kept in the candle store, only the candles after
+        the newest stored one are requested from OANDA.
+        """
         from_date = (datetime.today() - timedelta(days=100)).strftime("%Y-%m-%d")
         to_date = datetime.today().strftime("%Y-%m-%d")
+        start = pd.Timestamp(from_date).value
+        end = pd.Timestamp(to_date).value
 
-        data = self.get_history(
-            instrument=instrument,
-            start=from_date,
-            end=to_date,
-            granularity=granularity,
-            price="M",
+        # in memory, the file is replaced further down
+        stored = self.candle_store.read(instrument, granularity, "M")
+        if len(stored) and stored["time"][-1] >= start:
+            stored = stored[stored["time"] >= start]
+            fetch_from = int(stored["time"][-1]) + 1
+        else:
+            # nothing stored yet or the gap to the window is too large
+            stored = stored[:0]
+            fetch_from = start
+
+        candles, complete = self.fetch_candles(
+            instrument, granularity, fetch_from, end, "M"
+        )
+        if complete.any():
+            if len(stored):
+                self.candle_store.append(
+                    instrument, granularity, "M", candles[complete]
+                )
+            else:
+                self.candle_store.save(instrument, granularity, "M", candles[complete])
+
+        candles = np.concatenate([stored, candles])
+        complete = np.concatenate([np.ones(len(stored), dtype=bool), complete])
+        data = pd.DataFrame(
+            {
+                "o": candles["o"],
+                "h": candles["h"],
+                "l": candles["l"],
+                "c": candles["c"],
+                "volume": candles["volume"],
+                "complete": complete,
+            },
+            index=pd.DatetimeIndex(
+                candles["time"].astype("datetime64[ns]"), name="time"
+            ),
         )
         return data
 
+    def fetch_candles(self, instrument, granularity, start, end, price="M") -> tuple:
+        """Requests the candles starting within [start, end) from OANDA
+        params:
+            start, end: int -> epoch nanoseconds
+            price: str -> M(id), B(id) or A(sk)
+        returns:
+            (CANDLE_DTYPE array, bool array of the complete flags)
+        """
+        component = {"M": "mid", "B": "bid", "A": "ask"}[price]
+        rows = []
+        complete = []
+        while start < end:
+            # every page is a request of its own
+            self.rate_limited[instrument] = (
+                self.rate_limited.get(instrument, 0.0) + self.rate_limiter.acquire()
+            )
+            response = self.ctx.instrument.candles(
+                instrument,
+                granularity=granularity,
+                price=price,
+                fromTime=format_time_ns(start),
+                count=self.max_candles,
+            )
+            body = json.loads(response.raw_body)
+            if response.status != 200:
+                raise ValueError(
+                    f"Candles of {instrument} failed: {body.get('errorMessage')}"
+                )
+            candles = body.get("candles", [])
+            for candle in candles:
+                candle_time = parse_time_ns(candle["time"])
+                if candle_time < start:
+                    continue
+                if candle_time >= end:
+                    break
+                ohlc = candle[component]
+                rows.append(
+                    (
+                        candle_time,
+                        float(ohlc["o"]),
+                        float(ohlc["h"]),
+                        float(ohlc["l"]),
+                        float(ohlc["c"]),
+                        int(candle["volume"]),
+                    )
+                )
+                complete.append(candle["complete"])
+            if len(candles) < self.max_candles or not rows:
+                break
+            start = rows[-1][0] + 1
+        return np.array(rows, dtype=CANDLE_DTYPE), np.array(complete, dtype=bool)
+
+    def fetch_historical_data(self, instruments, granularity: str) -> dict:
+        """Gathers historical data of many instruments concurrently
+
+        Requests run on a pool of fetch_workers threads and every candle request
+        waits for a token of the shared rate_limiter first, long histories take
+        one per page.  The duration of every instrument is kept in fetch_timings,
+        the time it waited for tokens in rate_limited, and the slowest
+        instruments are logged.
+
+        params:
+            instruments: list -> instruments to fetch
+            granularity: str -> candle granularity, eg. D
+        returns:
+            dict: instrument -> DataFrame, in the order of instruments
+        """
+
+        def fetch(instrument):
+            start = time.perf_counter()
+            data = self.get_historical_data(instrument, granularity)
+            return data, time.perf_counter() - start
+
+        self.rate_limited = {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(
+            max_workers=self.fetch_workers, thread_name_prefix="history"
+        ) as pool:
+            futures = {
+                instrument: pool.submit(fetch, instrument) for instrument in instruments
+            }
+            results = {
+                instrument: future.result() for instrument, future in futures.items()
+            }
+        elapsed = time.perf_counter() - start
+
+        self.fetch_timings = {
+            instrument: duration for instrument, (_, duration) in results.items()
+        }
+        throttled = sum(self.rate_limited.values())
+        slowest = sorted(self.fetch_timings.items(), key=lambda x: x[1], reverse=True)
+        logger.log(
+            20,
+            f"Fetched {granularity} history of {len(results)} instruments in "
+            f"{elapsed:.2f}s ({throttled:.2f}s rate limited). Slowest: "
+            + ", ".join(f"{i} {d * 1000:.0f}ms" for i, d in slowest[:5]),
+        )
+        return {instrument: data for instrument, (data, _) in results.items()}
+
     def create_order(
         self,
         instrument,
@@ -48,6 +279,8 @@ class OANDAClient(tpqoa.tpqoa):
         touch=False,
         suppress=False,
         ret=False,
+        client_id=None,
+        time_in_force=None,
     ):
         """Places order with Oanda.
 
@@ -75,8 +308,13 @@ class OANDAClient(tpqoa.tpqoa):
             whether to suppress print out
         ret: boolean
             whether to return the order object
+        client_id: str
+            client order id, the order can be looked up by "@" + client_id
+        time_in_force: str
+            eg. FOK or IOC, the v20 default of the order type when None
         """
         client_ext = ClientExtensions(comment=comment) if comment is not None else None
+        order_ext = ClientExtensions(id=client_id) if client_id is not None else None
         sl_details = (
             StopLossDetails(distance=sl_distance, clientExtensions=client_ext)
             if sl_distance is not None
@@ -92,6 +330,9 @@ class OANDAClient(tpqoa.tpqoa):
             if tp_price is not None
             else None
         )
+        time_in_force = (
+            {"timeInForce": time_in_force} if time_in_force is not None else {}
+        )
         if price is None:
             request = self.ctx.order.market(
                 self.account_id,
@@ -100,6 +341,8 @@ class OANDAClient(tpqoa.tpqoa):
                 stopLossOnFill=sl_details,
                 trailingStopLossOnFill=tsl_details,
                 takeProfitOnFill=tp_details,
+                clientExtensions=order_ext,
+                **time_in_force,
             )
         elif touch:
             request = self.ctx.order.market_if_touched(
@@ -110,6 +353,8 @@ class OANDAClient(tpqoa.tpqoa):
                 stopLossOnFill=sl_details,
                 trailingStopLossOnFill=tsl_details,
                 takeProfitOnFill=tp_details,
+                clientExtensions=order_ext,
+                **time_in_force,
             )
         else:
             request = self.ctx.order.limit(
@@ -120,14 +365,18 @@ class OANDAClient(tpqoa.tpqoa):
                 stopLossOnFill=sl_details,
                 trailingStopLossOnFill=tsl_details,
                 takeProfitOnFill=tp_details,
+                clientExtensions=order_ext,
+                **time_in_force,
             )
 
-        print(f"REQUEST BODY: {request.body}")
         # First checking if the order is rejected
         if "orderRejectTransaction" in request.body:
             order = request.get("orderRejectTransaction")
         elif "orderFillTransaction" in request.body:
             order = request.get("orderFillTransaction")
+        elif "orderCancelTransaction" in request.body:
+            # created and cancelled right away, eg. an unfilled FOK order
+            order = request.get("orderCancelTransaction")
         elif "orderCreateTransaction" in request.body:
             order = request.get("orderCreateTransaction")
         else:
@@ -135,14 +384,94 @@ class OANDAClient(tpqoa.tpqoa):
             order = None
 
         if not suppress and order is not None:
-            print("\n\n", order.dict(), "\n")
+            logger.log(20, "Order: %s", order.dict(), extra={"category": "order"})
         if ret is True:
             return order.dict() if order is not None else None
 
 
+def order_outcome(transaction) -> str:
+    """filled, rejected, cancelled or created (pending) from an order
+    transaction
+    """
+    kind = (transaction or {}).get("type", "")
+    if kind == "ORDER_FILL":
+        return "filled"
+    if kind == "ORDER_CANCEL":
+        return "cancelled"
+    if kind.endswith("_REJECT"):
+        return "rejected"
+    return "created"
+
+
 class StreamingClient(OANDAClient):
     """Streaming Client which overrides the tpqoa library for on_success and stream_data functions"""
 
+    # ticks kept per instrument in the tick buffer
+    tick_buffer_capacity = 1024
+    tick_buffer = None
+    # seconds between two reconciliations of the position book with REST
+    reconcile_interval = 60.0
+    # seconds between two background refreshes of the account summary
+    account_summary_ttl = 30.0
+
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self.setup_order_path(
+            AccountCache(
+                self.get_account_summary,
+                ttl=self.account_summary_ttl,
+                summary=self.account_summary,
+            ).start(),
+            OrderPipeline(self),
+            registry,
+        )
+        self.use_tick_recorder(file_path)
+
+    def setup_order_path(self, account_cache, order_pipeline, metrics_registry):
+        """Sets up the state on_success and the order path work with, the
+        replay client shares it without a config file or REST
+        params:
+            account_cache: AccountCache -> account summary used for sizing
+            order_pipeline: OrderPipeline -> or anything with its
+                next_client_id() and submit()
+            metrics_registry: MetricsRegistry -> receives the order and account
+                summary metrics
+        """
+        self.position_book = PositionBook()
+        self.account_cache = account_cache
+        self.reconciling = None
+        self.order_pipeline = order_pipeline
+        self.order_states = OrderStateMachine()
+        # perf_counter_ns stamps of the current tick and of the last signal,
+        # carried over to the orders they lead to
+        self.latency = LatencyRecorder()
+        self.tick_received = None
+        self.tick_decoded = None
+        self.signal_at = None
+        metrics_registry.register("order_latency", LatencyCollector(self.latency))
+        metrics_registry.register("account_summary", account_cache)
+        self.feed_metrics = None
+        self.tick_recorder = None
+        self.orders_submitted = metrics_registry.counter(
+            "orders_submitted", "Orders handed to the order pipeline", ("instrument",)
+        )
+        self.orders_resolved = metrics_registry.counter(
+            "orders_resolved",
+            "Pipeline orders by their outcome",
+            ("instrument", "outcome"),
+        )
+
+    def use_tick_recorder(self, file_path):
+        """Records every streamed tick into the tick_archive directory of the
+        [oanda] section, no ticks are recorded without one
+        """
+        config = configparser.ConfigParser()
+        config.read(file_path)
+        if "oanda" not in config or "tick_archive" not in config["oanda"]:
+            return
+        self.tick_recorder = TickRecorder(config["oanda"]["tick_archive"]).start()
+        atexit.register(self.tick_recorder.stop)
+
     def on_success(
         self,
         time,
@@ -154,13 +483,50 @@ class StreamingClient(OANDAClient):
         atr=None,
         entry_point_days=None,
         exit_point_days=None,
+        timeframe_exit_low=None,
+        timeframe_exit_high=None,
     ):
-        """Monitor bid price to determine if price breakout happens"""
-        bid = "{:.5f}".format(bid)
-        bid = float(bid)
-        print(f"Bid price: {bid}\nPair: {pair}")
+        """Monitor bid price to determine if price breakout happens, and close
+        an open position of the pair once its exit criteria are met
+        """
+        bid = round(bid, 5)
+        if sampler.sample("tick"):
+            logger.log(
+                10,
+                "Bid price: %s Pair: %s",
+                bid,
+                pair,
+                extra={"category": "tick", "pair": pair, "bid": bid},
+            )
+
+        if self.order_states.busy(pair):
+            # an order of the pair is in flight, its outcome decides what is next
+            return
+
+        # only an open pair is closed, the book may know of a position the
+        # order states have not caught up with yet
+        units = self.position_book.units(pair)
+        if (
+            units
+            and timeframe_exit_low is not None
+            and self.order_states.state(pair) == OPEN
+        ):
+            try:
+                if self.check_exit(
+                    pair,
+                    units,
+                    bid,
+                    round(ask, 5),
+                    timeframe_exit_low,
+                    timeframe_exit_high,
+                    exit_point_days,
+                ):
+                    return
+            except ConnectionAbortedError as e:
+                logger.exception(str(e))
 
         if bid > timeframe_high:
+            self.signal_at = perf_counter_ns()
             try:
                 if self.check_if_position_exists(pair):
                     logger.log(
@@ -176,6 +542,7 @@ class StreamingClient(OANDAClient):
                 logger.exception(str(e))
 
         if bid < timeframe_low:
+            self.signal_at = perf_counter_ns()
             try:
                 if self.check_if_position_exists(pair):
                     logger.log(
@@ -184,53 +551,258 @@ class StreamingClient(OANDAClient):
                 else:
                     logger.log(
                         20,
-                        f"Placing short order on pairing: {pair} with volatility: {atr}",
+                        f"Placing short order on pairing: {pair} with volatility: "
+                        f"{atr}",
                     )
                     self.place_short_order(pair, atr, bid)
             except ConnectionAbortedError as e:
                 logger.exception(str(e))
 
+    def check_exit(
+        self,
+        pair,
+        units,
+        bid,
+        ask,
+        timeframe_exit_low,
+        timeframe_exit_high,
+        exit_point_days=None,
+    ):
+        """Closes the position of the pair when the live price meets the exit
+        criteria, a long once the bid is below timeframe_exit_low, the low of
+        the exit channel, and a short once the ask is above timeframe_exit_high
+        """
+        type_of_order = "long" if units > 0 else "short"
+        price = bid if type_of_order == "long" else ask
+        if not exit_criteria_met(
+            type_of_order, price, timeframe_exit_low, timeframe_exit_high
+        ):
+            return False
+
+        self.signal_at = perf_counter_ns()
+        level = timeframe_exit_low if type_of_order == "long" else timeframe_exit_high
+        self.submit_order(
+            pair,
+            -1 * units,
+            closing=True,
+            description=f"Position closed because exit criteria met at {price}.  "
+            f"For this {type_of_order} position of {units} {pair}, the "
+            f"{exit_point_days} day exit level is {level}.",
+        )
+        return True
+
     def place_long_order(self, pair, atr, bid):
         """Places long order when breakout happens"""
         stop_loss = round(2 * atr, 5)
-        print(f"STOP LOSS: {stop_loss}")
-        account_summary = self.get_account_summary()
+        logger.log(
+            20,
+            "Stop loss distance %s for %s",
+            stop_loss,
+            pair,
+            extra={"category": "order"},
+        )
+        account_summary = self.account_cache.get()
         position_size = determine_position_sizing(atr, account_summary, bid)
 
-        order_result = self.create_order(
-            instrument=pair,
-            units=position_size,
-            price=bid,
-            sl_distance=stop_loss,
-            ret=True,
+        return self.submit_order(
+            pair, position_size, "Order Placed!", price=bid, sl_distance=stop_loss
         )
 
-        logger.log(20, f"Order Placed!\nOrder Information: {order_result}")
-
     def place_short_order(self, pair, atr, bid):
         """Places short order when breakout happens"""
         stop_loss = round(2 * atr, 5)
-        print(f"STOP LOSS: {stop_loss}")
-        account_summary = self.get_account_summary()
+        logger.log(
+            20,
+            "Stop loss distance %s for %s",
+            stop_loss,
+            pair,
+            extra={"category": "order"},
+        )
+        account_summary = self.account_cache.get()
         position_size = determine_position_sizing(atr, account_summary, bid)
 
-        order_result = self.create_order(
-            instrument=pair,
-            units=-1 * position_size,
-            price=bid,
-            sl_distance=stop_loss,
-            ret=True,
+        return self.submit_order(
+            pair, -1 * position_size, "Order Placed!", price=bid, sl_distance=stop_loss
+        )
+
+    def submit_order(
+        self, pair, units, description="Order Placed!", closing=False, **kwargs
+    ):
+        """Hands an order to the order pipeline without waiting for it, the
+        pair is pending (or closing) and takes no other order until this one is
+        resolved.  The pair moves before the order is queued, an order the
+        order states do not allow is never placed.
+        params:
+            description: str -> logged with the outcome of the order
+            closing: bool -> the order closes the open position of the pair
+            kwargs -> create_order arguments
+        returns:
+            PendingOrder, None when the pipeline queue is full or the pair
+            takes no such order
+        """
+        signal_at, self.signal_at = self.signal_at, None
+        client_id = self.order_pipeline.next_client_id()
+        try:
+            if closing:
+                self.order_states.exit_submitted(pair, client_id)
+            else:
+                self.order_states.entry_submitted(pair, client_id)
+        except ValueError as e:
+            logger.log(30, f"Order of {units} {pair} not placed: {e}")
+            return None
+        try:
+            order = self.order_pipeline.submit(
+                pair, units, client_id=client_id, **kwargs
+            )
+        except asyncio.QueueFull:
+            self.order_states.order_resolved(
+                pair, client_id, None, self.position_book.units(pair)
+            )
+            logger.log(40, f"Order queue full, dropped {units} {pair}")
+            return None
+        except Exception:
+            # nothing was queued, the pair goes back to where it was
+            self.order_states.order_resolved(
+                pair, client_id, None, self.position_book.units(pair)
+            )
+            raise
+        self.orders_submitted.inc(pair)
+        if signal_at is not None:
+            order.tick_received = self.tick_received
+            order.tick_decoded = self.tick_decoded
+            order.signal_at = signal_at
+        order.add_done_callback(lambda order: self.order_done(order, description))
+        return order
+
+    def order_done(self, order, description):
+        """Applies the outcome of a pipeline order and records its latency"""
+        order_result = None
+        self.latency.record_order(order)
+        if order.future.cancelled():
+            outcome = "cancelled"
+        elif order.future.exception() is not None:
+            outcome = "failed"
+            logger.log(
+                40,
+                f"Order {order.client_id} on {order.instrument} failed: "
+                f"{order.future.exception()!r}",
+            )
+        else:
+            order_result = order.future.result()
+            outcome = order_outcome(order_result)
+            if self.position_book.apply_fill(order_result):
+                self.account_cache.invalidate()
+            logger.log(20, f"{description}\nOrder Information: {order_result}")
+        self.orders_resolved.inc(order.instrument, outcome)
+        self.order_states.order_resolved(
+            order.instrument,
+            order.client_id,
+            order_result,
+            self.position_book.units(order.instrument),
         )
 
-        logger.log(20, f"Order Placed!\nOrder Information: {order_result}")
+    def on_order_event(self, event):
+        """Transaction stream subscriber, moves the order state on fills and
+        cancels; subscribe it after the position book
+        """
+        if isinstance(event, FillEvent):
+            self.order_states.position_changed(
+                event.instrument,
+                self.position_book.units(event.instrument),
+                event.order_id,
+            )
+        elif isinstance(event, CancelEvent):
+            self.order_states.order_cancelled(event.order_id)
 
     def check_if_position_exists(self, pair):
-        """Check if an open position already exists"""
-        positions = get_open_positions(self)
-        for position in positions:
-            if position["instrument"] == pair:
-                return True
-        return False
+        """Check if an open position already exists, in the position book"""
+        if not self.position_book.synced:
+            self.reconcile_positions()
+        return self.position_book.has_position(pair)
+
+    def fetch_open_positions(self):
+        """Open positions and then the pending orders over REST, safe to call
+        off the event loop
+        returns:
+            (positions in their JSON form, lastTransactionID of the positions,
+            set of the ids of the pending orders)
+        """
+        try:
+            response = self.ctx.position.list_open(self.account_id)
+            body = json.loads(response.raw_body)
+            positions = body["positions"]
+            response = self.ctx.order.list_pending(self.account_id)
+            pending_orders = {
+                order["id"] for order in json.loads(response.raw_body)["orders"]
+            }
+        except Exception as e:
+            logger.log(40, f"Failed to list open positions: {e!r}")
+            raise ConnectionAbortedError(
+                "Failed to get open positions due to a connection error"
+            )
+        return positions, body["lastTransactionID"], pending_orders
+
+    def apply_positions(
+        self, positions, last_transaction_id, pending_orders=None
+    ) -> dict:
+        """Resets the position book to positions and aligns the order states
+        with it in the same step, call it on the event loop
+        params:
+            pending_orders: set -> ids of the pending orders requested after
+                the positions, the resting orders not among them expire
+        returns:
+            dict of the instruments the book had wrong, see PositionBook.reset
+        """
+        differences = self.position_book.reset(positions, last_transaction_id)
+        self.order_states.sync(
+            self.position_book.positions, pending_orders, last_transaction_id
+        )
+        return differences
+
+    def reconcile_positions(self) -> dict:
+        """Resets the position book and the order states to the open positions
+        reported over REST
+        returns:
+            dict of the instruments the book had wrong, see PositionBook.reset
+        """
+        return self.apply_positions(*self.fetch_open_positions())
+
+    def schedule_reconcile(self):
+        """Fetches the open positions on a worker thread once a reconciliation
+        is due, without blocking the event loop; the book and the order states
+        are reset on the loop once they arrived
+        """
+        synced_at = self.position_book.synced_at
+        if self.reconciling is not None and not self.reconciling.done():
+            return
+        if synced_at is not None and (
+            time.monotonic() - synced_at < self.reconcile_interval
+        ):
+            return
+        self.reconciling = asyncio.get_running_loop().run_in_executor(
+            None, self.fetch_open_positions
+        )
+        self.reconciling.add_done_callback(self._reconciled)
+
+    def _reconciled(self, future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.log(40, f"Position reconciliation failed: {future.exception()}")
+            return
+        self.apply_positions(*future.result())
+
+    async def get_price_snapshot(self, instrument):
+        """Gets the current prices of the instruments over REST
+        returns:
+            list of price messages in their JSON form
+        """
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(
+            None,
+            lambda: self.ctx.pricing.get(self.account_id, instruments=instrument),
+        )
+        return json.loads(response.raw_body).get("prices", [])
 
     async def stream_data(
         self,
@@ -244,50 +816,146 @@ class StreamingClient(OANDAClient):
         atr=None,
         entry_point_days=None,
         exit_point_days=None,
+        pair_dict=None,
+        on_heartbeat=None,
+        raw=True,
+        backfill=False,
+        threshold_table=None,
     ):
         """Starts a real-time data stream.
         Parameters
         ==========
         instrument: string
-            valid instrument name
+            valid instrument name, or a comma separated list of instrument
+            names to multiplex over a single connection
+        pair_dict: dict
+            per instrument thresholds as built by process_all_pairs.  When
+            given, every price is routed to the thresholds of its own
+            instrument instead of the single pair/timeframe_* arguments
+        threshold_table: ThresholdTable
+            replaces pair_dict, every price is routed to the thresholds of
+            the latest version published to the table
+        on_heartbeat: callable
+            called with every pricing heartbeat, roughly every 5 seconds
+        ret: boolean
+            whether to return the tick buffer once the stream stops
+        raw: boolean
+            decode the JSON lines of the stream directly instead of building
+            the v20 objects for every message
+        backfill: boolean
+            run a REST price snapshot through the same handlers before the
+            stream starts, used after a reconnect to catch up on the gap
+
+        Every price is written into self.tick_buffer, a TickRingBuffer over the
+        streamed instruments which is kept across reconnects.  self.latency
+        records how long every price took to decode and every order took from
+        its tick to the answer of OANDA.  Heartbeats also
+        reconcile the position book with REST every reconcile_interval seconds.
+        With pair_dict, every price of an instrument with an open position in
+        the book is also checked against its exit levels.
         """
         self.stream_instrument = instrument
         self.ticks = 0
-        response = self.ctx_stream.pricing.stream(
-            self.account_id, snapshot=True, instruments=instrument
+        instruments = instrument.split(",")
+        if self.tick_buffer is None or self.tick_buffer.instruments != instruments:
+            self.tick_buffer = TickRingBuffer(instruments, self.tick_buffer_capacity)
+            self.feed_metrics = registry.register("feed", FeedMetrics(instruments))
+        feed_metrics = self.feed_metrics
+        tick_recorder = self.tick_recorder
+        decoder = PriceDecoder(self.tick_buffer)
+        # exits are checked against the book on every tick, load it up front
+        self.schedule_reconcile()
+        reader = ThreadedStreamReader(
+            lambda: self.ctx_stream.pricing.stream(
+                self.account_id, snapshot=True, instruments=instrument
+            ),
+            parts=(lambda response: response.lines) if raw else None,
+            timed=True,
         )
-        msgs = []
-        for msg_type, msg in response.parts():
-            msgs.append(msg)
-            # print(msg_type, msg)
-            if msg_type == "pricing.ClientPrice":
-                self.ticks += 1
-                self.time = msg.time
-                if callback is not None:
-                    callback(
-                        msg.instrument,
-                        msg.time,
-                        float(msg.bids[0].dict()["price"]),
-                        float(msg.asks[0].dict()["price"]),
-                    )
+
+        async def decoded():
+            if backfill:
+                for message in await self.get_price_snapshot(instrument):
+                    self.tick_received = perf_counter_ns()
+                    yield decoder.decode_dict(message)
+            async for received, part in reader:
+                self.tick_received = received
+                if raw:
+                    yield decoder.decode_line(part)
                 else:
-                    self.on_success(
-                        msg.time,
-                        float(msg.bids[0].dict()["price"]),
-                        float(msg.asks[0].dict()["price"]),
-                        pair=pair,
-                        timeframe_high=timeframe_high,
-                        timeframe_low=timeframe_low,
-                        atr=atr,
-                        entry_point_days=entry_point_days,
-                        exit_point_days=exit_point_days,
+                    yield decoder.decode_message(*part)
+
+        try:
+            async for kind in decoded():
+                if kind == PRICE:
+                    self.tick_decoded = perf_counter_ns()
+                    self.latency.record_decode(
+                        decoder.instrument, self.tick_decoded - self.tick_received
                     )
-                if stop is not None:
-                    if self.ticks >= stop:
-                        if ret:
-                            return msgs
-                        break
-            if self.stop_stream:
-                if ret:
-                    return msgs
-                break
+                    if decoder.instrument_id is not None:
+                        feed_metrics.record(
+                            decoder.instrument_id, decoder.time_ns, self.tick_received
+                        )
+                        if tick_recorder is not None:
+                            tick_recorder.record(
+                                decoder.instrument,
+                                decoder.time_ns,
+                                decoder.bid,
+                                decoder.ask,
+                                decoder.bid_liquidity,
+                                decoder.ask_liquidity,
+                            )
+                    self.ticks += 1
+                    self.time = decoder.time
+                    if callback is not None:
+                        callback(
+                            decoder.instrument, decoder.time, decoder.bid, decoder.ask
+                        )
+                    elif threshold_table is not None or pair_dict is not None:
+                        if threshold_table is not None:
+                            # a newly published version applies from this tick on
+                            pair_dict = threshold_table.current()
+                        thresholds = pair_dict.get(decoder.instrument)
+                        if thresholds is not None:
+                            self.on_success(
+                                decoder.time,
+                                decoder.bid,
+                                decoder.ask,
+                                pair=decoder.instrument,
+                                timeframe_high=thresholds["timeframe_high"],
+                                timeframe_low=thresholds["timeframe_low"],
+                                atr=thresholds["atr"],
+                                entry_point_days=entry_point_days,
+                                exit_point_days=exit_point_days,
+                                timeframe_exit_low=thresholds["timeframe_exit_low"],
+                                timeframe_exit_high=thresholds["timeframe_exit_high"],
+                            )
+                    else:
+                        self.on_success(
+                            decoder.time,
+                            decoder.bid,
+                            decoder.ask,
+                            pair=pair,
+                            timeframe_high=timeframe_high,
+                            timeframe_low=timeframe_low,
+                            atr=atr,
+                            entry_point_days=entry_point_days,
+                            exit_point_days=exit_point_days,
+                        )
+                    if stop is not None:
+                        if self.ticks >= stop:
+                            if ret:
+                                return self.tick_buffer
+                            break
+                elif kind == HEARTBEAT:
+                    self.schedule_reconcile()
+                    if on_heartbeat is not None:
+                        on_heartbeat(decoder.heartbeat)
+                if self.stop_stream:
+                    if ret:
+                        return self.tick_buffer
+                    break
+                # let the other tasks of the event loop run between messages
+                await asyncio.sleep(0)
+        finally:
+            reader.close()
@@ -0,0 +1,89 @@
+"""Decodes pricing stream messages into plain numeric fields"""
+from automated_trader.commons.tick_buffer import parse_time_ns
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+# kinds of decoded messages
+OTHER = 0
+PRICE = 1
+HEARTBEAT = 2
+
+
+class PriceDecoder:
+    """Decodes pricing stream messages into the fields of the last price
+
+    decode_line parses the raw JSON lines of the stream and never builds the
+    v20 model objects, decode_message reads already parsed v20 objects.  Both
+    store the price in the tick buffer and leave it in instrument, time
+    (time_ns for the instruments of the buffer), bid, ask and the liquidity
+    of both, so the caller reads plain attributes instead of a new object.
+
+    params:
+        tick_buffer: TickRingBuffer -> receives every decoded price
+    """
+
+    def __init__(self, tick_buffer):
+        self.tick_buffer = tick_buffer
+        self.instrument_ids = tick_buffer.instrument_ids
+        self.instrument = None
+        self.instrument_id = None
+        self.time = None
+        self.time_ns = 0
+        self.bid = 0.0
+        self.ask = 0.0
+        self.bid_liquidity = 0.0
+        self.ask_liquidity = 0.0
+        self.heartbeat = None
+
+    def decode_line(self, line) -> int:
+        """Decodes one raw line of the pricing stream, returns its kind"""
+        if not line:
+            # keep-alive newline
+            return OTHER
+        return self.decode_dict(loads(line))
+
+    def decode_dict(self, message: dict) -> int:
+        """Decodes one pricing message in its JSON form, returns its kind"""
+        kind = message.get("type", "PRICE")
+        if kind == "PRICE":
+            self.instrument = message["instrument"]
+            self.time = message["time"]
+            bid = message["bids"][0]
+            ask = message["asks"][0]
+            self.bid = float(bid["price"])
+            self.ask = float(ask["price"])
+            self.bid_liquidity = float(bid.get("liquidity") or 0)
+            self.ask_liquidity = float(ask.get("liquidity") or 0)
+            self._store()
+            return PRICE
+        if kind == "HEARTBEAT":
+            self.heartbeat = message
+            return HEARTBEAT
+        return OTHER
+
+    def decode_message(self, msg_type, msg) -> int:
+        """Decodes one part of the pricing stream parsed by v20, returns its kind"""
+        if msg_type == "pricing.ClientPrice":
+            self.instrument = msg.instrument
+            self.time = msg.time
+            self.bid = float(msg.bids[0].price)
+            self.ask = float(msg.asks[0].price)
+            self.bid_liquidity = float(msg.bids[0].liquidity or 0)
+            self.ask_liquidity = float(msg.asks[0].liquidity or 0)
+            self._store()
+            return PRICE
+        if msg_type == "pricing.PricingHeartbeat":
+            self.heartbeat = msg
+            return HEARTBEAT
+        return OTHER
+
+    def _store(self):
+        self.instrument_id = self.instrument_ids.get(self.instrument)
+        if self.instrument_id is not None:
+            self.time_ns = parse_time_ns(self.time)
+            self.tick_buffer.append(
+                self.instrument_id, self.time_ns, self.bid, self.ask
+            )
@@ -0,0 +1,198 @@
+"""Submits orders off the event loop, with idempotent retries"""
+from automated_trader.commons.logger import logger
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import itertools
+import json
+import time
+import v20
+
+
+class PendingOrder:
+    """An order handed to the OrderPipeline
+
+    future resolves with the fill, create or reject transaction in its JSON
+    form, or with the exception of the last attempt.  Awaiting the order
+    awaits the future.  The *_at attributes are time.perf_counter_ns() stamps
+    of its way from the tick to the answer of OANDA, see LatencyRecorder; the
+    tick stamps are only set for orders placed on a signal.
+    """
+
+    def __init__(self, client_id, instrument, units, kwargs, future):
+        self.client_id = client_id
+        self.instrument = instrument
+        self.units = units
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+        self.tick_received = None
+        self.tick_decoded = None
+        self.signal_at = None
+        self.submitted_at = time.perf_counter_ns()
+        self.sent_at = None
+        self.acked_at = None
+
+    def __await__(self):
+        return self.future.__await__()
+
+    def add_done_callback(self, callback):
+        """Calls callback(order) once the order is resolved"""
+        self.future.add_done_callback(lambda _: callback(self))
+
+    def __repr__(self):
+        return f"PendingOrder({self.client_id}, {self.instrument}, {self.units})"
+
+
+class OrderPipeline:
+    """Bounded queue of orders sent by a pool of worker threads
+
+    submit() returns right away with a PendingOrder.  concurrency worker
+    coroutines take orders off the queue and run OANDAClient.create_order on
+    as many threads, so a slow round trip for one instrument does not hold up
+    the others.  Every order carries a client id in its clientExtensions.
+    When a request fails in transit the order may still have reached OANDA,
+    so before it is sent again it is looked up by "@" + client id and the
+    existing order is used if there is one.
+
+    params:
+        client: OANDAClient -> client the orders are placed with
+        concurrency: int -> orders in flight at the same time
+        maxsize: int -> queued orders before submit raises asyncio.QueueFull
+        retries: int -> attempts after the first one failed in transit
+        retry_delay: float -> seconds before the first retry, doubled after
+    """
+
+    # errors after which the order may or may not have reached OANDA
+    transient_errors = (v20.errors.V20ConnectionError, v20.errors.V20Timeout, OSError)
+
+    def __init__(self, client, concurrency=4, maxsize=64, retries=3, retry_delay=0.5):
+        self.client = client
+        self.concurrency = concurrency
+        self.maxsize = maxsize
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.prefix = f"at{int(time.time() * 1000):x}"
+        self.counter = itertools.count(1)
+        self.executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="orders"
+        )
+        self._loop = None
+        self._queue = None
+        self._workers = []
+
+    def next_client_id(self) -> str:
+        return f"{self.prefix}-{next(self.counter)}"
+
+    def _start(self):
+        # the queue and the workers belong to the event loop they run on
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue(self.maxsize)
+            self._workers = [
+                loop.create_task(self._work()) for _ in range(self.concurrency)
+            ]
+
+    def _order(self, instrument, units, client_id, kwargs) -> PendingOrder:
+        self._start()
+        return PendingOrder(
+            client_id or self.next_client_id(),
+            instrument,
+            units,
+            kwargs,
+            self._loop.create_future(),
+        )
+
+    def submit(self, instrument, units, client_id=None, **kwargs) -> PendingOrder:
+        """Queues an order without waiting, kwargs are passed on to create_order
+        returns:
+            PendingOrder, resolved once OANDA answered
+        """
+        order = self._order(instrument, units, client_id, kwargs)
+        self._queue.put_nowait(order)
+        return order
+
+    async def enqueue(self, instrument, units, client_id=None, **kwargs):
+        """Like submit, but waits for room in the queue instead of raising"""
+        order = self._order(instrument, units, client_id, kwargs)
+        await self._queue.put(order)
+        return order
+
+    async def join(self):
+        """Waits until every queued order was resolved"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def _work(self):
+        while True:
+            order = await self._queue.get()
+            try:
+                result = await self._loop.run_in_executor(
+                    self.executor, self.place, order
+                )
+                if not order.future.done():
+                    order.future.set_result(result)
+            except Exception as e:
+                if not order.future.done():
+                    order.future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def place(self, order: PendingOrder):
+        """Places an order, retrying requests that failed in transit"""
+        for attempt in range(self.retries + 1):
+            order.attempts = attempt + 1
+            try:
+                if attempt:
+                    existing = self.lookup(order.client_id)
+                    if existing is not None:
+                        order.acked_at = time.perf_counter_ns()
+                        return existing
+                self.client.rate_limiter.acquire()
+                order.sent_at = time.perf_counter_ns()
+                result = self.client.create_order(
+                    order.instrument,
+                    order.units,
+                    suppress=True,
+                    ret=True,
+                    client_id=order.client_id,
+                    **order.kwargs,
+                )
+                order.acked_at = time.perf_counter_ns()
+                return result
+            except self.transient_errors as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.retry_delay * 2**attempt
+                logger.log(
+                    30,
+                    f"Order {order.client_id} on {order.instrument} failed in "
+                    f"transit ({e!r}), retrying in {delay:.1f}s",
+                )
+                time.sleep(delay)
+
+    def lookup(self, client_id):
+        """Outcome of an order OANDA already knows by client id, in the shape
+        create_order returns it
+        returns:
+            the fill or cancel transaction of a filled or cancelled order, the
+            create transaction (LIMIT_ORDER, ...) while pending, None when
+            OANDA never got it
+        """
+        self.client.rate_limiter.acquire()
+        response = self.client.ctx.order.get(self.client.account_id, "@" + client_id)
+        if response.status == 404:
+            return None
+        order = json.loads(response.raw_body)["order"]
+        # the id of an order is the id of the transaction that created it, the
+        # order itself has the type LIMIT rather than LIMIT_ORDER
+        transaction_id = (
+            order.get("fillingTransactionID")
+            or order.get("cancellingTransactionID")
+            or order["id"]
+        )
+        self.client.rate_limiter.acquire()
+        response = self.client.ctx.transaction.get(
+            self.client.account_id, transaction_id
+        )
+        return json.loads(response.raw_body)["transaction"]
@@ -0,0 +1,202 @@
+"""Keeps the pricing stream alive across drops and stalls"""
+from automated_trader.commons.logger import logger
+from automated_trader.commons.metrics import MetricFamily, registry
+import asyncio
+import random
+import time
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Reconnect delay for the given attempt, with full jitter on the upper half"""
+    delay = min(maximum, base * 2**attempt)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class StreamMetrics:
+    """Connection health of a supervised stream, a metrics collector whose
+    metrics are prefixed with the name of the stream
+
+    params:
+        name: str -> eg. pricing_stream
+    """
+
+    def __init__(self, name="stream"):
+        self.name = name
+        self.connections = 0
+        self.reconnects = 0
+        self.stalls = 0
+        self.errors = 0
+        self.downtime = 0.0
+        self.down_since = None
+        self.last_error = None
+
+    def mark_down(self):
+        """Starts an outage unless one is already running"""
+        if self.down_since is None:
+            self.down_since = time.monotonic()
+
+    def mark_up(self):
+        """Ends the running outage, if any, once data flows again"""
+        if self.down_since is not None:
+            self.downtime += time.monotonic() - self.down_since
+            self.down_since = None
+            self.reconnects += 1
+
+    def total_downtime(self) -> float:
+        """Seconds without a working stream, including a running outage"""
+        if self.down_since is None:
+            return self.downtime
+        return self.downtime + time.monotonic() - self.down_since
+
+    def as_dict(self) -> dict:
+        return {
+            "connections": self.connections,
+            "reconnects": self.reconnects,
+            "stalls": self.stalls,
+            "errors": self.errors,
+            "downtime_seconds": round(self.total_downtime(), 3),
+            "down": self.down_since is not None,
+            "last_error": self.last_error,
+        }
+
+    def collect(self):
+        families = [
+            MetricFamily(f"{self.name}_{counter}", "counter", help).add(
+                getattr(self, counter), "_total"
+            )
+            for counter, help in (
+                ("connections", "Connections opened"),
+                ("reconnects", "Connections that delivered data again after an outage"),
+                ("stalls", "Connections dropped for silence"),
+                ("errors", "Connections lost to an error"),
+            )
+        ]
+        families.append(
+            MetricFamily(
+                f"{self.name}_downtime_seconds",
+                "counter",
+                "Seconds without a working stream, a running outage included",
+            ).add(self.total_downtime(), "_total")
+        )
+        families.append(
+            MetricFamily(
+                f"{self.name}_down", "gauge", "1 during an outage, 0 otherwise"
+            ).add(int(self.down_since is not None))
+        )
+        return families
+
+
+class StreamSupervisor:
+    """Runs StreamingClient.stream_data and reconnects whenever it drops or stalls
+
+    The stream counts as stalled when neither a price nor a heartbeat arrived
+    for stall_timeout seconds; OANDA sends a heartbeat every 5 seconds.  Every
+    reconnect waits a jittered exponential backoff and starts with a REST price
+    snapshot, so breakouts during the outage are still seen.
+
+    params:
+        client: StreamingClient -> client whose stream is supervised
+        stall_timeout: float -> seconds of silence before the stream is dropped
+        backoff_base: float -> first reconnect delay in seconds
+        backoff_max: float -> upper bound of the reconnect delay in seconds
+        check_interval: float -> seconds between two liveness checks
+    """
+
+    def __init__(
+        self,
+        client,
+        stall_timeout=15.0,
+        backoff_base=1.0,
+        backoff_max=60.0,
+        check_interval=1.0,
+    ):
+        self.client = client
+        self.stall_timeout = stall_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.check_interval = check_interval
+        self.metrics = registry.register(
+            "pricing_stream", StreamMetrics("pricing_stream")
+        )
+        self.last_seen = time.monotonic()
+
+    def backoff(self, attempt: int) -> float:
+        return backoff_delay(attempt, self.backoff_base, self.backoff_max)
+
+    async def run(self, instrument, on_heartbeat=None, **kwargs):
+        """Streams until client.stop_stream is set or the stop tick count is reached
+        params:
+            instrument: str -> instrument(s) as accepted by stream_data
+            on_heartbeat: callable -> forwarded to stream_data
+            kwargs -> any other stream_data argument
+        """
+
+        def heartbeat(msg):
+            self.alive()
+            if on_heartbeat is not None:
+                on_heartbeat(msg)
+
+        attempt = 0
+        backfill = False
+        while True:
+            self.metrics.connections += 1
+            stream = asyncio.ensure_future(
+                self.client.stream_data(
+                    instrument, on_heartbeat=heartbeat, backfill=backfill, **kwargs
+                )
+            )
+            stalled = await self.watch(stream)
+
+            if stalled:
+                self.metrics.stalls += 1
+                reason = f"no data for {self.stall_timeout}s"
+            elif stream.exception() is not None:
+                self.metrics.errors += 1
+                self.metrics.last_error = repr(stream.exception())
+                reason = self.metrics.last_error
+            elif self.client.stop_stream or kwargs.get("stop") is not None:
+                return stream.result()
+            else:
+                reason = "stream closed by server"
+
+            self.metrics.mark_down()
+            if self.client.ticks:
+                # the connection did deliver data, start over with short delays
+                attempt = 0
+            delay = self.backoff(attempt)
+            attempt += 1
+            logger.log(
+                30,
+                f"Pricing stream lost ({reason}), reconnecting in {delay:.1f}s. "
+                f"Stream metrics: {self.metrics.as_dict()}",
+            )
+            await asyncio.sleep(delay)
+            if self.client.stop_stream:
+                return None
+            backfill = True
+
+    def alive(self):
+        """Records that the stream delivered data"""
+        self.last_seen = time.monotonic()
+        self.metrics.mark_up()
+
+    async def watch(self, stream) -> bool:
+        """Waits for the stream to end, returns True when it was dropped as stalled"""
+        self.last_seen = time.monotonic()
+        ticks = 0
+        while not stream.done():
+            await asyncio.wait({stream}, timeout=self.check_interval)
+            # stream_data counts prices in client.ticks, watching the counter
+            # keeps the supervisor off the per tick path
+            if self.client.ticks != ticks:
+                ticks = self.client.ticks
+                if ticks:
+                    self.alive()
+            if (
+                not stream.done()
+                and time.monotonic() - self.last_seen > self.stall_timeout
+            ):
+                stream.cancel()
+                await asyncio.wait({stream})
+                return True
+        return False
@@ -0,0 +1,240 @@
+"""Consumes the transaction stream of the account as typed events"""
+from automated_trader.api_client.supervisor import StreamMetrics, backoff_delay
+from automated_trader.api_client.transport import ThreadedStreamReader
+from automated_trader.commons.logger import logger
+from automated_trader.commons.metrics import registry
+import asyncio
+import json
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+
+class TransactionEvent:
+    """A transaction of the account, the JSON form is kept in transaction"""
+
+    def __init__(self, transaction: dict):
+        self.transaction = transaction
+        self.id = int(transaction["id"])
+        self.type = transaction["type"]
+        self.time = transaction.get("time")
+        self.instrument = transaction.get("instrument")
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.transaction})"
+
+
+class FillEvent(TransactionEvent):
+    """An order was filled"""
+
+    def __init__(self, transaction: dict):
+        super().__init__(transaction)
+        self.order_id = transaction.get("orderID")
+        self.client_order_id = transaction.get("clientOrderID")
+        self.units = float(transaction["units"])
+        self.price = float(transaction["price"])
+        self.pl = float(transaction.get("pl", 0))
+        self.reason = transaction.get("reason")
+
+
+class StopLossFillEvent(FillEvent):
+    """A stop loss order was triggered and filled"""
+
+
+class CancelEvent(TransactionEvent):
+    """An order was cancelled"""
+
+    def __init__(self, transaction: dict):
+        super().__init__(transaction)
+        self.order_id = transaction.get("orderID")
+        self.client_order_id = transaction.get("clientOrderID")
+        self.reason = transaction.get("reason")
+
+
+class RejectEvent(TransactionEvent):
+    """An order request was rejected"""
+
+    def __init__(self, transaction: dict):
+        super().__init__(transaction)
+        self.reason = transaction.get("rejectReason")
+        client_extensions = transaction.get("clientExtensions") or {}
+        self.client_order_id = client_extensions.get("id")
+
+
+def parse_event(transaction: dict) -> TransactionEvent:
+    """Wraps a transaction in its JSON form in the matching event type"""
+    kind = transaction.get("type", "")
+    if kind == "ORDER_FILL":
+        if transaction.get("reason") == "STOP_LOSS_ORDER":
+            return StopLossFillEvent(transaction)
+        return FillEvent(transaction)
+    if kind == "ORDER_CANCEL":
+        return CancelEvent(transaction)
+    if kind.endswith("_REJECT"):
+        return RejectEvent(transaction)
+    return TransactionEvent(transaction)
+
+
+def log_event(event: TransactionEvent):
+    """Subscriber writing fills, cancels and rejects to the log"""
+    if isinstance(event, StopLossFillEvent):
+        logger.log(
+            20,
+            f"Stop loss filled on {event.instrument}: {event.units} units at "
+            f"{event.price}, pl {event.pl}",
+        )
+    elif isinstance(event, FillEvent):
+        logger.log(
+            20, f"Order filled on {event.instrument}: {event.units} at {event.price}"
+        )
+    elif isinstance(event, CancelEvent):
+        logger.log(20, f"Order {event.order_id} cancelled: {event.reason}")
+    elif isinstance(event, RejectEvent):
+        logger.log(30, f"Order rejected on {event.instrument}: {event.reason}")
+
+
+class TransactionStream:
+    """Publishes the transactions of the account to subscribers as events
+
+    Every transaction is handed to the subscribers exactly once and in id
+    order.  After a reconnect, and whenever a heartbeat reports a newer
+    transaction than the last one seen, the missed transactions are fetched
+    from the sinceid endpoint before the stream goes on.  The stream counts as
+    stalled without any message, heartbeats included, for stall_timeout
+    seconds; OANDA sends a heartbeat every 5 seconds.
+
+    params:
+        client: OANDAClient -> client whose account is streamed
+        last_id: int -> last transaction already handled, its successors are
+            fetched first.  When None the stream starts after the latest
+            transaction of the account.
+        stall_timeout: float -> seconds of silence before reconnecting
+        backoff_base: float -> first reconnect delay in seconds
+        backoff_max: float -> upper bound of the reconnect delay in seconds
+    """
+
+    def __init__(
+        self,
+        client,
+        last_id=None,
+        stall_timeout=15.0,
+        backoff_base=1.0,
+        backoff_max=60.0,
+    ):
+        self.client = client
+        self.last_id = last_id
+        self.stall_timeout = stall_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.subscribers = []
+        self.metrics = registry.register(
+            "transaction_stream", StreamMetrics("transaction_stream")
+        )
+
+    def subscribe(self, callback, event_type=TransactionEvent):
+        """Calls callback(event) for every event of event_type (or a subclass)"""
+        self.subscribers.append((callback, event_type))
+
+    def publish(self, transaction: dict):
+        """Hands a transaction to the subscribers unless it was seen already"""
+        transaction_id = int(transaction["id"])
+        if self.last_id is not None and transaction_id <= self.last_id:
+            return
+        self.last_id = transaction_id
+        event = parse_event(transaction)
+        for callback, event_type in self.subscribers:
+            if isinstance(event, event_type):
+                try:
+                    callback(event)
+                except Exception:
+                    logger.exception(f"Transaction subscriber failed on {event}")
+
+    def transactions_since(self, transaction_id) -> list:
+        """Transactions after transaction_id from the REST sinceid endpoint"""
+        self.client.rate_limiter.acquire()
+        response = self.client.ctx.transaction.since(
+            self.client.account_id, id=str(transaction_id)
+        )
+        body = json.loads(response.raw_body)
+        if response.status != 200:
+            raise ConnectionAbortedError(
+                f"Failed to get transactions since {transaction_id}: "
+                f"{body.get('errorMessage')}"
+            )
+        return body.get("transactions", [])
+
+    def current_id(self) -> int:
+        """Id of the latest transaction of the account"""
+        self.client.rate_limiter.acquire()
+        response = self.client.ctx.account.summary(self.client.account_id)
+        return int(json.loads(response.raw_body)["lastTransactionID"])
+
+    async def catch_up(self):
+        """Publishes the transactions missed since last_id"""
+        loop = asyncio.get_running_loop()
+        while True:
+            transactions = await loop.run_in_executor(
+                None, self.transactions_since, self.last_id
+            )
+            if not transactions:
+                return
+            for transaction in transactions:
+                self.publish(transaction)
+
+    async def run(self):
+        """Streams and publishes transactions until cancelled"""
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            self.metrics.connections += 1
+            reader = ThreadedStreamReader(
+                lambda: self.client.ctx_stream.transaction.stream(
+                    self.client.account_id
+                ),
+                parts=lambda response: response.lines,
+            )
+            try:
+                if self.last_id is None:
+                    self.last_id = await loop.run_in_executor(None, self.current_id)
+                reader.start()
+                await self.catch_up()
+                while True:
+                    line = await asyncio.wait_for(
+                        reader.__anext__(), self.stall_timeout
+                    )
+                    self.metrics.mark_up()
+                    attempt = 0
+                    if not line:
+                        continue
+                    message = loads(line)
+                    # heartbeats are {"type": "HEARTBEAT", "lastTransactionID"}
+                    # without an id of their own
+                    if message.get("type") != "HEARTBEAT" and "id" in message:
+                        self.publish(message)
+                        continue
+                    last_id = message.get("lastTransactionID")
+                    if last_id is not None and int(last_id) > self.last_id:
+                        await self.catch_up()
+            except StopAsyncIteration:
+                reason = "stream closed by server"
+            except asyncio.TimeoutError:
+                self.metrics.stalls += 1
+                reason = f"no data for {self.stall_timeout}s"
+            except Exception as e:
+                self.metrics.errors += 1
+                self.metrics.last_error = repr(e)
+                reason = self.metrics.last_error
+            finally:
+                reader.close()
+
+            self.metrics.mark_down()
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+            attempt += 1
+            logger.log(
+                30,
+                f"Transaction stream lost ({reason}), reconnecting in {delay:.1f}s. "
+                f"Stream metrics: {self.metrics.as_dict()}",
+            )
+            await asyncio.sleep(delay)
@@ -0,0 +1,141 @@
+"""Non-blocking transport for the v20 streaming endpoints"""
+from time import perf_counter_ns
+import asyncio
+import socket
+import threading
+
+_STREAM_END = object()
+_opened = threading.local()
+
+
+def keep_http_responses(ctx):
+    """Wraps a v20.Context, once, so every stream response it returns keeps
+    the requests response it reads from in http_response; the v20 response
+    alone offers no way to close the connection
+    """
+    session_request = ctx._session.request
+    if getattr(session_request, "keeps_http_responses", False):
+        return ctx
+    request = ctx.request
+
+    def remembered_session_request(*args, **kwargs):
+        # runs on the thread of the ctx.request call below
+        _opened.response = session_request(*args, **kwargs)
+        return _opened.response
+
+    def request_keeping_response(v20_request):
+        _opened.response = None
+        response = request(v20_request)
+        response.http_response = _opened.response
+        _opened.response = None
+        return response
+
+    remembered_session_request.keeps_http_responses = True
+    ctx._session.request = remembered_session_request
+    ctx.request = request_keeping_response
+    return ctx
+
+
+class ThreadedStreamReader:
+    """Iterates a blocking v20 stream on a dedicated reader thread.
+
+    The v20 bindings only offer a blocking generator for streaming responses.
+    The reader thread drains it and hands every part over to an asyncio queue,
+    so the consuming coroutine awaits new messages and the event loop stays
+    free for any other task in between.
+
+    params:
+        open_stream: callable -> opens the stream and returns the v20 response
+        parts: callable -> maps the v20 response to the iterable to drain,
+            defaults to response.parts()
+        timed: bool -> hand over (time.perf_counter_ns(), part) tuples, stamped
+            on the reader thread as the part comes off the connection
+
+    close() closes the HTTP response of the stream when its v20 context was
+    wrapped with keep_http_responses, which unblocks the reader thread and
+    gives the connection up, and waits for the thread to exit.
+    """
+
+    # seconds close() waits for the reader thread
+    join_timeout = 2.0
+
+    def __init__(self, open_stream, parts=None, timed=False):
+        self.open_stream = open_stream
+        self.parts = parts if parts is not None else (lambda response: response.parts())
+        self.timed = timed
+        self.closed = False
+        self._response = None
+        self._loop = None
+        self._queue = None
+        self._thread = None
+
+    def start(self):
+        """Starts the reader thread, must be called from within the event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._thread = threading.Thread(
+            target=self._read, name="stream-reader", daemon=True
+        )
+        self._thread.start()
+
+    def close(self):
+        """Stops handing over parts, closes the connection and waits for the
+        reader thread
+        """
+        self.closed = True
+        self._close_response()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(self.join_timeout)
+
+    def _close_response(self):
+        http_response = getattr(self._response, "http_response", None)
+        if http_response is None:
+            return
+        # a read blocked on the socket only returns once the socket is shut
+        # down, closing the response alone waits for that read
+        connection = getattr(http_response.raw, "_connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        http_response.close()
+
+    def _read(self):
+        try:
+            self._response = self.open_stream()
+            if self.closed:
+                # closed while the connection was being opened
+                return
+            for part in self.parts(self._response):
+                if self.closed:
+                    break
+                self._put((perf_counter_ns(), part) if self.timed else part)
+        except Exception as e:
+            if not self.closed:
+                self._put(e)
+        finally:
+            self._close_response()
+            self._put(_STREAM_END)
+
+    def _put(self, item):
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+        except RuntimeError:
+            # event loop already closed, nobody is listening anymore
+            self.closed = True
+
+    def __aiter__(self):
+        if self._thread is None:
+            self.start()
+        return self
+
+    async def __anext__(self):
+        item = await self._queue.get()
+        if item is _STREAM_END:
+            raise StopAsyncIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
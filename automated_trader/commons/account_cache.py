@@ -0,0 +1,128 @@
+"""Account summary kept in memory for the order path"""
+from automated_trader.commons.logger import logger
+from automated_trader.commons.metrics import MetricFamily
+import threading
+import time
+
+
+class AccountCache:
+    """Latest account summary, refreshed on a background thread
+
+    The refresher fetches the summary every ttl seconds and right away once
+    invalidate() is called, e.g. for every fill.  Readers never wait for the
+    network once a summary was loaded, they get the latest one together with
+    its staleness in the metrics.
+
+    params:
+        fetch: callable -> returns the account summary as a dict
+        ttl: float -> seconds a summary is considered fresh
+        summary: dict -> initial summary, fetched on first use when None
+    """
+
+    def __init__(self, fetch, ttl: float = 30.0, summary: dict = None):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.summary = summary
+        self.updated = time.monotonic() if summary is not None else None
+        self.invalidated = False
+        self.refreshes = 0
+        self.failures = 0
+        self.invalidations = 0
+        self.reads = 0
+        self.stale_reads = 0
+        self.last_error = None
+        self._thread = None
+
+    def start(self):
+        """Starts the background refresher"""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="account-cache", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.ttl)
+            self.wakeup.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.log(30, f"Account summary refresh failed: {e}")
+
+    def refresh(self) -> dict:
+        """Fetches the summary now"""
+        try:
+            summary = self.fetch()
+        except Exception as e:
+            with self.lock:
+                self.failures += 1
+                self.last_error = repr(e)
+            raise
+        with self.lock:
+            self.summary = summary
+            self.updated = time.monotonic()
+            self.invalidated = False
+            self.refreshes += 1
+        return summary
+
+    def invalidate(self):
+        """Marks the summary outdated and wakes the refresher"""
+        with self.lock:
+            self.invalidated = True
+            self.invalidations += 1
+        self.wakeup.set()
+
+    def on_fill(self, event):
+        """Transaction stream subscriber, a fill changes balance and margin"""
+        self.invalidate()
+
+    def age(self) -> float:
+        """Seconds since the summary was fetched, inf before the first one"""
+        if self.updated is None:
+            return float("inf")
+        return time.monotonic() - self.updated
+
+    @property
+    def stale(self) -> bool:
+        return self.invalidated or self.age() > self.ttl
+
+    def get(self) -> dict:
+        """Latest summary, only fetched here when none was loaded yet"""
+        if self.summary is None:
+            return self.refresh()
+        self.reads += 1
+        if self.stale:
+            self.stale_reads += 1
+        return self.summary
+
+    def collect(self):
+        """Staleness and refresh counters of the cache, for the metrics registry"""
+        families = [
+            MetricFamily(
+                "account_summary_age_seconds",
+                "gauge",
+                "Seconds since the account summary was fetched",
+            ).add(self.age()),
+            MetricFamily(
+                "account_summary_stale",
+                "gauge",
+                "1 while the account summary is outdated, 0 otherwise",
+            ).add(int(self.stale)),
+        ]
+        families.extend(
+            MetricFamily(f"account_summary_{name}", "counter", help).add(
+                getattr(self, counter), "_total"
+            )
+            for name, counter, help in (
+                ("refreshes", "refreshes", "Account summaries fetched"),
+                ("refresh_failures", "failures", "Account summary fetches failed"),
+                ("invalidations", "invalidations", "Account summaries outdated"),
+                ("reads", "reads", "Account summaries read by the order path"),
+                ("stale_reads", "stale_reads", "Outdated account summaries read"),
+            )
+        )
+        return families
@@ -0,0 +1,78 @@
+"""On-disk store of completed candles"""
+import os
+import threading
+
+import numpy as np
+
+CANDLE_DTYPE = np.dtype(
+    [
+        ("time", "i8"),
+        ("o", "f8"),
+        ("h", "f8"),
+        ("l", "f8"),
+        ("c", "f8"),
+        ("volume", "i8"),
+    ]
+)
+
+
+class CandleStore:
+    """Completed candles kept as one .npy file per (instrument, granularity, price)
+
+    Files hold CANDLE_DTYPE records sorted by time (epoch nanoseconds of the
+    candle start) and are memory-mapped on load.  Writes go to a temporary
+    file that replaces the old one, so readers never see a partial file.  A
+    file that is still mapped can not be replaced on Windows, code that
+    writes after reading uses read(), which keeps no map open.
+
+    params:
+        directory: str -> directory of the candle files, created when missing
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, instrument: str, granularity: str, price: str) -> str:
+        return os.path.join(self.directory, f"{instrument}-{granularity}-{price}.npy")
+
+    def load(self, instrument: str, granularity: str, price: str) -> np.ndarray:
+        """Stored candles of a series, empty when nothing is stored yet"""
+        path = self.path(instrument, granularity, price)
+        try:
+            return np.load(path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            # a missing or unreadable file is refetched from scratch
+            return np.empty(0, dtype=CANDLE_DTYPE)
+
+    def read(self, instrument: str, granularity: str, price: str) -> np.ndarray:
+        """Stored candles of a series copied into memory, the map is released"""
+        return np.array(self.load(instrument, granularity, price))
+
+    def last_time(self, instrument: str, granularity: str, price: str):
+        """Start time of the newest stored candle, None for an empty series"""
+        candles = self.load(instrument, granularity, price)
+        return int(candles["time"][-1]) if len(candles) else None
+
+    def save(self, instrument: str, granularity: str, price: str, candles):
+        """Replaces the stored candles of a series"""
+        path = self.path(instrument, granularity, price)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as file:
+            np.save(file, np.ascontiguousarray(candles, dtype=CANDLE_DTYPE))
+        os.replace(temporary, path)
+
+    def append(self, instrument: str, granularity: str, price: str, candles):
+        """Adds candles newer than the stored ones to a series
+        returns:
+            number of candles added
+        """
+        with self.lock:
+            stored = self.read(instrument, granularity, price)
+            if len(stored):
+                candles = candles[candles["time"] > stored["time"][-1]]
+            if not len(candles):
+                return 0
+            self.save(instrument, granularity, price, np.concatenate([stored, candles]))
+            return len(candles)
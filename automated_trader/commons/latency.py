@@ -0,0 +1,175 @@
+"""Latency histograms of the tick to order path"""
+import math
+
+# stages of the tick to order path, in nanoseconds
+#   decode: line received by the reader thread -> price decoded
+#   signal: price decoded -> entry or exit signal raised
+#   risk: signal -> order submitted, position check and sizing
+#   queue: submitted -> request sent, the order pipeline queue and rate limit
+#   ack: request sent -> OANDA answered
+#   tick_to_ack: line received -> OANDA answered
+STAGES = ("decode", "signal", "risk", "queue", "ack", "tick_to_ack")
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+class LogLinearHistogram:
+    """HDR style histogram of non-negative integers
+
+    Values below 2**precision are counted exactly.  Above, every power of two
+    is split into 2**(precision - 1) linear buckets, so any value is off by
+    less than 2**(1 - precision) of itself (under 1% for the default 7) while
+    the histogram stays a flat list of a few thousand counters.  Recording is
+    a bit_length, a shift and a list increment.
+
+    params:
+        precision: int -> bits of every value that are kept exactly
+        highest: int -> larger values are counted as this one
+    """
+
+    def __init__(self, precision: int = 7, highest: int = 60 * 10**9):
+        self.precision = precision
+        self.half = 1 << (precision - 1)
+        self.highest = highest
+        self.counts = [0] * (self.index(highest) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def index(self, value: int) -> int:
+        shift = value.bit_length() - self.precision
+        if shift <= 0:
+            return value
+        return shift * self.half + (value >> shift)
+
+    def value_at(self, index: int) -> int:
+        """Highest value counted in a bucket"""
+        if index < 2 * self.half:
+            return index
+        shift = (index >> (self.precision - 1)) - 1
+        return ((index - shift * self.half) << shift) + (1 << shift) - 1
+
+    def record(self, value: int):
+        if value < 0:
+            value = 0
+        elif value > self.highest:
+            value = self.highest
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def percentile(self, percentile: float) -> int:
+        """Value at or below which percentile percent of the values are"""
+        if not self.count:
+            return 0
+        rank = max(1, math.ceil(percentile / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.value_at(index), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def merge(self, other):
+        """Adds the counts of a histogram of the same precision"""
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def summary(self, percentiles=PERCENTILES) -> dict:
+        """count, min, mean, max and the percentiles, in the recorded unit"""
+        summary = {
+            "count": self.count,
+            "min": self.min or 0,
+            "mean": self.mean(),
+            "max": self.max,
+        }
+        for percentile in percentiles:
+            summary[f"p{percentile:g}"] = self.percentile(percentile)
+        return summary
+
+
+class LatencyRecorder:
+    """One LogLinearHistogram per instrument and stage of the order path
+
+    Every price records its decode stage, every order the others once it is
+    answered, from the timestamps (time.perf_counter_ns) on its PendingOrder.
+    """
+
+    def __init__(self, precision: int = 7):
+        self.precision = precision
+        self.histograms = {}
+        # decode histograms by instrument, recorded for every tick
+        self.decode = {}
+
+    def histogram(self, instrument, stage) -> LogLinearHistogram:
+        histogram = self.histograms.get((instrument, stage))
+        if histogram is None:
+            histogram = LogLinearHistogram(self.precision)
+            self.histograms[(instrument, stage)] = histogram
+            if stage == "decode":
+                self.decode[instrument] = histogram
+        return histogram
+
+    def record(self, instrument, stage, nanoseconds: int):
+        self.histogram(instrument, stage).record(nanoseconds)
+
+    def record_decode(self, instrument, nanoseconds: int):
+        histogram = self.decode.get(instrument)
+        if histogram is None:
+            histogram = self.histogram(instrument, "decode")
+        histogram.record(nanoseconds)
+
+    def record_order(self, order):
+        """Records the stages of an answered PendingOrder, skipping those
+        whose timestamps it does not have
+        """
+        stamps = (
+            order.tick_received,
+            order.tick_decoded,
+            order.signal_at,
+            order.submitted_at,
+            order.sent_at,
+            order.acked_at,
+        )
+        for stage, start, end in zip(STAGES[1:], stamps[1:], stamps[2:]):
+            if start is not None and end is not None:
+                self.record(order.instrument, stage, end - start)
+        if order.tick_received is not None and order.acked_at is not None:
+            self.record(
+                order.instrument, "tick_to_ack", order.acked_at - order.tick_received
+            )
+
+    def percentiles(self, percentiles=PERCENTILES) -> dict:
+        """instrument -> stage -> summary of the histogram, in microseconds"""
+        result = {}
+        for (instrument, stage), histogram in sorted(self.histograms.items()):
+            summary = histogram.summary(percentiles)
+            result.setdefault(instrument, {})[stage] = {
+                key: value if key == "count" else round(value / 1000, 3)
+                for key, value in summary.items()
+            }
+        return result
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
@@ -1,12 +1,122 @@
-"""Instantiates logger for the package"""
+"""Instantiates logger for the package
+
+Records are handed to a queue and written by a listener thread, so logging
+never waits on the disk or the console.  The file gets one JSON object per
+record with the category and any extra fields, the console gets warnings
+and errors.  Tick level call sites check sampler.sample(category) first and
+only log one in every few ticks.
+"""
+import atexit
 import logging
 import logging.handlers
+import queue
+import sys
+
+try:
+    from orjson import dumps
+except ImportError:
+    from json import dumps as _dumps
+
+    def dumps(value, default=None):
+        return _dumps(value, default=default).encode("utf-8")
+
+
+# attributes every LogRecord has, the others come from extra
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats a record as one line of JSON: time, level, category, message,
+    the fields passed in extra and the exception, if any
+    """
+
+    def format(self, record) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "category": getattr(record, "category", "general"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "category":
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return dumps(entry, default=str).decode("utf-8")
+
+
+class Sampler:
+    """Keeps one in every rate records of a category
+
+    params:
+        rates: dict -> category: rate, categories without a rate are all kept
+    """
+
+    def __init__(self, rates=None):
+        self.rates = dict(rates or {})
+        self.counts = {}
+
+    def sample(self, category) -> bool:
+        rate = self.rates.get(category)
+        if rate is None or rate <= 1:
+            return True
+        count = self.counts.get(category, 0) + 1
+        self.counts[category] = count
+        return count % rate == 1
+
+    def dropped(self, category) -> int:
+        """Records of the category that were not kept"""
+        count = self.counts.get(category, 0)
+        rate = self.rates.get(category) or 1
+        return count - (count + rate - 1) // rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is
+    full and leaves the formatting to the listener thread
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # the message is built by the listener, tracebacks can not wait
+        if record.exc_info:
+            return super().prepare(record)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
 
 logger = logging.getLogger("MyLogger")
 logger.setLevel(logging.DEBUG)
+logger.propagate = False
+
+# one in every 100 tick level records is kept
+sampler = Sampler({"tick": 100})
 
-handler = logging.handlers.TimedRotatingFileHandler(
+file_handler = logging.handlers.TimedRotatingFileHandler(
     "automated_trader.log", when="D", backupCount=5
 )
+file_handler.setFormatter(StructuredFormatter())
+console_handler = logging.StreamHandler(sys.stdout)
+console_handler.setLevel(logging.WARNING)
+console_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
 
+log_queue = queue.Queue(maxsize=100000)
+handler = NonBlockingQueueHandler(log_queue)
 logger.addHandler(handler)
+
+listener = logging.handlers.QueueListener(
+    log_queue, file_handler, console_handler, respect_handler_level=True
+)
+listener.start()
+# flushes what is still queued at exit
+atexit.register(listener.stop)
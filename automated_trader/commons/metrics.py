@@ -0,0 +1,361 @@
+"""Metrics registry and its OpenMetrics HTTP endpoint"""
+from automated_trader.commons.latency import LogLinearHistogram
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import numpy as np
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PREFIX = "automated_trader_"
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def format_value(value) -> str:
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricFamily:
+    """One metric of the exposition, its type, help and samples
+
+    params:
+        name: str -> metric name without the package prefix
+        kind: str -> counter, gauge or summary
+        help: str -> description
+    """
+
+    def __init__(self, name, kind, help):
+        self.name = PREFIX + name
+        self.kind = kind
+        self.help = help
+        self.samples = []
+
+    def add(self, value, suffix="", **labels):
+        """Adds a sample, suffix is eg. _total, _sum or _count"""
+        self.samples.append((self.name + suffix, labels, value))
+        return self
+
+    def render(self) -> str:
+        lines = [f"# TYPE {self.name} {self.kind}", f"# HELP {self.name} {self.help}"]
+        for name, labels, value in self.samples:
+            lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """Counter per combination of label values, for the paths off the tick
+
+    params:
+        name: str -> metric name without prefix and _total
+        help: str -> description
+        labels: tuple -> label names
+    """
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def collect(self):
+        family = MetricFamily(self.name, "counter", self.help)
+        with self.lock:
+            values = sorted(self.values.items())
+        for label_values, value in values:
+            family.add(value, "_total", **dict(zip(self.labels, label_values)))
+        return [family]
+
+
+class Summary:
+    """Observations per combination of label values, exported as their sum,
+    count and the QUANTILES of a LogLinearHistogram
+
+    params:
+        name: str -> metric name without prefix, in seconds
+        help: str -> description
+        labels: tuple -> label names
+    """
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.last = {}
+
+    def observe(self, seconds: float, *label_values):
+        with self.lock:
+            histogram = self.histograms.get(label_values)
+            if histogram is None:
+                histogram = LogLinearHistogram()
+                self.histograms[label_values] = histogram
+            histogram.record(int(seconds * 1e9))
+            self.last[label_values] = seconds
+
+    def collect(self):
+        family = MetricFamily(self.name, "summary", self.help)
+        last = MetricFamily(
+            self.name.replace("_seconds", "_last_seconds"),
+            "gauge",
+            f"Last observation of {self.name}",
+        )
+        with self.lock:
+            for label_values, histogram in sorted(self.histograms.items()):
+                labels = dict(zip(self.labels, label_values))
+                for quantile in QUANTILES:
+                    family.add(
+                        histogram.percentile(quantile * 100) / 1e9,
+                        quantile=quantile,
+                        **labels,
+                    )
+                family.add(histogram.total / 1e9, "_sum", **labels)
+                family.add(histogram.count, "_count", **labels)
+                last.add(self.last[label_values], **labels)
+        return [family, last]
+
+
+class FeedMetrics:
+    """Per tick counters of a pricing stream in numpy arrays indexed by the
+    instrument id of the TickRingBuffer
+
+    record() only writes into the preallocated arrays, it takes no lock and
+    keeps no new object.  The scrape thread copies the arrays, a tick counted
+    while it copies shows up in the next scrape.
+
+    params:
+        instruments: list -> instrument names, their index is the instrument id
+    """
+
+    def __init__(self, instruments):
+        self.instruments = list(instruments)
+        size = len(self.instruments)
+        self.ticks = np.zeros(size, dtype=np.int64)
+        self.lag_sum = np.zeros(size, dtype=np.int64)
+        self.lag_last = np.zeros(size, dtype=np.int64)
+        # ticks are stamped with perf_counter_ns, this turns them to epoch ns
+        self.clock_offset = time.time_ns() - time.perf_counter_ns()
+        self.scraped_at = time.monotonic()
+        self.scraped_ticks = self.ticks.copy()
+        self.scrape_lock = threading.Lock()
+
+    def record(self, instrument_id: int, exchange_ns: int, received_ns: int):
+        """Counts a price and its stream lag
+        params:
+            exchange_ns: int -> epoch nanoseconds the price carries
+            received_ns: int -> time.perf_counter_ns() it was received at
+        """
+        lag = received_ns + self.clock_offset - exchange_ns
+        self.ticks[instrument_id] += 1
+        self.lag_sum[instrument_id] += lag
+        self.lag_last[instrument_id] = lag
+
+    def collect(self):
+        ticks = self.ticks.copy()
+        lag_sum = self.lag_sum.copy()
+        lag_last = self.lag_last.copy()
+        with self.scrape_lock:
+            now = time.monotonic()
+            elapsed = now - self.scraped_at
+            rates = (ticks - self.scraped_ticks) / elapsed if elapsed else ticks * 0.0
+            self.scraped_at, self.scraped_ticks = now, ticks
+            # the wall clock may have been stepped since the last scrape
+            self.clock_offset = time.time_ns() - time.perf_counter_ns()
+
+        counter = MetricFamily("ticks", "counter", "Prices received")
+        rate = MetricFamily(
+            "tick_rate", "gauge", "Prices received per second since the last scrape"
+        )
+        lag = MetricFamily(
+            "stream_lag_seconds",
+            "summary",
+            "Receive time minus the exchange time of the prices",
+        )
+        last = MetricFamily(
+            "stream_lag_last_seconds", "gauge", "Stream lag of the last price"
+        )
+        for i, instrument in enumerate(self.instruments):
+            counter.add(ticks[i], "_total", instrument=instrument)
+            rate.add(rates[i], instrument=instrument)
+            lag.add(lag_sum[i] / 1e9, "_sum", instrument=instrument)
+            lag.add(ticks[i], "_count", instrument=instrument)
+            last.add(lag_last[i] / 1e9, instrument=instrument)
+        return [counter, rate, lag, last]
+
+
+class MetricsRegistry:
+    """Named collectors whose metrics make up the exposition
+
+    A collector is any object with a collect() method returning
+    MetricFamily objects.  Registering under a taken name replaces the
+    collector, eg. the FeedMetrics of a stream over other instruments.
+    """
+
+    def __init__(self):
+        self.collectors = {}
+
+    def register(self, name, collector):
+        self.collectors[name] = collector
+        return collector
+
+    def unregister(self, name):
+        self.collectors.pop(name, None)
+
+    def counter(self, name, help, labels=()) -> Counter:
+        """The counter registered under name, registered first if there is none"""
+        collector = self.collectors.get(name)
+        if not isinstance(collector, Counter):
+            collector = self.register(name, Counter(name, help, labels))
+        return collector
+
+    def summary(self, name, help, labels=()) -> Summary:
+        """The summary registered under name, registered first if there is none"""
+        collector = self.collectors.get(name)
+        if not isinstance(collector, Summary):
+            collector = self.register(name, Summary(name, help, labels))
+        return collector
+
+    def collect(self) -> list:
+        families = []
+        for collector in list(self.collectors.values()):
+            families.extend(collector.collect())
+        return families
+
+    def render(self) -> str:
+        """The metrics in the OpenMetrics text format"""
+        return "".join(family.render() + "\n" for family in self.collect()) + "# EOF\n"
+
+
+class RestMetrics:
+    """Times the REST requests of v20 contexts per endpoint and counts their
+    errors, HTTP statuses of 400 and above included.  Streaming requests only
+    count their errors, their duration is the whole stream.
+
+    params:
+        registry: MetricsRegistry -> registry the metrics are added to
+    """
+
+    def __init__(self, registry):
+        self.duration = registry.summary(
+            "rest_request_duration_seconds",
+            "Duration of the REST requests to OANDA",
+            ("endpoint",),
+        )
+        self.errors = registry.counter(
+            "rest_errors", "Failed REST requests to OANDA", ("endpoint", "error")
+        )
+
+    def instrument(self, ctx):
+        """Wraps the request method of a v20.Context, once"""
+        request = ctx.request
+        if getattr(request, "rest_metrics", None) is self:
+            return ctx
+
+        def timed_request(v20_request):
+            endpoint = f"{v20_request.method} {v20_request.base_path}"
+            start = time.perf_counter()
+            try:
+                response = request(v20_request)
+            except Exception as e:
+                self.errors.inc(endpoint, type(e).__name__)
+                raise
+            if not v20_request.stream:
+                self.duration.observe(time.perf_counter() - start, endpoint)
+            if response.status >= 400:
+                self.errors.inc(endpoint, str(response.status))
+            return response
+
+        timed_request.rest_metrics = self
+        ctx.request = timed_request
+        return ctx
+
+
+class LatencyCollector:
+    """Exports a LatencyRecorder as a summary per instrument and stage"""
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def collect(self):
+        family = MetricFamily(
+            "order_latency_seconds",
+            "summary",
+            "Stages of the way from a tick to the answer to its order",
+        )
+        for (instrument, stage), histogram in sorted(
+            list(self.recorder.histograms.items())
+        ):
+            labels = dict(instrument=instrument, stage=stage)
+            for quantile in QUANTILES:
+                family.add(
+                    histogram.percentile(quantile * 100) / 1e9,
+                    quantile=quantile,
+                    **labels,
+                )
+            family.add(histogram.total / 1e9, "_sum", **labels)
+            family.add(histogram.count, "_count", **labels)
+        return [family]
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        payload = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Serves the registry at /metrics on a background thread
+
+    params:
+        registry: MetricsRegistry -> registry to expose
+        address: tuple -> (host, port) to bind, port 0 picks a free one
+    """
+
+    daemon_threads = True
+
+    def __init__(self, registry, address=("127.0.0.1", 0)):
+        super().__init__(address, MetricsRequestHandler)
+        self.registry = registry
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="metrics", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+# the registry of the process, like the logger
+registry = MetricsRegistry()
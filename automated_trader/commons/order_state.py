@@ -0,0 +1,137 @@
+"""Order and position lifecycle of every instrument"""
+from automated_trader.commons.logger import logger
+
+IDLE = "idle"
+PENDING = "pending"
+OPEN = "open"
+CLOSING = "closing"
+FLAT = "flat"
+
+
+class OrderStateMachine:
+    """Tracks every instrument through idle -> pending -> open -> closing -> flat
+
+    An entry order moves an instrument from idle or flat to pending and an
+    exit order from open to closing.  Fills move it to open or flat depending
+    on the position left, rejects, cancels and failures move it back to where
+    the order started.  A limit order that is accepted but not filled yet
+    keeps the instrument pending until its fill or cancel arrives on the
+    transaction stream, or until the pending orders reported over REST no
+    longer have it.  A cancel can arrive before the response of its order,
+    so the last cancels_kept cancelled order ids are remembered.  Only idle
+    and flat instruments take entries and only open ones exits, so ticks
+    arriving while an order is in flight stop here.
+    """
+
+    # cancelled order ids remembered for responses that arrive after the cancel
+    cancels_kept = 1000
+
+    def __init__(self):
+        self.states = {}
+        # instrument -> client id of the order in flight
+        self.in_flight = {}
+        # order id of an accepted, unfilled order -> instrument
+        self.resting = {}
+        # order ids cancelled before they were seen resting, oldest first
+        self.cancelled = {}
+        self.transitions = 0
+
+    def state(self, instrument) -> str:
+        return self.states.get(instrument, IDLE)
+
+    def busy(self, instrument) -> bool:
+        """True while an order of the instrument awaits its outcome"""
+        return self.states.get(instrument, IDLE) in (PENDING, CLOSING)
+
+    def _set(self, instrument, state):
+        previous = self.states.get(instrument, IDLE)
+        if previous != state:
+            self.states[instrument] = state
+            self.transitions += 1
+            logger.log(10, f"{instrument}: {previous} -> {state}")
+
+    def entry_submitted(self, instrument, client_id):
+        if self.state(instrument) not in (IDLE, FLAT):
+            raise ValueError(f"{instrument} is {self.state(instrument)}, no entry")
+        self.in_flight[instrument] = client_id
+        self._set(instrument, PENDING)
+
+    def exit_submitted(self, instrument, client_id):
+        if self.state(instrument) != OPEN:
+            raise ValueError(f"{instrument} is {self.state(instrument)}, no exit")
+        self.in_flight[instrument] = client_id
+        self._set(instrument, CLOSING)
+
+    def order_resolved(self, instrument, client_id, result, units: float):
+        """Applies the outcome of an order
+        params:
+            result: dict -> fill, create, cancel or reject transaction, None on
+                failure
+            units: float -> position of the instrument after the outcome
+        """
+        if self.in_flight.get(instrument) != client_id:
+            # outcome of an order superseded by a later one
+            return
+        del self.in_flight[instrument]
+        kind = (result or {}).get("type", "")
+        if kind == "ORDER_FILL":
+            self.position_changed(instrument, units)
+            return
+        if kind.endswith("_ORDER") and "id" in result:
+            if result["id"] not in self.cancelled:
+                # accepted but not filled, waits for its fill or cancel
+                self.resting[result["id"]] = instrument
+                return
+            # its cancel came in on the transaction stream before the response
+            del self.cancelled[result["id"]]
+        self._set(instrument, OPEN if self.state(instrument) == CLOSING else FLAT)
+
+    def position_changed(self, instrument, units: float, order_id=None):
+        """A fill left the instrument with units"""
+        self.resting.pop(order_id, None)
+        if instrument not in self.in_flight:
+            self._set(instrument, OPEN if units else FLAT)
+        elif self.state(instrument) == PENDING and units:
+            self._set(instrument, OPEN)
+
+    def order_cancelled(self, order_id):
+        """An order was cancelled, a resting one or one whose response has not
+        arrived yet
+        """
+        if order_id is None:
+            return
+        instrument = self.resting.pop(order_id, None)
+        if instrument is None:
+            self.cancelled[order_id] = None
+            while len(self.cancelled) > self.cancels_kept:
+                del self.cancelled[next(iter(self.cancelled))]
+            return
+        if instrument not in self.in_flight:
+            if self.state(instrument) == PENDING:
+                self._set(instrument, FLAT)
+            elif self.state(instrument) == CLOSING:
+                self._set(instrument, OPEN)
+
+    def sync(self, positions: dict, pending_orders=None, last_transaction_id=None):
+        """Aligns instruments without an order in flight or resting with the
+        open positions reported over REST.  Resting orders up to
+        last_transaction_id that are not among pending_orders were filled or
+        cancelled without the transaction stream telling, they stop waiting.
+        params:
+            positions: dict -> instrument: net units, as in the PositionBook
+            pending_orders: set -> ids of the pending orders, requested after
+                the positions; None keeps every resting order
+            last_transaction_id: str -> lastTransactionID of the positions
+        """
+        if pending_orders is not None:
+            synced_id = int(last_transaction_id)
+            for order_id, instrument in list(self.resting.items()):
+                if order_id not in pending_orders and int(order_id) <= synced_id:
+                    logger.log(
+                        30, f"Order {order_id} of {instrument} is no longer pending"
+                    )
+                    del self.resting[order_id]
+        waiting = set(self.in_flight) | set(self.resting.values())
+        for instrument in set(self.states) | set(positions):
+            if instrument not in waiting:
+                self._set(instrument, OPEN if positions.get(instrument) else FLAT)
@@ -0,0 +1,110 @@
+"""In-memory view of the open positions of the account"""
+from automated_trader.commons.logger import logger
+import threading
+import time
+
+
+class PositionBook:
+    """Net open units per instrument
+
+    Fills are applied as they are seen, from order responses or the
+    transaction stream, and reset() replaces the whole book with the open
+    positions reported over REST.  Every fill carries its transaction id, so
+    fills already contained in the last reset or seen before are skipped and
+    each one is counted exactly once whatever path it arrived on.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.positions = {}
+        # last transaction id contained in the REST positions, None until reset
+        self.synced_id = None
+        self.synced_at = None
+        # transaction id: fill, of the fills after synced_id
+        self.applied = {}
+
+    @property
+    def synced(self) -> bool:
+        return self.synced_id is not None
+
+    def has_position(self, instrument: str) -> bool:
+        return instrument in self.positions
+
+    def units(self, instrument: str) -> float:
+        """Net units of an instrument, positive long and negative short"""
+        return self.positions.get(instrument, 0.0)
+
+    def apply_fill(self, fill: dict) -> bool:
+        """Applies an ORDER_FILL transaction in its JSON form
+        returns:
+            True when the fill changed the book, False when it was known already
+        """
+        if fill is None or fill.get("type") != "ORDER_FILL":
+            return False
+        transaction_id = int(fill["id"])
+        with self.lock:
+            if self.synced_id is not None and transaction_id <= self.synced_id:
+                return False
+            if transaction_id in self.applied:
+                return False
+            self.applied[transaction_id] = fill
+            self._add(self.positions, fill)
+            return True
+
+    @staticmethod
+    def _add(positions: dict, fill: dict):
+        instrument = fill["instrument"]
+        units = positions.get(instrument, 0.0) + float(fill["units"])
+        if units == 0:
+            positions.pop(instrument, None)
+        else:
+            positions[instrument] = units
+
+    def on_fill(self, event):
+        """Transaction stream subscriber, applies a FillEvent"""
+        self.apply_fill(event.transaction)
+
+    def reset(self, positions: list, last_transaction_id) -> dict:
+        """Replaces the book with the open positions of the REST API
+        params:
+            positions: list -> positions in their JSON form
+            last_transaction_id: str -> lastTransactionID of the same response
+        returns:
+            dict: instrument -> (units in the book, units after the reset) of
+            every instrument the two disagreed on, fills newer than
+            last_transaction_id are part of both
+        """
+        reported = {}
+        for position in positions:
+            units = float(position["long"]["units"]) + float(position["short"]["units"])
+            if units != 0:
+                reported[position["instrument"]] = units
+        synced_id = int(last_transaction_id)
+        with self.lock:
+            if self.synced_id is not None and synced_id < self.synced_id:
+                # an older snapshot than the one the book is based on
+                return {}
+            # fills after the snapshot are not part of it yet
+            self.applied = {
+                i: fill for i, fill in self.applied.items() if i > synced_id
+            }
+            for transaction_id in sorted(self.applied):
+                self._add(reported, self.applied[transaction_id])
+            differences = {
+                instrument: (self.positions.get(instrument, 0.0), units)
+                for instrument, units in reported.items()
+                if self.positions.get(instrument, 0.0) != units
+            }
+            differences.update(
+                {
+                    instrument: (units, 0.0)
+                    for instrument, units in self.positions.items()
+                    if instrument not in reported
+                }
+            )
+            if self.synced and differences:
+                logger.log(30, f"Position book corrected by REST: {differences}")
+            self.positions = reported
+            self.synced_id = synced_id
+            self.synced_at = time.monotonic()
+            return differences
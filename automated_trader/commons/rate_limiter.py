@@ -0,0 +1,51 @@
+"""Token bucket shared by everything that calls the OANDA REST API"""
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter
+
+    Tokens refill continuously at rate per second up to capacity, every request
+    takes one.  capacity is the largest burst that goes out without waiting.
+
+    params:
+        rate: float -> tokens added per second
+        capacity: float -> most tokens the bucket holds
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Takes tokens if they are available right now"""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Blocks until tokens are available and takes them
+        returns:
+            seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill(time.monotonic())
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
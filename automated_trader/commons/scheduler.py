@@ -0,0 +1,111 @@
+"""Runs jobs once per trading day on a background thread"""
+from automated_trader.commons.logger import logger
+from datetime import datetime, timedelta
+from pytz import timezone, utc
+import datetime as dt
+import threading
+
+# OANDA's daily candles close at 17:00 New York time, Monday to Friday
+NEW_YORK = "America/New_York"
+NEW_YORK_CLOSE = dt.time(17, 0, 0)
+TRADING_DAYS = (0, 1, 2, 3, 4)
+
+
+class DailyJob:
+    """A job run at a wall clock time of a time zone, at most once per day"""
+
+    def __init__(self, name, func, at, weekdays, tz):
+        self.name = name
+        self.func = func
+        self.at = at
+        self.weekdays = tuple(weekdays)
+        self.tz = tz
+        self.last_day = None
+        self.next_at = None
+        self.runs = 0
+        self.failures = 0
+
+    def next_run(self, now: datetime) -> datetime:
+        """First run time after now, the local date decides the weekday and
+        localizing it in the zone takes care of daylight saving
+        """
+        local_now = now.astimezone(self.tz)
+        for offset in range(8):
+            day = local_now.date() + timedelta(days=offset)
+            if day.weekday() not in self.weekdays or day == self.last_day:
+                continue
+            run_at = self.tz.localize(datetime.combine(day, self.at))
+            if run_at > local_now:
+                return run_at
+        return None
+
+    def run(self, day):
+        self.last_day = day
+        self.runs += 1
+        try:
+            self.func()
+        except Exception:
+            self.failures += 1
+            logger.exception(f"Scheduled job {self.name} failed")
+
+
+class DailyScheduler:
+    """Runs registered jobs once per trading day on a daemon thread
+
+    Each job runs at its local time in the scheduler's time zone, by default
+    the 17:00 New York close, on the given weekdays.  It runs on the scheduler
+    thread, so a slow job never holds up the caller, and every job runs at
+    most once per local day however the clock moves.
+
+    params:
+        tz: str -> time zone of the job times
+        max_sleep: float -> longest wait in seconds before the next run times
+            are recomputed, guards against clock changes and suspends
+    """
+
+    def __init__(self, tz: str = NEW_YORK, max_sleep: float = 60.0):
+        self.tz = timezone(tz)
+        self.max_sleep = max_sleep
+        self.jobs = []
+        self.stopped = threading.Event()
+        self._thread = None
+
+    def add_job(self, name, func, at=NEW_YORK_CLOSE, weekdays=TRADING_DAYS):
+        """Registers func() to run at the local time at on the weekdays
+        (0 is Monday), returns the DailyJob
+        """
+        job = DailyJob(name, func, at, weekdays, self.tz)
+        job.next_at = job.next_run(datetime.now(utc))
+        self.jobs.append(job)
+        logger.log(20, f"Scheduled {name} for {job.next_at}")
+        return job
+
+    def run_pending(self, now: datetime = None) -> float:
+        """Runs the jobs that are due
+        returns:
+            seconds until the next job is due
+        """
+        now = now or datetime.now(utc)
+        wait = self.max_sleep
+        for job in self.jobs:
+            if job.next_at is not None and job.next_at <= now:
+                job.run(job.next_at.date())
+                job.next_at = job.next_run(max(now, job.next_at))
+            if job.next_at is not None:
+                wait = min(wait, (job.next_at - now).total_seconds())
+        return max(wait, 0.0)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="daily-scheduler", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.stopped.wait(self.run_pending())
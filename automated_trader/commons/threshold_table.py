@@ -0,0 +1,147 @@
+"""Versioned turtle thresholds in shared memory"""
+from multiprocessing import shared_memory
+import weakref
+
+import numpy as np
+
+FIELDS = (
+    "timeframe_high",
+    "timeframe_low",
+    "timeframe_exit_low",
+    "timeframe_exit_high",
+    "atr",
+)
+# sequence, number of instruments
+HEADER = 2
+NAME_DTYPE = np.dtype("S32")
+
+
+def _release(memory: shared_memory.SharedMemory, owner: bool):
+    try:
+        memory.close()
+    except BufferError:
+        # numpy views still point into the segment, the process exit frees it
+        pass
+    if owner:
+        memory.unlink()
+
+
+class ThresholdTable:
+    """Thresholds of every instrument that can be replaced while being read
+
+    The table lives in a shared memory segment, so other processes can attach
+    to it by name.  It holds two buffers of (instrument x field) thresholds and
+    a sequence number.  publish() fills the inactive buffer and bumps the
+    sequence twice, once before and once after writing; the sequence // 2 is
+    the version and version % 2 the active buffer.  A reader copies the
+    active buffer and checks that the sequence did not move far enough for the
+    writer to have started on that buffer again, otherwise it retries.  So
+    readers never block the writer and never see a half written table.
+    There is a single writer, the process that created the table.
+
+    params:
+        memory: SharedMemory -> segment laid out by create()
+        owner: bool -> unlinks the segment once the table is collected
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool = False):
+        self.memory = memory
+        self.header = np.ndarray((HEADER,), dtype=np.int64, buffer=memory.buf)
+        count = int(self.header[1])
+        names = np.ndarray(
+            (count,), dtype=NAME_DTYPE, buffer=memory.buf, offset=HEADER * 8
+        )
+        self.instruments = [name.decode("utf-8") for name in names]
+        self.instrument_ids = {name: i for i, name in enumerate(self.instruments)}
+        self.buffers = np.ndarray(
+            (2, count, len(FIELDS)),
+            dtype=np.float64,
+            buffer=memory.buf,
+            offset=HEADER * 8 + names.nbytes,
+        )
+        self._cached_sequence = None
+        self._cached = None
+        self._finalizer = weakref.finalize(self, _release, memory, owner)
+
+    @classmethod
+    def create(cls, instruments, name: str = None):
+        """Creates a table for a fixed list of instruments, all thresholds nan"""
+        instruments = list(instruments)
+        size = (
+            HEADER * 8
+            + len(instruments) * NAME_DTYPE.itemsize
+            + 2 * len(instruments) * len(FIELDS) * 8
+        )
+        memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER,), dtype=np.int64, buffer=memory.buf)
+        header[:] = (0, len(instruments))
+        names = np.ndarray(
+            (len(instruments),), dtype=NAME_DTYPE, buffer=memory.buf, offset=HEADER * 8
+        )
+        names[:] = [instrument.encode("utf-8") for instrument in instruments]
+        del header, names
+        table = cls(memory, owner=True)
+        table.buffers[:] = np.nan
+        return table
+
+    @classmethod
+    def attach(cls, name: str):
+        """Opens the table another process created"""
+        return cls(shared_memory.SharedMemory(name=name))
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def version(self) -> int:
+        return int(self.header[0]) // 2
+
+    def close(self):
+        """Releases the segment, unlinking it when this table created it"""
+        self.header = self.buffers = None
+        self._finalizer()
+
+    def publish(self, pair_dict: dict) -> int:
+        """Replaces the thresholds with those of pair_dict, instruments missing
+        from it get nan thresholds and never trade
+        returns:
+            the new version
+        """
+        unknown = set(pair_dict) - set(self.instrument_ids)
+        if unknown:
+            raise ValueError(f"Instruments not in the threshold table: {unknown}")
+        sequence = int(self.header[0])
+        self.header[0] = sequence + 1
+        buffer = self.buffers[(sequence // 2 + 1) % 2]
+        buffer[:] = np.nan
+        for instrument, thresholds in pair_dict.items():
+            buffer[self.instrument_ids[instrument]] = [
+                thresholds[field] for field in FIELDS
+            ]
+        self.header[0] = sequence + 2
+        return (sequence + 2) // 2
+
+    def snapshot(self) -> tuple:
+        """Consistent copy of the active thresholds
+        returns:
+            (version, array of shape (instruments, len(FIELDS)))
+        """
+        while True:
+            sequence = int(self.header[0])
+            values = self.buffers[(sequence // 2) % 2].copy()
+            # the writer gets back to this buffer with the second next version
+            if int(self.header[0]) <= (sequence // 2) * 2 + 2:
+                return sequence // 2, values
+
+    def current(self) -> dict:
+        """Thresholds as a pair_dict, only rebuilt once a new version is out"""
+        sequence = int(self.header[0])
+        if sequence != self._cached_sequence:
+            _, values = self.snapshot()
+            self._cached = {
+                instrument: dict(zip(FIELDS, row.tolist()))
+                for instrument, row in zip(self.instruments, values)
+            }
+            self._cached_sequence = sequence
+        return self._cached
@@ -0,0 +1,98 @@
+"""Fixed capacity in-memory history of streamed ticks"""
+import calendar
+import time
+
+import numpy as np
+
+_DAY_NS = {}
+
+
+def parse_time_ns(value: str) -> int:
+    """Converts a v20 RFC3339 timestamp to epoch nanoseconds
+    eg. 2021-11-05T14:30:15.123456789Z
+    """
+    day = value[:10]
+    day_ns = _DAY_NS.get(day)
+    if day_ns is None:
+        day_ns = calendar.timegm(time.strptime(day, "%Y-%m-%d")) * 1_000_000_000
+        _DAY_NS[day] = day_ns
+    seconds = int(value[11:13]) * 3600 + int(value[14:16]) * 60 + int(value[17:19])
+    fraction = value[20:-1]
+    nanos = int(fraction.ljust(9, "0")[:9]) if fraction else 0
+    return day_ns + seconds * 1_000_000_000 + nanos
+
+
+def format_time_ns(value: int) -> str:
+    """Converts epoch nanoseconds to a v20 RFC3339 timestamp"""
+    seconds, nanos = divmod(int(value), 1_000_000_000)
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + f".{nanos:09d}Z"
+
+
+class TickRingBuffer:
+    """Preallocated ring buffer of the latest ticks of every instrument
+
+    Every field (time, bid, ask) is one numpy array of shape
+    (instruments, 2 * capacity) where the row is the instrument id.  Each tick
+    is written twice, at slot i and i + capacity, so the latest n ticks of an
+    instrument are always one contiguous slice that is handed out as a view.
+    Views are overwritten as new ticks arrive, copy them to keep them.
+
+    params:
+        instruments: list -> instrument names, their index is the instrument id
+        capacity: int -> ticks kept per instrument
+    """
+
+    def __init__(self, instruments, capacity: int = 1024):
+        self.instruments = list(instruments)
+        self.instrument_ids = {name: i for i, name in enumerate(self.instruments)}
+        self.capacity = capacity
+
+        shape = (len(self.instruments), 2 * capacity)
+        self.time = np.zeros(shape, dtype=np.int64)
+        self.bid = np.full(shape, np.nan)
+        self.ask = np.full(shape, np.nan)
+
+        # next slot to write and total ticks written, per instrument id
+        self.positions = [0] * len(self.instruments)
+        self.counts = [0] * len(self.instruments)
+
+    def append(self, instrument_id: int, time_ns: int, bid: float, ask: float):
+        """Writes one tick of an instrument, overwriting its oldest tick when full"""
+        position = self.positions[instrument_id]
+        mirror = position + self.capacity
+        self.time[instrument_id, position] = time_ns
+        self.time[instrument_id, mirror] = time_ns
+        self.bid[instrument_id, position] = bid
+        self.bid[instrument_id, mirror] = bid
+        self.ask[instrument_id, position] = ask
+        self.ask[instrument_id, mirror] = ask
+        position += 1
+        self.positions[instrument_id] = 0 if position == self.capacity else position
+        self.counts[instrument_id] += 1
+
+    def latest(self, instrument, n: int = None) -> tuple:
+        """Returns views (time, bid, ask) on the latest n ticks of an instrument,
+        oldest first.  Fewer are returned while the buffer is not full yet.
+        """
+        instrument_id = self.instrument_ids[instrument]
+        available = min(self.counts[instrument_id], self.capacity)
+        n = available if n is None else min(n, available)
+        end = self.positions[instrument_id] + self.capacity
+        window = slice(end - n, end)
+        return (
+            self.time[instrument_id, window],
+            self.bid[instrument_id, window],
+            self.ask[instrument_id, window],
+        )
+
+    def last_price(self, instrument) -> tuple:
+        """Returns (time, bid, ask) of the most recent tick, None if there is none"""
+        instrument_id = self.instrument_ids[instrument]
+        if not self.counts[instrument_id]:
+            return None
+        slot = self.positions[instrument_id] + self.capacity - 1
+        return (
+            int(self.time[instrument_id, slot]),
+            float(self.bid[instrument_id, slot]),
+            float(self.ask[instrument_id, slot]),
+        )
@@ -0,0 +1,343 @@
+"""Append-only archive of the streamed ticks in daily memory-mapped files"""
+from automated_trader.commons.logger import logger
+import collections
+import os
+import threading
+import time
+
+import numpy as np
+
+DAY_NS = 86_400 * 10**9
+
+TICK_RECORD_DTYPE = np.dtype(
+    [
+        ("instrument_id", "u4"),
+        ("time", "i8"),
+        ("bid", "f8"),
+        ("ask", "f8"),
+        ("bid_liquidity", "f8"),
+        ("ask_liquidity", "f8"),
+    ]
+)
+# magic, record size and number of records written, padded to 64 bytes
+HEADER_DTYPE = np.dtype(
+    [("magic", "S8"), ("record_size", "u8"), ("count", "u8"), ("reserved", "u1", 40)]
+)
+MAGIC = b"ATTICKS1"
+# every INDEX_EVERY records the index keeps the latest time seen so far
+INDEX_EVERY = 1024
+
+
+def day_of(time_ns: int) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(time_ns // 10**9))
+
+
+class TickFile:
+    """One day of the archive: YYYY-MM-DD.ticks and its YYYY-MM-DD.idx.npz
+
+    The .ticks file is a 64 byte header followed by TICK_RECORD_DTYPE records
+    in the order they were received.  It grows in chunks of capacity records
+    and is memory-mapped, the header count says how many are written and is
+    only raised after the records are in place.  The index holds the
+    instrument names (their position is the instrument_id of the file), the
+    records per instrument and, every INDEX_EVERY records, the latest time
+    seen so far.  It is written whenever an instrument gets its id, before
+    the records that use it, so a file reopened after a crash always knows
+    the names of its records; the counts and times are rebuilt from the
+    records.
+
+    params:
+        directory: str -> directory of the archive
+        day: str -> UTC day, YYYY-MM-DD
+        capacity: int -> records the file grows by
+    """
+
+    def __init__(self, directory, day, capacity=1 << 20):
+        self.path = os.path.join(directory, f"{day}.ticks")
+        self.index_path = os.path.join(directory, f"{day}.idx.npz")
+        self.day = day
+        self.capacity = capacity
+        self.instruments = []
+        self.instrument_counts = []
+        self.block_times = []
+        self.max_time = np.iinfo(np.int64).min
+        if os.path.exists(self.path):
+            self.count = int(np.fromfile(self.path, HEADER_DTYPE, count=1)[0]["count"])
+            if os.path.exists(self.index_path):
+                with np.load(self.index_path) as index:
+                    self.instruments = [str(name) for name in index["instruments"]]
+        else:
+            self.count = 0
+            header = np.zeros(1, HEADER_DTYPE)
+            header["magic"] = MAGIC
+            header["record_size"] = TICK_RECORD_DTYPE.itemsize
+            with open(self.path, "wb") as file:
+                header.tofile(file)
+        self._map(max(self.capacity, self.count))
+        if self.count:
+            # an archive reopened after a restart, rebuild counts and times
+            counts = np.bincount(
+                self.records["instrument_id"][: self.count],
+                minlength=len(self.instruments),
+            )
+            if len(counts) > len(self.instruments):
+                # written before the index kept up, new ids must not reuse these
+                logger.log(30, f"{self.path} has records of unindexed instruments")
+                self.instruments += [
+                    f"unknown-{i}" for i in range(len(self.instruments), len(counts))
+                ]
+            self.instrument_counts = counts.tolist()
+            times = self.records["time"][: self.count]
+            self.max_time = int(times.max())
+            self.block_times = list(
+                np.maximum.accumulate(times)[INDEX_EVERY - 1 :: INDEX_EVERY]
+            )
+        else:
+            self.instrument_counts = [0] * len(self.instruments)
+        self.instrument_ids = {name: i for i, name in enumerate(self.instruments)}
+
+    def _map(self, records):
+        size = HEADER_DTYPE.itemsize + records * TICK_RECORD_DTYPE.itemsize
+        if os.path.getsize(self.path) < size:
+            with open(self.path, "r+b") as file:
+                file.truncate(size)
+        self.header = np.memmap(self.path, HEADER_DTYPE, "r+", shape=(1,))
+        self.records = np.memmap(
+            self.path,
+            TICK_RECORD_DTYPE,
+            "r+",
+            offset=HEADER_DTYPE.itemsize,
+            shape=(records,),
+        )
+
+    def instrument_id(self, instrument) -> int:
+        instrument_id = self.instrument_ids.get(instrument)
+        if instrument_id is None:
+            instrument_id = len(self.instruments)
+            self.instruments.append(instrument)
+            self.instrument_counts.append(0)
+            self.instrument_ids[instrument] = instrument_id
+        return instrument_id
+
+    def write(self, batch: np.ndarray, instruments):
+        """Appends a batch of records whose instrument_id indexes instruments"""
+        known = len(self.instruments)
+        ids = np.array([self.instrument_id(name) for name in instruments])
+        if len(self.instruments) > known:
+            # the new names reach the disk before the records using their ids
+            self.write_index()
+        batch["instrument_id"] = ids[batch["instrument_id"]]
+        end = self.count + len(batch)
+        if end > len(self.records):
+            self.records.flush()
+            self._map(len(self.records) + max(self.capacity, len(batch)))
+        self.records[self.count : end] = batch
+        for instrument_id, count in enumerate(
+            np.bincount(batch["instrument_id"], minlength=len(self.instruments))
+        ):
+            self.instrument_counts[instrument_id] += int(count)
+        # running maximum of the times, one entry per completed block
+        times = np.maximum.accumulate(batch["time"])
+        np.maximum(times, self.max_time, out=times)
+        self.max_time = int(times[-1])
+        first = -(self.count + 1) % INDEX_EVERY
+        self.block_times.extend(times[first::INDEX_EVERY].tolist())
+        self.count = end
+        self.header["count"] = end
+
+    def write_index(self):
+        temporary = f"{self.index_path}.tmp.npz"
+        np.savez(
+            temporary,
+            instruments=np.array(self.instruments, dtype=str),
+            counts=np.array(self.instrument_counts, dtype=np.int64),
+            block_times=np.array(self.block_times, dtype=np.int64),
+        )
+        os.replace(temporary, self.index_path)
+
+    def close(self):
+        """Writes the index and cuts the file down to its records"""
+        self.records.flush()
+        self.header.flush()
+        self.write_index()
+        del self.records, self.header
+        with open(self.path, "r+b") as file:
+            file.truncate(
+                HEADER_DTYPE.itemsize + self.count * TICK_RECORD_DTYPE.itemsize
+            )
+
+
+class TickRecorder:
+    """Records streamed ticks into daily TickFiles on a writer thread
+
+    record() only appends a tuple to a deque, it never waits on the writer
+    or the disk.  The writer thread drains the deque every flush_interval
+    seconds and copies the ticks into the file of their UTC day, by the time
+    the price carries.  Once a new day starts, the files before the previous
+    day are closed.  When the writer falls behind by more than max_pending ticks
+    new ticks are dropped and counted in dropped.
+
+    params:
+        directory: str -> directory of the archive, created when missing
+        flush_interval: float -> seconds between two writes
+        max_pending: int -> ticks waiting for the writer before ticks are dropped
+    """
+
+    def __init__(self, directory, flush_interval=0.05, max_pending=1_000_000):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = collections.deque()
+        self.files = {}
+        self.recorded = 0
+        self.dropped = 0
+        self.stopped = threading.Event()
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def record(
+        self, instrument, time_ns, bid, ask, bid_liquidity=0.0, ask_liquidity=0.0
+    ):
+        """Queues one tick for the writer"""
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self.pending.append(
+            (instrument, time_ns, bid, ask, bid_liquidity, ask_liquidity)
+        )
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="tick-recorder", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Writes what is still queued and closes the files"""
+        self.stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        for tick_file in self.files.values():
+            tick_file.close()
+        self.files = {}
+
+    def _run(self):
+        last_index = time.monotonic()
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.monotonic() - last_index >= 1.0:
+                    for tick_file in self.files.values():
+                        tick_file.write_index()
+                    last_index = time.monotonic()
+            except Exception as e:
+                logger.log(40, f"Tick recorder failed to write: {e!r}")
+
+    def flush(self) -> int:
+        """Writes the queued ticks, returns how many"""
+        ticks = []
+        pending = self.pending
+        # popleft is safe against the appends of the stream thread
+        for _ in range(len(pending)):
+            ticks.append(pending.popleft())
+        if not ticks:
+            return 0
+
+        instruments = {}
+        batch = np.empty(len(ticks), TICK_RECORD_DTYPE)
+        names, times, bids, asks, bid_liquidity, ask_liquidity = zip(*ticks)
+        batch["instrument_id"] = [
+            instruments.setdefault(name, len(instruments)) for name in names
+        ]
+        batch["time"] = times
+        batch["bid"] = bids
+        batch["ask"] = asks
+        batch["bid_liquidity"] = bid_liquidity
+        batch["ask_liquidity"] = ask_liquidity
+        instruments = list(instruments)
+
+        days = batch["time"] // DAY_NS
+        for day in np.unique(days):
+            tick_file = self.tick_file(day_of(int(day) * DAY_NS))
+            tick_file.write(batch[days == day], instruments)
+        self.recorded += len(ticks)
+        return len(ticks)
+
+    def tick_file(self, day) -> TickFile:
+        tick_file = self.files.get(day)
+        if tick_file is None:
+            tick_file = TickFile(self.directory, day)
+            self.files[day] = tick_file
+            # ticks of an earlier day still straggling in keep one day open
+            for old in sorted(self.files)[:-2]:
+                self.files.pop(old).close()
+        return tick_file
+
+
+class TickArchive:
+    """Reads the days written by a TickRecorder
+
+    params:
+        directory: str -> directory of the archive
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def days(self) -> list:
+        return sorted(
+            name[: -len(".ticks")]
+            for name in os.listdir(self.directory)
+            if name.endswith(".ticks")
+        )
+
+    def load(self, day) -> tuple:
+        """(instruments, records) of a day, records is a read only memmap of
+        the ticks in the order they were received
+        """
+        path = os.path.join(self.directory, f"{day}.ticks")
+        header = np.fromfile(path, HEADER_DTYPE, count=1)[0]
+        if header["magic"] != MAGIC:
+            raise ValueError(f"{path} is not a tick archive file")
+        count = int(header["count"])
+        with np.load(os.path.join(self.directory, f"{day}.idx.npz")) as index:
+            instruments = [str(name) for name in index["instruments"]]
+        if not count:
+            return instruments, np.empty(0, TICK_RECORD_DTYPE)
+        records = np.memmap(
+            path, TICK_RECORD_DTYPE, "r", offset=HEADER_DTYPE.itemsize, shape=(count,)
+        )
+        return instruments, records
+
+    def block_times(self, day) -> np.ndarray:
+        with np.load(os.path.join(self.directory, f"{day}.idx.npz")) as index:
+            return index["block_times"]
+
+    def ticks(self, start_ns=None, end_ns=None, instruments=None):
+        """Yields (instruments, records) per day with the ticks within
+        [start_ns, end_ns) of the wanted instruments, in received order
+        """
+        for day in self.days():
+            day_start = int(np.datetime64(day, "ns").astype(np.int64))
+            if end_ns is not None and day_start >= end_ns:
+                break
+            if start_ns is not None and day_start + DAY_NS <= start_ns:
+                continue
+            names, records = self.load(day)
+            first = 0
+            if start_ns is not None:
+                # blocks whose latest time is before start hold no wanted tick
+                blocks = np.searchsorted(self.block_times(day), start_ns)
+                first = int(blocks) * INDEX_EVERY
+            records = records[first:]
+            mask = np.ones(len(records), dtype=bool)
+            if start_ns is not None:
+                mask &= records["time"] >= start_ns
+            if end_ns is not None:
+                mask &= records["time"] < end_ns
+            if instruments is not None:
+                wanted = [names.index(name) for name in instruments if name in names]
+                mask &= np.isin(records["instrument_id"], wanted)
+            yield names, records[mask]
@@ -1,7 +1,6 @@
 from automated_trader.commons.logger import logger
 import math
 import tpqoa
-import time
 
 
 def determine_position_sizing(atr: float, account_details: dict, bid: float):
@@ -14,22 +13,30 @@ def determine_position_sizing(atr: float, account_details: dict, bid: float):
     return math.floor(position_size)
 
 
-def get_open_positions(client: tpqoa.tpqoa):
-    """Retrieves all open positions"""
-    try:
-        positions = client.get_positions()
-        return positions
-    except Exception as e:
-        print(e)
-        raise ConnectionAbortedError(
-            "Failed to get open positions due to a connection error"
-        )
+def exit_criteria_met(
+    type_of_order: str, price: float, timeframe_exit_low, timeframe_exit_high
+) -> bool:
+    """Checks a price of a long or short position against its exit levels, a
+    long exits below the low of the exit channel and a short above its high
+    """
+    if type_of_order == "long":
+        return price < timeframe_exit_low
+    return price > timeframe_exit_high
 
 
 def process_open_positions(
-    client: tpqoa.tpqoa, positions: list, pair_dict: dict, exit_point_days: int
+    client: tpqoa.tpqoa,
+    positions: list,
+    pair_dict: dict,
+    exit_point_days: int,
+    prices: dict = None,
 ) -> dict:
-    """Processes the open position based on turtle criteria and closes them should the exit criteria be met"""
+    """Processes the open position based on turtle criteria and closes them should the exit criteria be met
+    params:
+        prices: dict -> instrument: (bid, ask) live prices, longs are checked
+            at the bid and shorts at the ask.  Without a live price the average
+            price of the position is checked.
+    """
     # iterate over all positions
     for position in positions:
         pair = position["instrument"]
@@ -38,43 +45,32 @@ def process_open_positions(
 
         type_of_order = "long" if float(position["long"]["units"]) != 0.0 else "short"
 
-        print(f"TYPE OF POSITION: {type_of_order}")
+        logger.log(10, f"Type of position: {type_of_order}", extra={"pair": pair})
 
         open_position = position[type_of_order]
 
-        price = open_position["averagePrice"]
+        price = float(open_position["averagePrice"])
+        if prices is not None and pair in prices:
+            bid, ask = prices[pair]
+            price = bid if type_of_order == "long" else ask
         units = float(open_position["units"])
 
+        if not exit_criteria_met(
+            type_of_order, price, timeframe_exit_low, timeframe_exit_high
+        ):
+            continue
+        order_result = client.create_order(
+            instrument=pair,
+            units=-1 * units,
+            ret=True,
+        )
         if type_of_order == "long":
-            if price < timeframe_exit_low:
-                order_result = client.create_order(
-                    instrument=pair,
-                    units=-1 * units,
-                    ret=True,
-                )
-                logger.log(
-                    20,
-                    f"Position closed because exit criteria met for position.  For this long position, {timeframe_exit_low} is the {exit_point_days} day low.\nPosition:\n{position}\nClose Response:\n{order_result}",
-                )
+            logger.log(
+                20,
+                f"Position closed because exit criteria met for position.  For this long position, {timeframe_exit_low} is the {exit_point_days} day low.\nPosition:\n{position}\nClose Response:\n{order_result}",
+            )
         else:
-            if price > timeframe_exit_high:
-                order_result = client.create_order(
-                    instrument=pair,
-                    units=-1 * units,
-                    ret=True,
-                )
-                logger.log(
-                    20,
-                    f"Position closed because exit criteria met for position.  For this short position, {timeframe_exit_high} is the {exit_point_days} High.\nPosition:\n{position}\nClose Response:\n{order_result}",
-                )
-
-
-def monitor_open_positions(client: tpqoa.tpqoa, exit_point_days: int, pair_dict: dict):
-    """Constantly monitors open positions"""
-    while 1:
-        print("Processing open Positions for any exit criteria...")
-        positions = get_open_positions(client)
-        process_open_positions(client, positions, pair_dict, exit_point_days)
-
-        # sleep timer of 1 second
-        time.sleep(1)
+            logger.log(
+                20,
+                f"Position closed because exit criteria met for position.  For this short position, {timeframe_exit_high} is the {exit_point_days} High.\nPosition:\n{position}\nClose Response:\n{order_result}",
+            )
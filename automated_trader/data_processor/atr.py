@@ -0,0 +1,150 @@
+"""Incremental average true range"""
+from collections import deque
+import json
+import math
+
+SIMPLE = "simple"
+WILDER = "wilder"
+
+
+class AverageTrueRange:
+    """Average true range updated bar by bar in constant time
+
+    The true range of a bar is the largest of high - low, |high - previous
+    close| and |low - previous close|; the first bar has no previous close and
+    uses high - low.  The simple method averages the last `window` true ranges
+    with the running window sum of pandas rolling().sum(): additions and
+    removals each carry their own Kahan compensation, and a window of equal
+    values is their value times the count.  The average is therefore the
+    rolling mean TurtleProcessor computed, to the last bit, however large the
+    ranges that passed through the window.  Wilder's method seeds with that same simple average and then smooths with
+    atr = (atr * (window - 1) + true_range) / window.
+
+    params:
+        window: int -> number of bars averaged
+        method: str -> "simple" or "wilder"
+    """
+
+    def __init__(self, window: int = 20, method: str = SIMPLE):
+        if method not in (SIMPLE, WILDER):
+            raise ValueError(f"Unknown ATR method: {method}")
+        self.window = window
+        self.method = method
+        self.count = 0
+        self.previous_close = None
+        self.window_sum = 0.0
+        self.add_compensation = 0.0
+        self.remove_compensation = 0.0
+        # length of the run of equal true ranges that ends with the last one
+        self.same_count = 0
+        self.true_ranges = deque(maxlen=window)
+        self.wilder = None
+
+    def true_range(self, high, low) -> float:
+        """True range of a bar given the previous close"""
+        if self.previous_close is None:
+            return high - low
+        return max(
+            high - low,
+            abs(high - self.previous_close),
+            abs(low - self.previous_close),
+        )
+
+    def _add(self, true_range):
+        y = true_range - self.add_compensation
+        total = self.window_sum + y
+        self.add_compensation = total - self.window_sum - y
+        self.window_sum = total
+        if self.true_ranges and true_range == self.true_ranges[-1]:
+            self.same_count += 1
+        else:
+            self.same_count = 1
+        self.true_ranges.append(true_range)
+
+    def _remove(self, true_range):
+        y = -true_range - self.remove_compensation
+        total = self.window_sum + y
+        self.remove_compensation = total - self.window_sum - y
+        self.window_sum = total
+
+    @property
+    def total(self) -> float:
+        """Sum of the true ranges in the window, as pandas rolling().sum()"""
+        if not self.true_ranges:
+            return 0.0
+        if self.same_count >= len(self.true_ranges):
+            return self.true_ranges[-1] * len(self.true_ranges)
+        return self.window_sum
+
+    def update(self, high, low, close) -> float:
+        """Adds the next bar, returns the ATR (nan until a full window was seen)"""
+        true_range = self.true_range(high, low)
+        if len(self.true_ranges) == self.window:
+            self._remove(self.true_ranges[0])
+        self._add(true_range)
+        self.previous_close = close
+        self.count += 1
+
+        if self.method == WILDER and self.count > self.window:
+            self.wilder = (self.wilder * (self.window - 1) + true_range) / self.window
+        elif self.method == WILDER and self.count == self.window:
+            self.wilder = self.total / self.window
+        return self.value
+
+    def extend(self, highs, lows, closes) -> float:
+        """Adds a sequence of bars, oldest first"""
+        for high, low, close in zip(highs, lows, closes):
+            self.update(high, low, close)
+        return self.value
+
+    @property
+    def value(self) -> float:
+        if self.count < self.window:
+            return math.nan
+        if self.method == WILDER:
+            return self.wilder
+        return self.total / self.window
+
+    def to_dict(self) -> dict:
+        """State of the calculator, restored by from_dict"""
+        return {
+            "window": self.window,
+            "method": self.method,
+            "count": self.count,
+            "previous_close": self.previous_close,
+            "true_ranges": list(self.true_ranges),
+            "window_sum": self.window_sum,
+            "add_compensation": self.add_compensation,
+            "remove_compensation": self.remove_compensation,
+            "same_count": self.same_count,
+            "wilder": self.wilder,
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "AverageTrueRange":
+        atr = cls(state["window"], state["method"])
+        atr.count = state["count"]
+        atr.previous_close = state["previous_close"]
+        if "window_sum" in state:
+            atr.true_ranges.extend(state["true_ranges"])
+            atr.window_sum = state["window_sum"]
+            atr.add_compensation = state["add_compensation"]
+            atr.remove_compensation = state["remove_compensation"]
+            atr.same_count = state["same_count"]
+        else:
+            # saved before the sum was kept, the window is summed afresh
+            for true_range in state["true_ranges"]:
+                atr._add(true_range)
+        atr.wilder = state["wilder"]
+        return atr
+
+    def save(self, path):
+        """Writes the state to a JSON file"""
+        with open(path, "w") as state_file:
+            json.dump(self.to_dict(), state_file)
+
+    @classmethod
+    def load(cls, path) -> "AverageTrueRange":
+        """Restores a calculator saved with save"""
+        with open(path) as state_file:
+            return cls.from_dict(json.load(state_file))
@@ -0,0 +1,502 @@
+"""Vectorized daily bar backtest of the turtle rules the live trader follows"""
+from automated_trader.commons.trading_utils import determine_position_sizing
+from automated_trader.data_processor.panel import TurtlePanelProcessor
+import heapq
+
+import numpy as np
+import pandas as pd
+
+TRADE_DTYPE = np.dtype(
+    [
+        ("instrument", "U32"),
+        ("direction", "i1"),
+        ("entry_bar", "i8"),
+        ("entry_time", "M8[ns]"),
+        ("entry_price", "f8"),
+        ("units", "i8"),
+        ("atr", "f8"),
+        ("stop_price", "f8"),
+        ("exit_bar", "i8"),
+        ("exit_time", "M8[ns]"),
+        ("exit_price", "f8"),
+        ("reason", "U4"),
+        ("pl", "f8"),
+    ]
+)
+# reasons a trade ended with
+EXIT = "exit"
+STOP = "stop"
+OPEN = "open"
+
+
+def rolling(panel: np.ndarray, window: int, ufunc) -> np.ndarray:
+    """Maximum or minimum (ufunc np.maximum or np.minimum) over the `window`
+    bars before every bar of a (instrument x time) panel, nan where fewer
+    bars or a nan came before
+
+    Blocks of 1, 2, 4, ... bars are combined until the largest power of two
+    within the window, two overlapping blocks of that size then cover it.
+    """
+    result = np.full(panel.shape, np.nan)
+    if panel.shape[1] <= window:
+        return result
+    values = blocks = panel[:, :-1]
+    span = 1
+    while span * 2 <= window:
+        blocks = ufunc(blocks[:, :-span], blocks[:, span:])
+        span *= 2
+    count = values.shape[1] - window + 1
+    result[:, window:] = ufunc(
+        blocks[:, :count], blocks[:, window - span : window - span + count]
+    )
+    return result
+
+
+def next_true(mask: np.ndarray) -> np.ndarray:
+    """Index of the first True at or after every bar of each row, the row
+    length where there is none
+    """
+    length = mask.shape[-1]
+    index = np.where(mask, np.arange(length), length)
+    return np.minimum.accumulate(index[..., ::-1], axis=-1)[..., ::-1]
+
+
+def first_reached(panel: np.ndarray, rows, start, end, threshold) -> np.ndarray:
+    """First bar within [start, end] of each query at which the panel row is at
+    or below threshold, the row length where there is none
+
+    A sparse table of the minimum over blocks of 1, 2, 4, ... bars lets every
+    query skip the blocks that stay above its threshold, so all queries are
+    answered together in log2(longest range) numpy steps.
+    params:
+        panel: np.ndarray -> (instrument x time) values
+        rows, start, end, threshold: np.ndarray -> one entry per query
+    """
+    length = panel.shape[1]
+    end = np.minimum(end, length - 1)
+    position = np.array(start, dtype=np.int64)
+    longest = int(np.max(end - position, initial=0)) + 1
+    tables = [np.where(np.isnan(panel), np.inf, panel)]
+    while 2 ** len(tables) <= longest:
+        span = 2 ** (len(tables) - 1)
+        previous = tables[-1]
+        tables.append(np.minimum(previous[:, :-span], previous[:, span:]))
+    for level in range(len(tables) - 1, -1, -1):
+        table = tables[level]
+        inside = position + 2**level - 1 <= end
+        minimum = table[rows, np.minimum(position, table.shape[1] - 1)]
+        position += np.where(inside & (minimum > threshold), 2**level, 0)
+    reached = position <= end
+    reached[reached] = tables[0][rows[reached], position[reached]] <= threshold[reached]
+    return np.where(reached, position, length)
+
+
+class TurtleBacktester(TurtlePanelProcessor):
+    """Replays the turtle rules of StreamingClient over years of daily bars
+
+    The thresholds of a bar are those TurtlePanelProcessor computes when that
+    bar is the still forming one: the entry and exit Donchian channels of the
+    completed bars before it.  The ATR of a bar averages the true ranges of
+    the atr_window bars before it too, the range of the bar itself is not
+    known at its breakout.  Every threshold is one numpy window operation
+    over the whole (instrument x time) panel.
+
+    A flat instrument goes long when the high of a bar breaks the entry
+    channel high and short when the low breaks its low, long first like
+    on_success.  The entry fills at the channel, or at the open when the bar
+    gaps through it, with the stop loss 2 x ATR away as in place_long_order
+    and place_short_order, and determine_position_sizing sizes it from the
+    realized balance.  Once that balance is down to 0 no trade is entered
+    any more.  From the next bar on, the position closes at the stop loss or
+    at its exit level, whichever the price reaches first: a long exits below
+    the low of the exit channel, a short above its high, as check_exit does
+    with timeframe_exit_low and timeframe_exit_high.  Without compound every
+    trade is sized from the initial balance, the realized one still ends the
+    trading at 0.
+
+    The exits of all entry signals are found together with array operations,
+    a Python loop only chains each trade to the next entry, it never visits
+    the bars in between.  Prices are mid candles without spread or financing.
+    Profits are made in the quote currency of an instrument and converted to
+    the account currency at the close of the bar, with the instrument of the
+    panel that quotes one against the other (USD_JPY for the JPY of EUR_JPY
+    in a USD account).
+
+    params:
+        instruments: list -> instrument name of every row
+        highs, lows, closes: np.ndarray -> (instrument x time) price panels
+        entry_point_days: int -> breakout window
+        exit_point_days: int -> exit window
+        atr_window: int -> bars averaged by the ATR
+        opens: np.ndarray -> open panel, the previous closes when missing
+        times: np.ndarray -> datetime64 start of every bar
+        balance: float -> initial balance of the account
+        account_currency: str -> currency of the balance and the profits
+    """
+
+    compound = True
+
+    def __init__(
+        self,
+        instruments,
+        highs: np.ndarray,
+        lows: np.ndarray,
+        closes: np.ndarray,
+        entry_point_days: int,
+        exit_point_days: int,
+        atr_window: int = 20,
+        opens: np.ndarray = None,
+        times=None,
+        balance: float = 100000.0,
+        account_currency: str = "USD",
+    ):
+        super().__init__(
+            instruments,
+            highs,
+            lows,
+            closes,
+            entry_point_days,
+            exit_point_days,
+            atr_window,
+        )
+        if opens is None:
+            opens = np.full_like(self.closes, np.nan)
+            opens[:, 1:] = self.closes[:, :-1]
+        self.opens = np.asarray(opens, dtype=np.float64)
+        self.times = None if times is None else np.asarray(times, "M8[ns]")
+        self.balance = balance
+        self.account_currency = account_currency
+
+    @classmethod
+    def from_frames(cls, frames: dict, entry_point_days, exit_point_days, **kwargs):
+        """Builds the panels from TurtleProcessor style DataFrames (o, h, l, c
+        columns and a time index) keyed by instrument.  Unlike the live panel,
+        bars are aligned on their time.  A day an instrument has no bar within
+        its history is a flat bar at its last close.
+        """
+        columns = {
+            column: pd.DataFrame(
+                {instrument: frame[column] for instrument, frame in frames.items()}
+            )
+            for column in "ohlc"
+            if all(column in frame for frame in frames.values())
+        }
+        closes = columns["c"].sort_index()
+        filled = closes.ffill().T.to_numpy()
+        missing = closes.T.isna().to_numpy() & ~np.isnan(filled)
+        panels = {}
+        for column, panel in columns.items():
+            # (instrument x time), like the live panel
+            panel = panel.reindex(closes.index).T.to_numpy(dtype=np.float64, copy=True)
+            panel[missing] = filled[missing]
+            panels[column] = panel
+        return cls(
+            list(frames),
+            panels["h"],
+            panels["l"],
+            panels["c"],
+            entry_point_days,
+            exit_point_days,
+            opens=panels.get("o"),
+            times=closes.index.to_numpy(),
+            **kwargs,
+        )
+
+    def quote_rates(self) -> np.ndarray:
+        """Value in the account currency of one unit of the quote currency of
+        every instrument at every close, (instrument x time).  Bars before
+        the history of the converting instrument use its first close.
+        """
+        rows = {instrument: row for row, instrument in enumerate(self.instruments)}
+        currency = self.account_currency
+        rates = np.empty(self.closes.shape)
+        missing = []
+        for row, instrument in enumerate(self.instruments):
+            quote = instrument.split("_")[-1]
+            if quote == currency:
+                rates[row] = 1.0
+            elif f"{quote}_{currency}" in rows:
+                rates[row] = self.closes[rows[f"{quote}_{currency}"]]
+            elif f"{currency}_{quote}" in rows:
+                rates[row] = 1.0 / self.closes[rows[f"{currency}_{quote}"]]
+            else:
+                missing.append(f"{quote}_{currency}")
+        if missing:
+            raise ValueError(
+                f"No {', '.join(sorted(set(missing)))} (or the inverse) to convert "
+                f"profits to {currency}"
+            )
+        return pd.DataFrame(rates).ffill(axis=1).bfill(axis=1).to_numpy()
+
+    def rolling_channel(self, window: int) -> tuple:
+        """Donchian channel of every bar, over the `window` bars before it"""
+        return (
+            rolling(self.highs, window, np.maximum),
+            rolling(self.lows, window, np.minimum),
+        )
+
+    def rolling_atr(self) -> np.ndarray:
+        """ATR of every bar, over the atr_window bars before it"""
+        true_range = self.true_range()
+        atr = np.full(true_range.shape, np.nan)
+        if true_range.shape[1] > self.atr_window:
+            windows = np.lib.stride_tricks.sliding_window_view(
+                true_range[:, :-1], self.atr_window, axis=1
+            )
+            atr[:, self.atr_window :] = windows.sum(axis=-1) / self.atr_window
+        return atr
+
+    def signals(self) -> dict:
+        """Entry and exit panels of the whole history
+        returns:
+            dict of (instrument x time) arrays: the entry channel, exit
+            levels and ATR of every bar and where longs and shorts enter and
+            exit
+        """
+        entry_high, entry_low = self.rolling_channel(self.entry_point_days)
+        exit_upper, exit_lower = self.rolling_channel(self.exit_point_days)
+        atr = self.rolling_atr()
+        long_exit, short_exit = exit_lower, exit_upper
+        ready = atr > 0
+        longs = ready & (self.highs > entry_high)
+        return {
+            "entry_high": entry_high,
+            "entry_low": entry_low,
+            "long_exit": long_exit,
+            "short_exit": short_exit,
+            "atr": atr,
+            "longs": longs,
+            "shorts": ready & ~longs & (self.lows < entry_low),
+            "long_exits": self.lows < long_exit,
+            "short_exits": self.highs > short_exit,
+        }
+
+    def find_trades(self, signals: dict) -> np.ndarray:
+        """Entry and exit of every trade, independent of its size
+
+        The exit of every bar that signals an entry is found at once, with
+        first_reached for the stop loss; a loop then only chains each trade
+        to the first entry after its exit.
+        returns:
+            structured array with TRADE_DTYPE, units and pl still 0
+        """
+        length = self.closes.shape[1]
+        longs = signals["longs"]
+        entries = longs | signals["shorts"]
+        rows, bars = np.nonzero(entries)
+        is_long = longs[rows, bars]
+        direction = np.where(is_long, 1, -1)
+        opens = self.opens[rows, bars]
+        price = np.where(
+            is_long,
+            np.fmax(opens, signals["entry_high"][rows, bars]),
+            np.fmin(opens, signals["entry_low"][rows, bars]),
+        )
+        atr = signals["atr"][rows, bars]
+        # the stop loss distance of place_long_order and place_short_order
+        stop = price - direction * np.round(2 * atr, 5)
+
+        # exits are looked for from the bar after the entry on
+        start = np.minimum(bars + 1, length - 1)
+        exit_bar = np.where(
+            is_long,
+            next_true(signals["long_exits"])[rows, start],
+            next_true(signals["short_exits"])[rows, start],
+        )
+        exit_bar[bars + 1 >= length] = length
+        # a long is stopped at a low, a short at a high, both as a minimum
+        stop_bar = np.where(
+            is_long,
+            first_reached(self.lows, rows, bars + 1, exit_bar, stop),
+            first_reached(-self.highs, rows, bars + 1, exit_bar, -stop),
+        )
+
+        last = length - 1
+        at_exit = np.minimum(exit_bar, last)
+        level = np.where(
+            is_long,
+            signals["long_exit"][rows, at_exit],
+            signals["short_exit"][rows, at_exit],
+        )
+        # the stop is reached first, or both are and the stop is closer
+        stopped = (stop_bar < exit_bar) | (
+            (stop_bar == exit_bar) & (direction * (level - stop) <= 0)
+        )
+        still_open = (stop_bar >= length) & (exit_bar >= length)
+        closed_at = np.minimum(np.where(stopped, stop_bar, exit_bar), last)
+        fill = np.where(stopped, stop, level)
+        # a bar that opens beyond the level fills at the open
+        opens = self.opens[rows, closed_at]
+        fill = np.where(is_long, np.fmin(opens, fill), np.fmax(opens, fill))
+        fill = np.where(still_open, self.closes[rows, last], fill)
+
+        chosen = []
+        candidates = np.full((len(self.instruments), length), -1)
+        candidates[rows, bars] = np.arange(len(rows))
+        candidates = candidates.tolist()
+        next_entry = next_true(entries).tolist()
+        closed_list, open_list = closed_at.tolist(), still_open.tolist()
+        for row in range(len(self.instruments)):
+            bar = 0
+            while bar < length:
+                entry = next_entry[row][bar]
+                if entry >= length:
+                    break
+                candidate = candidates[row][entry]
+                chosen.append(candidate)
+                if open_list[candidate]:
+                    break
+                bar = closed_list[candidate] + 1
+
+        trades = np.zeros(len(chosen), dtype=TRADE_DTYPE)
+        trades["instrument"] = np.array(self.instruments, dtype="U32")[rows[chosen]]
+        trades["direction"] = direction[chosen]
+        trades["entry_bar"] = bars[chosen]
+        trades["entry_price"] = price[chosen]
+        trades["atr"] = atr[chosen]
+        trades["stop_price"] = stop[chosen]
+        trades["exit_bar"] = closed_at[chosen]
+        trades["exit_price"] = fill[chosen]
+        trades["reason"] = np.where(
+            still_open[chosen], OPEN, np.where(stopped[chosen], STOP, EXIT)
+        )
+        if self.times is None:
+            trades["entry_time"] = trades["exit_time"] = np.datetime64("NaT")
+        else:
+            trades["entry_time"] = self.times[trades["entry_bar"]]
+            trades["exit_time"] = self.times[trades["exit_bar"]]
+        return trades
+
+    def size_trades(self, trades: np.ndarray, rates: np.ndarray) -> np.ndarray:
+        """Sizes the trades in the order they were entered, each from the
+        balance realized before its entry bar when compounding; no trade is
+        entered once that balance is 0 or less
+        params:
+            rates: np.ndarray -> quote_rates() the profits are converted with
+        """
+        closing = []
+        balance = self.balance
+        units = np.zeros(len(trades), dtype=np.int64)
+        entries = trades["entry_bar"].tolist()
+        exits = trades["exit_bar"].tolist()
+        atrs = trades["atr"].tolist()
+        prices = trades["entry_price"].tolist()
+        # profit per unit in the account currency, at the rate of the exit bar
+        moves = (
+            trades["direction"]
+            * (trades["exit_price"] - trades["entry_price"])
+            * rates[self.rows(trades["instrument"]), trades["exit_bar"]]
+        )
+        move_list = moves.tolist()
+        still_open = (trades["reason"] == OPEN).tolist()
+        for i in np.lexsort((trades["instrument"], trades["entry_bar"])).tolist():
+            while closing and closing[0][0] < entries[i]:
+                balance += heapq.heappop(closing)[1]
+            if balance <= 0:
+                # the account is gone, nothing is traded from here on
+                break
+            size = max(
+                determine_position_sizing(
+                    atrs[i],
+                    {"balance": balance if self.compound else self.balance},
+                    prices[i],
+                ),
+                0,
+            )
+            units[i] = size
+            if not still_open[i]:
+                heapq.heappush(closing, (exits[i], size * move_list[i]))
+        trades["units"] = units
+        trades["pl"] = units * moves
+        return trades
+
+    def rows(self, instruments) -> np.ndarray:
+        """Panel row of every instrument name"""
+        row_of = {instrument: row for row, instrument in enumerate(self.instruments)}
+        return np.array([row_of[name] for name in instruments], dtype=int)
+
+    def equity(self, trades: np.ndarray, rates: np.ndarray) -> np.ndarray:
+        """Profit and loss of every instrument at every close, realized and
+        open, in the account currency, (instrument x time)
+        """
+        shape = (len(self.instruments), self.closes.shape[1] + 1)
+        rows = self.rows(trades["instrument"])
+        units = trades["direction"] * trades["units"]
+        # positions close at their exit bar, open ones never within the history
+        exits = np.where(trades["reason"] == OPEN, shape[1] - 1, trades["exit_bar"])
+        held, cost, realized = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+        np.add.at(held, (rows, trades["entry_bar"]), units)
+        np.add.at(held, (rows, exits), -units)
+        np.add.at(cost, (rows, trades["entry_bar"]), units * trades["entry_price"])
+        np.add.at(cost, (rows, exits), -units * trades["entry_price"])
+        np.add.at(realized, (rows, exits), trades["pl"])
+        held, cost, realized = (
+            np.cumsum(panel, axis=1)[:, :-1] for panel in (held, cost, realized)
+        )
+        return realized + np.where(held != 0, (held * self.closes - cost) * rates, 0.0)
+
+    def run(self) -> "BacktestResult":
+        rates = self.quote_rates()
+        trades = self.size_trades(self.find_trades(self.signals()), rates)
+        return BacktestResult(self, trades, self.equity(trades, rates))
+
+
+class BacktestResult:
+    """Trades and equity curves of a backtest
+
+    params:
+        backtester: TurtleBacktester -> the backtest run
+        trades: np.ndarray -> TRADE_DTYPE records in the order of the instruments
+        instrument_pl: np.ndarray -> (instrument x time) profit and loss in
+            the account currency
+    """
+
+    def __init__(self, backtester, trades, instrument_pl):
+        self.instruments = backtester.instruments
+        self.times = backtester.times
+        self.balance = backtester.balance
+        self.trades = trades
+        self.instrument_pl = instrument_pl
+        self.equity = self.balance + instrument_pl.sum(axis=0)
+
+    def trades_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.trades)
+
+    def equity_frame(self) -> pd.DataFrame:
+        """Profit and loss of every instrument and the account equity per bar"""
+        frame = pd.DataFrame(self.instrument_pl.T, columns=self.instruments)
+        frame["equity"] = self.equity
+        if self.times is not None:
+            frame.index = pd.DatetimeIndex(self.times, name="time")
+        return frame
+
+    def max_drawdown(self) -> float:
+        """Largest fall of the equity from a previous peak, relative to the peak"""
+        if not len(self.equity):
+            return 0.0
+        peaks = np.maximum.accumulate(self.equity)
+        return float(np.max((peaks - self.equity) / peaks))
+
+    def summary(self) -> dict:
+        closed = self.trades[self.trades["reason"] != OPEN]
+        moves = closed["direction"] * (closed["exit_price"] - closed["entry_price"])
+        final = float(self.equity[-1]) if len(self.equity) else self.balance
+        return {
+            "trades": len(self.trades),
+            "open": int(np.sum(self.trades["reason"] == OPEN)),
+            "stop_losses": int(np.sum(closed["reason"] == STOP)),
+            # by the price move, trades sized to 0 units count as well
+            "win_rate": round(float(np.mean(moves > 0)), 4) if len(closed) else None,
+            "final_equity": round(final, 2),
+            "return": round(final / self.balance - 1, 4),
+            "max_drawdown": round(self.max_drawdown(), 4),
+            "pl": {
+                instrument: round(
+                    float(
+                        self.trades["pl"][self.trades["instrument"] == instrument].sum()
+                    ),
+                    2,
+                )
+                for instrument in self.instruments
+            },
+        }
@@ -0,0 +1,58 @@
+"""Incremental Donchian channel"""
+from collections import deque
+
+
+class DonchianChannel:
+    """Highest high and lowest low over the last `window` bars
+
+    Each update is O(1) amortized: the highs are kept in a deque of
+    decreasing values and the lows in a deque of increasing values, so the
+    channel bounds are always at the front and bars leaving the window are
+    dropped from there.
+
+    params:
+        window: int -> number of bars the channel spans
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self.count = 0
+        self._highs = deque()
+        self._lows = deque()
+
+    def update(self, high, low):
+        """Adds the next bar to the channel"""
+        index = self.count
+        highs, lows = self._highs, self._lows
+        while highs and highs[-1][1] <= high:
+            highs.pop()
+        highs.append((index, high))
+        while lows and lows[-1][1] >= low:
+            lows.pop()
+        lows.append((index, low))
+        oldest = index - self.window
+        if highs[0][0] <= oldest:
+            highs.popleft()
+        if lows[0][0] <= oldest:
+            lows.popleft()
+        self.count += 1
+
+    def extend(self, highs, lows):
+        """Adds a sequence of bars, oldest first"""
+        for high, low in zip(highs, lows):
+            self.update(high, low)
+
+    @property
+    def ready(self) -> bool:
+        """Whether the channel spans a full window of bars"""
+        return self.count >= self.window
+
+    @property
+    def upper(self):
+        """Highest high of the window"""
+        return self._highs[0][1]
+
+    @property
+    def lower(self):
+        """Lowest low of the window"""
+        return self._lows[0][1]
@@ -0,0 +1,180 @@
+"""Turtle conditions for every instrument in one vectorized pass"""
+import numpy as np
+
+TURTLE_DTYPE = np.dtype(
+    [
+        ("instrument", "U32"),
+        ("timeframe_high", "f8"),
+        ("timeframe_low", "f8"),
+        ("timeframe_exit_low", "f8"),
+        ("timeframe_exit_high", "f8"),
+        ("atr", "f8"),
+    ]
+)
+
+
+def rolling_sum_last(panel: np.ndarray, window: int) -> np.ndarray:
+    """Sum of the last `window` values of every row of an (instrument x time)
+    panel, nan with fewer values; nan values are skipped
+
+    Runs the running window sum of pandas rolling().sum() over the whole row,
+    one bar at a time for all rows together: additions and removals carry
+    their own Kahan compensation and a window of equal values is their value
+    times the count.  The sum depends on every value that passed through the
+    window, summing the last window alone differs in the last bits.
+    """
+    rows = panel.shape[0]
+    total = np.zeros(rows)
+    add_compensation = np.zeros(rows)
+    remove_compensation = np.zeros(rows)
+    count = np.zeros(rows, dtype=np.int64)
+    same = np.zeros(rows, dtype=np.int64)
+    last = np.full(rows, np.nan)
+    for bar in range(panel.shape[1]):
+        if bar >= window:
+            value = panel[:, bar - window]
+            valid = ~np.isnan(value)
+            y = -value - remove_compensation
+            summed = total + y
+            remove_compensation = np.where(
+                valid, summed - total - y, remove_compensation
+            )
+            total = np.where(valid, summed, total)
+            count -= valid
+        value = panel[:, bar]
+        valid = ~np.isnan(value)
+        y = value - add_compensation
+        summed = total + y
+        add_compensation = np.where(valid, summed - total - y, add_compensation)
+        total = np.where(valid, summed, total)
+        count += valid
+        same = np.where(valid, np.where(value == last, same + 1, 1), same)
+        last = np.where(valid, value, last)
+    total = np.where(same >= count, last * count, total)
+    return np.where(count >= window, total, np.nan)
+
+
+class TurtlePanelProcessor:
+    """Computes what TurtleProcessor does for many instruments at once
+
+    Takes (instrument x time) arrays of highs, lows and closes whose last
+    column is the most recent, still forming bar of every instrument.
+    Instruments with a shorter history are padded with nan on the left.  The
+    channels need more bars than their window, as TurtleProcessor does,
+    channel raises a ValueError for instruments with fewer.
+
+    params:
+        instruments: list -> instrument name of every row
+        highs, lows, closes: np.ndarray -> (instrument x time) price panels
+        entry_point_days: int -> breakout window
+        exit_point_days: int -> exit window
+        atr_window: int -> bars averaged by the ATR
+    """
+
+    def __init__(
+        self,
+        instruments,
+        highs: np.ndarray,
+        lows: np.ndarray,
+        closes: np.ndarray,
+        entry_point_days: int,
+        exit_point_days: int,
+        atr_window: int = 20,
+    ):
+        self.instruments = list(instruments)
+        self.highs = np.asarray(highs, dtype=np.float64)
+        self.lows = np.asarray(lows, dtype=np.float64)
+        self.closes = np.asarray(closes, dtype=np.float64)
+        self.entry_point_days = entry_point_days
+        self.exit_point_days = exit_point_days
+        self.atr_window = atr_window
+        # bars of history of every instrument, the padding left out
+        self.lengths = np.logical_or.accumulate(~np.isnan(self.closes), axis=1).sum(
+            axis=1
+        )
+
+    @classmethod
+    def from_frames(cls, frames: dict, entry_point_days, exit_point_days, **kwargs):
+        """Builds the panel from TurtleProcessor style DataFrames (h, l, c columns)
+        keyed by instrument.  Every instrument is aligned on its own most recent
+        bar, so the windows span the same bars TurtleProcessor would use even if
+        trading calendars differ between instruments.
+        """
+        instruments = list(frames)
+        length = max((len(frame) for frame in frames.values()), default=0)
+        panels = {
+            column: np.full((len(instruments), length), np.nan) for column in "hlc"
+        }
+        for row, instrument in enumerate(instruments):
+            frame = frames[instrument]
+            for column, panel in panels.items():
+                panel[row, length - len(frame) :] = frame[column].to_numpy()
+        return cls(
+            instruments,
+            panels["h"],
+            panels["l"],
+            panels["c"],
+            entry_point_days,
+            exit_point_days,
+            **kwargs,
+        )
+
+    def channel(self, window: int) -> tuple:
+        """Highest high and lowest low over the last `window` completed bars"""
+        short = self.lengths <= window
+        if short.any():
+            names = [self.instruments[row] for row in np.flatnonzero(short)]
+            raise ValueError(
+                f"A {window} bar channel needs {window + 1} bars, not enough "
+                f"history for {', '.join(names)}"
+            )
+        length = self.highs.shape[1]
+        completed = slice(length - window - 1, length - 1)
+        return (
+            np.max(self.highs[:, completed], axis=1),
+            np.min(self.lows[:, completed], axis=1),
+        )
+
+    def true_range(self) -> np.ndarray:
+        """True range panel, the first bar of an instrument uses high - low"""
+        previous_close = np.empty_like(self.closes)
+        previous_close[:, 0] = np.nan
+        previous_close[:, 1:] = self.closes[:, :-1]
+        # fmax ignores the nan of a missing previous close
+        return np.fmax(
+            self.highs - self.lows,
+            np.fmax(
+                np.abs(self.highs - previous_close), np.abs(self.lows - previous_close)
+            ),
+        )
+
+    def atr(self) -> np.ndarray:
+        """Simple average of the last atr_window true ranges, nan if too short,
+        bit for bit the rolling mean of TurtleProcessor
+        """
+        return rolling_sum_last(self.true_range(), self.atr_window) / self.atr_window
+
+    def analyze_turtle_conditions(self) -> np.ndarray:
+        """Turtle conditions of every instrument
+        returns:
+            structured array with TURTLE_DTYPE, one record per instrument
+        """
+        result = np.empty(len(self.instruments), dtype=TURTLE_DTYPE)
+        result["instrument"] = self.instruments
+        result["timeframe_high"], result["timeframe_low"] = self.channel(
+            self.entry_point_days
+        )
+        result["timeframe_exit_high"], result["timeframe_exit_low"] = self.channel(
+            self.exit_point_days
+        )
+        result["atr"] = self.atr()
+        return result
+
+
+def to_pair_dict(conditions: np.ndarray) -> dict:
+    """Converts the structured result to the pair_dict used by the trader"""
+    fields = conditions.dtype.names[1:]
+    return {
+        str(record["instrument"]): {field: float(record[field]) for field in fields}
+        for record in conditions
+    }
@@ -1,5 +1,6 @@
+from automated_trader.data_processor.atr import SIMPLE, AverageTrueRange
+from automated_trader.data_processor.donchian import DonchianChannel
 import pandas as pd
-import numpy as np
 
 
 class TurtleProcessor:
@@ -9,56 +10,67 @@ class TurtleProcessor:
         self.data = data
         self.entry_point_days = entry_point_days
         self.exit_point_days = exit_point_days
+        self.entry_channel = None
+        self.exit_channel = None
+        self.atr = None
 
-    def get_exit_price_conditions(self, highs, lows):
-        """Gets exit price conditions"""
-        sliced_highs = highs.iloc[
-            len(highs) - self.exit_point_days - 1 : len(highs) - 1
-        ]
-        sliced_lows = lows.iloc[len(lows) - self.exit_point_days - 1 : len(lows) - 1]
-        timeframe_high = max(sliced_highs)
-        timeframe_low = min(sliced_lows)
+    def build_channel(self, window: int) -> DonchianChannel:
+        """Donchian channel over the last `window` completed bars.
+        The last row of the data is the still forming bar and is left out, the
+        channel can be kept up to date by updating it with every completed bar.
+        """
+        completed = slice(len(self.data) - window - 1, len(self.data) - 1)
+        channel = DonchianChannel(window)
+        channel.extend(
+            self.data["h"].iloc[completed].to_numpy(),
+            self.data["l"].iloc[completed].to_numpy(),
+        )
+        return channel
+
+    def build_atr(self, window: int = 20, method: str = SIMPLE) -> AverageTrueRange:
+        """Average true range over every bar of the data, the last one included"""
+        atr = AverageTrueRange(window, method)
+        atr.extend(
+            self.data["h"].to_numpy(),
+            self.data["l"].to_numpy(),
+            self.data["c"].to_numpy(),
+        )
+        return atr
+
+    def get_exit_price_conditions(self):
+        """Gets exit price conditions
+        returns:
+            (highest high, lowest low) of the exit channel
+        """
+        self.exit_channel = self.build_channel(self.exit_point_days)
+        timeframe_high = self.exit_channel.upper
+        timeframe_low = self.exit_channel.lower
 
         return timeframe_high, timeframe_low
 
     def analyze_turtle_conditions(self) -> tuple:
         """Check if any turtle conditions are met
         returns:
-             tuple of 3 values:
+             tuple of 5 values:
                  timeframe_high: float
                  timeframe_low: float
+                 timeframe_exit_low: float -> lowest low of the exit channel
+                 timeframe_exit_high: float -> highest high of the exit channel
                  atr: float
         """
         # analyze conditions
-        highs = self.data["h"]
-        lows = self.data["l"]
-
-        sliced_highs = highs.iloc[
-            len(highs) - self.entry_point_days - 1 : len(highs) - 1
-        ]
-        sliced_lows = lows.iloc[len(lows) - self.entry_point_days - 1 : len(lows) - 1]
-
-        timeframe_high = max(sliced_highs)
-        timeframe_low = min(sliced_lows)
+        self.entry_channel = self.build_channel(self.entry_point_days)
+        timeframe_high = self.entry_channel.upper
+        timeframe_low = self.entry_channel.lower
 
-        high_low = self.data["h"] - self.data["l"]
-        high_close = np.abs(self.data["h"] - self.data["c"].shift())
-        low_close = np.abs(self.data["l"] - self.data["c"].shift())
+        self.atr = self.build_atr()
 
-        ranges = pd.concat([high_low, high_close, low_close], axis=1)
-        true_range = np.max(ranges, axis=1)
-
-        atr = true_range.rolling(20).sum() / 20
-        atr = atr.iloc[len(atr) - 1 : len(atr)]
-
-        timeframe_exit_low, timeframe_exit_high = self.get_exit_price_conditions(
-            highs, lows
-        )
+        timeframe_exit_high, timeframe_exit_low = self.get_exit_price_conditions()
 
         return (
             timeframe_high,
             timeframe_low,
             timeframe_exit_low,
             timeframe_exit_high,
-            atr.iloc[0],
+            self.atr.value,
         )
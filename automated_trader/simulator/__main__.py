@@ -0,0 +1,51 @@
+"""Runs the OANDA v20 simulator
+
+python -m automated_trader.simulator --port 8080 --tick-rate 20
+"""
+from automated_trader.simulator.server import SimulatorServer
+import argparse
+
+DEFAULT_INSTRUMENTS = "EUR_USD,GBP_USD,USD_JPY,AUD_USD,USD_CAD,USD_CHF,NZD_USD"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OANDA v20 simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--instruments", default=DEFAULT_INSTRUMENTS)
+    parser.add_argument(
+        "--tick-rate",
+        type=float,
+        default=10.0,
+        help="ticks per second per stream, 0 for as fast as possible",
+    )
+    parser.add_argument("--heartbeat-interval", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = SimulatorServer(
+        (args.host, args.port),
+        instruments=args.instruments.split(","),
+        tick_rate=args.tick_rate,
+        heartbeat_interval=args.heartbeat_interval,
+        seed=args.seed,
+    )
+    print(
+        "Serving the v20 API on {}:{}, use it from oanda.cfg with:\n\n"
+        "[oanda]\naccount_id = {}\naccess_token = simulator\n"
+        "account_type = practice\nhostname = {}\nport = {}\nssl = false\n".format(
+            args.host,
+            server.server_port,
+            server.account.account_id,
+            args.host,
+            server.server_port,
+        )
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""Simulated OANDA account: positions, orders and the transaction log"""
+from automated_trader.simulator.feed import format_price, format_time
+import threading
+import time
+
+ORDER_TYPES = {
+    "MARKET": "MARKET_ORDER",
+    "LIMIT": "LIMIT_ORDER",
+    "MARKET_IF_TOUCHED": "MARKET_IF_TOUCHED_ORDER",
+}
+
+
+def format_units(units: float) -> str:
+    # whole units as v20 sends them, {:g} alone would round large sizes
+    if float(units).is_integer():
+        return str(int(units))
+    return "{:g}".format(units)
+
+
+class SimulatedAccount:
+    """Netting account that fills orders against the simulator prices
+
+    Market orders fill at the current ask (buy) or bid (sell).  Limit and
+    market-if-touched orders fill right away when their price is already
+    reached and otherwise wait in the pending orders until a tick reaches it,
+    or are cancelled right away with a timeInForce of FOK or IOC.
+    stopLossOnFill creates a stop loss order for the opened units.
+
+    params:
+        account_id: str -> id reported by the account endpoints
+        balance: float -> initial balance
+        currency: str -> account currency
+        clock: callable -> epoch seconds the transactions are stamped with
+    """
+
+    def __init__(
+        self,
+        account_id="101-001-0000000-001",
+        balance=100000.0,
+        currency="USD",
+        clock=time.time,
+    ):
+        self.account_id = account_id
+        self.clock = clock
+        self.balance = balance
+        self.currency = currency
+        self.lock = threading.RLock()
+        self.transactions = []
+        self.listeners = []
+        self.positions = {}
+        self.pending_orders = []
+        self.stop_losses = []
+        self.prices = {}
+        # orders in v20 JSON form by id, client ids map to order ids
+        self.orders = {}
+        self.client_order_ids = {}
+
+    @property
+    def last_transaction_id(self) -> str:
+        return str(len(self.transactions))
+
+    def add_listener(self, listener):
+        """Calls listener(transaction) for every new transaction"""
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def record(self, transaction: dict) -> dict:
+        """Appends a transaction to the log and assigns its id"""
+        with self.lock:
+            transaction["id"] = str(len(self.transactions) + 1)
+            transaction["time"] = format_time(self.clock())
+            transaction["accountID"] = self.account_id
+            self.transactions.append(transaction)
+        for listener in list(self.listeners):
+            listener(transaction)
+        return transaction
+
+    def transactions_since(self, transaction_id) -> list:
+        return self.transactions[int(transaction_id) :]
+
+    def transaction(self, transaction_id):
+        index = int(transaction_id) - 1
+        if 0 <= index < len(self.transactions):
+            return self.transactions[index]
+        return None
+
+    def order(self, specifier):
+        """Order by id or by client id prefixed with @, None when unknown"""
+        with self.lock:
+            if specifier.startswith("@"):
+                specifier = self.client_order_ids.get(specifier[1:])
+            return self.orders.get(specifier)
+
+    def pending(self) -> list:
+        """Orders waiting for their price, in v20 JSON form"""
+        with self.lock:
+            return [
+                dict(self.orders[create["id"]]) for create, _, _ in self.pending_orders
+            ]
+
+    def position(self, instrument) -> dict:
+        return self.positions.setdefault(
+            instrument,
+            {"long": [0.0, 0.0], "short": [0.0, 0.0], "pl": 0.0},
+        )
+
+    def unrealized_pl(self, instrument, side=None) -> float:
+        position = self.positions.get(instrument)
+        if position is None or instrument not in self.prices:
+            return 0.0
+        bid, ask = self.prices[instrument]
+        long_units, long_price = position["long"]
+        short_units, short_price = position["short"]
+        long_pl = long_units * (bid - long_price)
+        short_pl = short_units * (ask - short_price)
+        if side == "long":
+            return long_pl
+        if side == "short":
+            return short_pl
+        return long_pl + short_pl
+
+    def summary(self) -> dict:
+        """Account summary in v20 JSON form"""
+        with self.lock:
+            unrealized = sum(self.unrealized_pl(i) for i in self.positions)
+            open_positions = [
+                i
+                for i, p in self.positions.items()
+                if p["long"][0] != 0 or p["short"][0] != 0
+            ]
+            margin_used = sum(
+                abs(self.positions[i]["long"][0] + self.positions[i]["short"][0])
+                * sum(self.prices.get(i, (0.0, 0.0)))
+                / 2
+                * 0.02
+                for i in open_positions
+            )
+            nav = self.balance + unrealized
+            return {
+                "id": self.account_id,
+                "alias": "Simulator",
+                "currency": self.currency,
+                "balance": format_price(self.balance),
+                "NAV": format_price(nav),
+                "unrealizedPL": format_price(unrealized),
+                "pl": format_price(sum(p["pl"] for p in self.positions.values())),
+                "marginRate": "0.02",
+                "marginUsed": format_price(margin_used),
+                "marginAvailable": format_price(nav - margin_used),
+                "openPositionCount": len(open_positions),
+                "openTradeCount": len(open_positions),
+                "pendingOrderCount": len(self.pending_orders) + len(self.stop_losses),
+                "hedgingEnabled": False,
+                "lastTransactionID": self.last_transaction_id,
+            }
+
+    def open_positions(self) -> list:
+        """Open positions in v20 JSON form"""
+        with self.lock:
+            positions = []
+            for instrument, position in self.positions.items():
+                if position["long"][0] == 0 and position["short"][0] == 0:
+                    continue
+                entry = {
+                    "instrument": instrument,
+                    "pl": format_price(position["pl"]),
+                    "unrealizedPL": format_price(self.unrealized_pl(instrument)),
+                }
+                for side in ("long", "short"):
+                    units, price = position[side]
+                    entry[side] = {
+                        "units": format_units(units),
+                        "pl": "0.00000",
+                        "unrealizedPL": format_price(
+                            self.unrealized_pl(instrument, side)
+                        ),
+                    }
+                    if units != 0:
+                        entry[side]["averagePrice"] = format_price(price)
+                positions.append(entry)
+            return positions
+
+    def submit_order(self, order: dict):
+        """Handles an order request body, returns (status, response body)"""
+        with self.lock:
+            order_type = ORDER_TYPES.get(order.get("type"))
+            instrument = order.get("instrument")
+            units = float(order.get("units", 0))
+            if order_type is None or instrument not in self.prices or units == 0:
+                reject = self.record(
+                    {
+                        "type": (order_type or "MARKET_ORDER") + "_REJECT",
+                        "instrument": instrument,
+                        "units": format_units(units),
+                        "rejectReason": (
+                            "UNITS_INVALID"
+                            if units == 0
+                            else "INSTRUMENT_NOT_TRADEABLE"
+                        ),
+                    }
+                )
+                return 400, {
+                    "orderRejectTransaction": reject,
+                    "errorMessage": reject["rejectReason"],
+                    "lastTransactionID": self.last_transaction_id,
+                }
+
+            create = {
+                "type": order_type,
+                "instrument": instrument,
+                "units": format_units(units),
+                "reason": "CLIENT_ORDER",
+            }
+            for field in (
+                "price",
+                "timeInForce",
+                "clientExtensions",
+                "stopLossOnFill",
+                "trailingStopLossOnFill",
+                "takeProfitOnFill",
+            ):
+                if order.get(field) is not None:
+                    create[field] = order[field]
+            create = self.record(create)
+            body = {"orderCreateTransaction": create}
+            self.orders[create["id"]] = {
+                key: create[key]
+                for key in ("id", "instrument", "units", "clientExtensions")
+                if key in create
+            }
+            # orders are typed LIMIT, their create transactions LIMIT_ORDER
+            self.orders[create["id"]].update(
+                {
+                    "type": order["type"],
+                    "createTime": create["time"],
+                    "state": "PENDING",
+                }
+            )
+            client_extensions = order.get("clientExtensions") or {}
+            if client_extensions.get("id"):
+                self.client_order_ids[client_extensions["id"]] = create["id"]
+
+            bid, ask = self.prices[instrument]
+            market = ask if units > 0 else bid
+            if order_type != "MARKET_ORDER":
+                price = float(order["price"])
+                if order_type == "LIMIT_ORDER":
+                    # buy limits fill at or below, sell limits at or above
+                    above = units < 0
+                else:
+                    above = price >= market
+                if not (market >= price if above else market <= price):
+                    if create.get("timeInForce") in ("FOK", "IOC"):
+                        cancel = self.record(
+                            {
+                                "type": "ORDER_CANCEL",
+                                "orderID": create["id"],
+                                "reason": "TIME_IN_FORCE_EXPIRED",
+                            }
+                        )
+                        self.orders[create["id"]].update(
+                            {
+                                "state": "CANCELLED",
+                                "cancellingTransactionID": cancel["id"],
+                                "cancelledTime": cancel["time"],
+                            }
+                        )
+                        body["orderCancelTransaction"] = cancel
+                        body["relatedTransactionIDs"] = [create["id"], cancel["id"]]
+                        body["lastTransactionID"] = self.last_transaction_id
+                        return 201, body
+                    self.pending_orders.append((create, price, above))
+                    body["relatedTransactionIDs"] = [create["id"]]
+                    body["lastTransactionID"] = self.last_transaction_id
+                    return 201, body
+
+            body["orderFillTransaction"] = self.fill(create, market)
+            body["relatedTransactionIDs"] = [
+                create["id"],
+                body["orderFillTransaction"]["id"],
+            ]
+            body["lastTransactionID"] = self.last_transaction_id
+            return 201, body
+
+    def fill(self, order: dict, price: float, reason=None) -> dict:
+        """Fills an order transaction at price, nets it into the position and
+        returns the fill transaction
+        """
+        instrument = order["instrument"]
+        units = float(order["units"])
+        position = self.position(instrument)
+        opposite, same = ("short", "long") if units > 0 else ("long", "short")
+
+        # close the opposite side first, the remainder opens on the same side
+        opposite_units, opposite_price = position[opposite]
+        closed = min(abs(units), abs(opposite_units))
+        closed_units = closed if units > 0 else -closed
+        realized = -closed_units * (price - opposite_price)
+        position[opposite][0] = opposite_units + closed_units
+        opened = units - closed_units
+        same_units, same_price = position[same]
+        if opened:
+            total = same_units + opened
+            position[same] = [total, (same_units * same_price + opened * price) / total]
+        position["pl"] += realized
+        self.balance += realized
+
+        fill = {
+            "type": "ORDER_FILL",
+            "orderID": order["id"],
+            "instrument": instrument,
+            "units": format_units(units),
+            "price": format_price(price),
+            "reason": reason or order["type"],
+            "pl": format_price(realized),
+            "accountBalance": format_price(self.balance),
+        }
+        client_extensions = order.get("clientExtensions")
+        if client_extensions and client_extensions.get("id"):
+            fill["clientOrderID"] = client_extensions["id"]
+        if closed:
+            fill["tradeReduced"] = {
+                "units": format_units(closed_units),
+                "realizedPL": format_price(realized),
+            }
+        if opened:
+            fill["tradeOpened"] = {
+                "tradeID": order["id"],
+                "units": format_units(opened),
+                "price": format_price(price),
+            }
+        fill = self.record(fill)
+        if order["id"] in self.orders:
+            self.orders[order["id"]].update(
+                {
+                    "state": "FILLED",
+                    "fillingTransactionID": fill["id"],
+                    "filledTime": fill["time"],
+                }
+            )
+
+        if position[opposite][0] == 0:
+            self.cancel_stop_losses(instrument, opposite)
+        stop_loss = order.get("stopLossOnFill")
+        if opened and stop_loss:
+            distance = float(stop_loss.get("distance") or 0) or abs(
+                price - float(stop_loss["price"])
+            )
+            stop_order = self.record(
+                {
+                    "type": "STOP_LOSS_ORDER",
+                    "tradeID": order["id"],
+                    "price": format_price(
+                        price - distance if opened > 0 else price + distance
+                    ),
+                    "reason": "ON_FILL",
+                }
+            )
+            # the order that closes the opened units once the stop triggers
+            close = {
+                "id": stop_order["id"],
+                "type": "STOP_LOSS_ORDER",
+                "instrument": instrument,
+                "units": format_units(-opened),
+            }
+            self.stop_losses.append((close, float(stop_order["price"]), same))
+        return fill
+
+    def cancel_stop_losses(self, instrument, side):
+        for stop_loss in list(self.stop_losses):
+            close, _, stop_side = stop_loss
+            if close["instrument"] == instrument and stop_side == side:
+                self.stop_losses.remove(stop_loss)
+                self.record(
+                    {
+                        "type": "ORDER_CANCEL",
+                        "orderID": close["id"],
+                        "reason": "LINKED_TRADE_CLOSED",
+                    }
+                )
+
+    def on_price(self, instrument, bid, ask):
+        """Updates the price of an instrument and fills what it triggers"""
+        with self.lock:
+            self.prices[instrument] = (bid, ask)
+            for pending in list(self.pending_orders):
+                order, price, above = pending
+                if order["instrument"] != instrument:
+                    continue
+                market = ask if float(order["units"]) > 0 else bid
+                if market >= price if above else market <= price:
+                    self.pending_orders.remove(pending)
+                    self.fill(order, market)
+            for stop_loss in list(self.stop_losses):
+                close, trigger, side = stop_loss
+                if close["instrument"] != instrument:
+                    continue
+                if bid <= trigger if side == "long" else ask >= trigger:
+                    self.stop_losses.remove(stop_loss)
+                    self.fill(
+                        close, bid if side == "long" else ask, reason="STOP_LOSS_ORDER"
+                    )
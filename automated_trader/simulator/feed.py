@@ -0,0 +1,210 @@
+"""Synthetic and replayed market data for the simulator"""
+from automated_trader.commons.tick_buffer import parse_time_ns
+from datetime import datetime, timezone
+import math
+import random
+import threading
+import zlib
+
+GRANULARITY_SECONDS = {
+    "S5": 5,
+    "S10": 10,
+    "S15": 15,
+    "S30": 30,
+    "M1": 60,
+    "M2": 120,
+    "M4": 240,
+    "M5": 300,
+    "M10": 600,
+    "M15": 900,
+    "M30": 1800,
+    "H1": 3600,
+    "H2": 7200,
+    "H3": 10800,
+    "H4": 14400,
+    "H6": 21600,
+    "H8": 28800,
+    "H12": 43200,
+    "D": 86400,
+    "W": 604800,
+}
+
+# candle price component, its key and its shift from mid in spreads
+PRICE_COMPONENTS = (("M", "mid", 0), ("B", "bid", -0.5), ("A", "ask", 0.5))
+
+
+def format_time(timestamp: float) -> str:
+    """Formats an epoch timestamp the way v20 does (RFC3339, nanoseconds)"""
+    return (
+        datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")
+        + "000Z"
+    )
+
+
+def parse_time(value: str) -> float:
+    """Parses a v20 time parameter, RFC3339 or UNIX, to an epoch timestamp"""
+    if "T" in value:
+        return parse_time_ns(value) / 1e9
+    return float(value)
+
+
+def format_price(price: float) -> str:
+    return "{:.5f}".format(price)
+
+
+def price_message(instrument, timestamp, bid, ask):
+    """Builds a pricing stream PRICE message"""
+    return {
+        "type": "PRICE",
+        "time": format_time(timestamp),
+        "bids": [{"price": format_price(bid), "liquidity": 10000000}],
+        "asks": [{"price": format_price(ask), "liquidity": 10000000}],
+        "closeoutBid": format_price(bid),
+        "closeoutAsk": format_price(ask),
+        "status": "tradeable",
+        "tradeable": True,
+        "instrument": instrument,
+    }
+
+
+class SyntheticPriceFeed:
+    """Random walk prices for a set of instruments
+
+    params:
+        instruments: list -> instrument names
+        start_price: float or dict -> initial mid price, per instrument when a dict
+        volatility: float -> standard deviation of a single step, relative
+        spread: float -> bid/ask spread, relative
+        seed: int -> seed of the random generator for reproducible runs
+    """
+
+    def __init__(
+        self, instruments, start_price=1.0, volatility=0.0001, spread=0.0001, seed=None
+    ):
+        self.instruments = list(instruments)
+        self.volatility = volatility
+        self.spread = spread
+        self.random = random.Random(seed)
+        self.mids = {
+            instrument: (
+                start_price[instrument]
+                if isinstance(start_price, dict)
+                else start_price
+            )
+            for instrument in self.instruments
+        }
+        self.lock = threading.Lock()
+
+    def next_price(self, instrument):
+        """Moves the price of an instrument one step and returns (bid, ask)"""
+        with self.lock:
+            mid = self.mids[instrument]
+            mid *= 1 + self.random.gauss(0, self.volatility)
+            self.mids[instrument] = mid
+        half_spread = mid * self.spread / 2
+        return round(mid - half_spread, 5), round(mid + half_spread, 5)
+
+    def current_price(self, instrument):
+        """Returns the current (bid, ask) of an instrument without moving it"""
+        mid = self.mids[instrument]
+        half_spread = mid * self.spread / 2
+        return round(mid - half_spread, 5), round(mid + half_spread, 5)
+
+    def ticks(self, instruments):
+        """Endless (instrument, bid, ask) ticks, round robin over the instruments"""
+        sequence = 0
+        while True:
+            instrument = instruments[sequence % len(instruments)]
+            sequence += 1
+            yield (instrument, *self.next_price(instrument))
+
+
+class ReplayPriceFeed:
+    """Replays recorded ticks in their recorded order
+
+    params:
+        ticks: list -> (instrument, bid, ask) tuples
+        loop: bool -> start over once the recording is exhausted
+    """
+
+    def __init__(self, ticks, loop=False):
+        self.recorded = list(ticks)
+        self.loop = loop
+        self.instruments = sorted({tick[0] for tick in self.recorded})
+        self.prices = {}
+        for instrument, bid, ask in self.recorded:
+            self.prices.setdefault(instrument, (bid, ask))
+
+    def current_price(self, instrument):
+        return self.prices[instrument]
+
+    def ticks(self, instruments):
+        """Recorded (instrument, bid, ask) ticks of the requested instruments"""
+        wanted = set(instruments)
+        while True:
+            for instrument, bid, ask in self.recorded:
+                if instrument in wanted:
+                    self.prices[instrument] = (bid, ask)
+                    yield instrument, bid, ask
+            if not self.loop:
+                return
+
+
+class CandleGenerator:
+    """Deterministic synthetic candles, the same instrument and time always
+    give the same candle, so repeated and overlapping requests agree.
+
+    params:
+        volatility: float -> relative size of the per candle noise
+        spread: float -> bid/ask spread, relative
+    """
+
+    def __init__(self, volatility=0.004, spread=0.0001):
+        self.volatility = volatility
+        self.spread = spread
+
+    def mid(self, instrument, index):
+        """Mid price at the end of candle number index of a series"""
+        seed = zlib.crc32(instrument.encode("utf-8"))
+        phase = (seed % 1000) / 1000 * 2 * math.pi
+        noise = random.Random(seed * 1000003 + index).gauss(0, self.volatility)
+        drift = 0.06 * math.sin(index / 40 + phase) + 0.03 * math.sin(index / 9 + phase)
+        return (1 + seed % 50 / 100) * math.exp(drift + noise)
+
+    def candles(self, instrument, granularity, start, end, now, price="M"):
+        """Candles in v20 JSON form whose start lies within [start, end)
+        params:
+            granularity: str -> v20 granularity, e.g. D or M1
+            start, end, now: float -> epoch timestamps
+            price: str -> any combination of M(id), B(id) and A(sk)
+        """
+        step = GRANULARITY_SECONDS[granularity]
+        candles = []
+        for index in range(math.ceil(start / step), math.ceil(end / step)):
+            candle_start = index * step
+            if candle_start > now:
+                break
+            open_, close = self.mid(instrument, index - 1), self.mid(instrument, index)
+            wick = random.Random(index).random() * self.volatility
+            ohlc = (
+                open_,
+                max(open_, close) * (1 + wick),
+                min(open_, close) * (1 - wick),
+                close,
+            )
+            candle = {
+                "complete": candle_start + step <= now,
+                "volume": 1000 + index % 500,
+                "time": format_time(candle_start),
+            }
+            for component, key, shift in PRICE_COMPONENTS:
+                if component in price:
+                    candle[key] = {
+                        name: format_price(value * (1 + shift * self.spread))
+                        for name, value in zip("ohlc", ohlc)
+                    }
+            candles.append(candle)
+        return candles
+
+    def last_close(self, instrument, granularity, now):
+        return self.mid(instrument, math.floor(now / GRANULARITY_SECONDS[granularity]))
@@ -0,0 +1,401 @@
+"""Replays ticks through the live decision code against a simulated broker"""
+from automated_trader.api_client.client import StreamingClient
+from automated_trader.api_client.order_pipeline import PendingOrder
+from automated_trader.api_client.transactions import (
+    FillEvent,
+    TransactionEvent,
+    TransactionStream,
+)
+from automated_trader.commons.account_cache import AccountCache
+from automated_trader.commons.logger import logger
+from automated_trader.commons.metrics import MetricsRegistry
+from automated_trader.commons.tick_buffer import format_time_ns
+from automated_trader.commons.trading_utils import process_open_positions
+from automated_trader.simulator.account import SimulatedAccount
+from automated_trader.simulator.feed import SyntheticPriceFeed, format_price
+from concurrent.futures import Future
+import itertools
+import logging
+import time
+
+
+class SimulatedClock:
+    """Time of a replay, moved forward by the ticks, never backwards
+
+    params:
+        now_ns: int -> epoch nanoseconds to start at
+    """
+
+    def __init__(self, now_ns: int = 0):
+        self.now_ns = now_ns
+
+    def advance(self, now_ns: int):
+        if now_ns > self.now_ns:
+            self.now_ns = now_ns
+
+    def time(self) -> float:
+        """Epoch seconds, in place of time.time"""
+        return self.now_ns / 1e9
+
+
+class SimulatedBroker:
+    """Stands in for the order, position and account endpoints of OANDA
+
+    A SimulatedAccount stamped with the simulated clock fills the orders.
+    Its transactions are held back until dispatch() publishes them to the
+    subscribers, the way the transaction stream delivers them after the
+    order response.
+
+    params:
+        clock: SimulatedClock -> time of the replay
+        balance: float -> initial balance
+    """
+
+    def __init__(self, clock, balance=100000.0):
+        self.clock = clock
+        self.account = SimulatedAccount(balance=balance, clock=clock.time)
+        self.transactions = TransactionStream(None, last_id=0)
+        self.queued = []
+        self.account.add_listener(self.queued.append)
+
+    def subscribe(self, callback, event_type=TransactionEvent):
+        """Calls callback(event) for every published event of event_type"""
+        self.transactions.subscribe(callback, event_type)
+
+    def dispatch(self):
+        """Publishes the transactions made since the last dispatch"""
+        while self.queued:
+            queued = self.queued[:]
+            # the account appends to this very list, empty it in place
+            del self.queued[:]
+            for transaction in queued:
+                self.transactions.publish(transaction)
+
+    def on_price(self, instrument, bid, ask):
+        """Fills the pending and stop loss orders the price reaches"""
+        self.account.on_price(instrument, bid, ask)
+
+    def create_order(
+        self,
+        instrument,
+        units,
+        price=None,
+        sl_distance=None,
+        tsl_distance=None,
+        tp_price=None,
+        comment=None,
+        touch=False,
+        client_id=None,
+        time_in_force=None,
+    ) -> dict:
+        """Places an order the way OANDAClient.create_order would
+        returns:
+            the fill, cancel, create or reject transaction in its JSON form
+        """
+        order = {"instrument": instrument, "units": str(units)}
+        if price is None:
+            order["type"] = "MARKET"
+        else:
+            order["type"] = "MARKET_IF_TOUCHED" if touch else "LIMIT"
+            order["price"] = format_price(price)
+        if sl_distance is not None:
+            order["stopLossOnFill"] = {"distance": str(sl_distance)}
+        if client_id is not None:
+            order["clientExtensions"] = {"id": client_id}
+        if time_in_force is not None:
+            order["timeInForce"] = time_in_force
+        _, body = self.account.submit_order(order)
+        for key in (
+            "orderRejectTransaction",
+            "orderFillTransaction",
+            "orderCancelTransaction",
+            "orderCreateTransaction",
+        ):
+            if key in body:
+                return body[key]
+        return None
+
+    def get_positions(self) -> list:
+        return self.account.open_positions()
+
+    def summary(self) -> dict:
+        return self.account.summary()
+
+
+class ImmediatePipeline:
+    """Order pipeline of a replay, orders are placed with the broker right
+    away and come back resolved
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.counter = itertools.count(1)
+
+    def next_client_id(self) -> str:
+        return f"replay-{next(self.counter)}"
+
+    def submit(self, instrument, units, client_id=None, **kwargs) -> PendingOrder:
+        order = PendingOrder(
+            client_id or self.next_client_id(),
+            instrument,
+            units,
+            kwargs,
+            Future(),
+        )
+        order.attempts = 1
+        order.sent_at = time.perf_counter_ns()
+        result = self.broker.create_order(
+            instrument, units, client_id=order.client_id, **kwargs
+        )
+        order.acked_at = time.perf_counter_ns()
+        order.future.set_result(result)
+        return order
+
+    async def join(self):
+        pass
+
+
+class ReplayClient(StreamingClient):
+    """StreamingClient whose orders, positions and account summary come from
+    a SimulatedBroker; it reads no config file and makes no request
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.account_id = broker.account.account_id
+        self.account_summary = broker.summary()
+        self.stop_stream = False
+        self.ticks = 0
+        self.time = None
+        self.setup_order_path(
+            AccountCache(broker.summary, summary=self.account_summary),
+            ImmediatePipeline(broker),
+            MetricsRegistry(),
+        )
+
+    def create_order(self, instrument, units, suppress=False, ret=False, **kwargs):
+        order = self.broker.create_order(instrument, units, **kwargs)
+        if ret is True:
+            return order
+
+    def get_positions(self) -> list:
+        return self.broker.get_positions()
+
+    def fetch_open_positions(self):
+        return (
+            self.broker.get_positions(),
+            self.broker.account.last_transaction_id,
+            {order["id"] for order in self.broker.account.pending()},
+        )
+
+    def schedule_reconcile(self):
+        self.reconcile_positions()
+
+
+class ReplayResult:
+    """Outcome of a replay"""
+
+    def __init__(self, engine, ticks, elapsed, start_ns, end_ns):
+        self.ticks = ticks
+        self.elapsed = elapsed
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+        self.account = engine.broker.account
+        self.transactions = list(self.account.transactions)
+        self.fills = [
+            transaction
+            for transaction in self.transactions
+            if transaction["type"] == "ORDER_FILL"
+        ]
+        self.positions = dict(engine.client.position_book.positions)
+        self.summary_at_end = self.account.summary()
+
+    @property
+    def simulated_seconds(self) -> float:
+        if self.start_ns is None:
+            return 0.0
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def realized_pl(self) -> dict:
+        """Realized profit and loss per instrument"""
+        pl = {}
+        for fill in self.fills:
+            pl[fill["instrument"]] = pl.get(fill["instrument"], 0.0) + float(fill["pl"])
+        return pl
+
+    def summary(self) -> dict:
+        return {
+            "ticks": self.ticks,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "simulated_seconds": round(self.simulated_seconds, 3),
+            "speedup": (
+                round(self.simulated_seconds / self.elapsed, 1)
+                if self.elapsed
+                else None
+            ),
+            "fills": len(self.fills),
+            "stop_losses": sum(
+                fill["reason"] == "STOP_LOSS_ORDER" for fill in self.fills
+            ),
+            "balance": float(self.summary_at_end["balance"]),
+            "nav": float(self.summary_at_end["NAV"]),
+            "positions": self.positions,
+            "realized_pl": self.realized_pl(),
+        }
+
+
+class ReplayEngine:
+    """Drives StreamingClient.on_success, and with it the exit checks, with
+    recorded or synthetic ticks on a simulated clock
+
+    Every tick first reaches the broker, which fills the limit and stop loss
+    orders it triggers, and then on_success with the thresholds of its
+    instrument, exactly as stream_data routes a live price.  With
+    monitor_interval, process_open_positions also checks the open positions
+    at the latest prices every monitor_interval simulated seconds, like the
+    former monitor process did.
+
+    params:
+        pair_dict: dict -> per instrument thresholds as built by process_all_pairs
+        entry_point_days, exit_point_days: int -> passed on to on_success
+        speed: float -> simulated seconds per wall clock second, 1 replays in
+            real time, None as fast as possible
+        balance: float -> initial balance of the simulated account
+        monitor_interval: float -> simulated seconds between two runs of
+            process_open_positions, None never runs it
+        log_level: int -> level of the package logger during a run, the
+            decision code logs about every tick of a breakout
+    """
+
+    def __init__(
+        self,
+        pair_dict,
+        entry_point_days=None,
+        exit_point_days=None,
+        speed=None,
+        balance=100000.0,
+        monitor_interval=None,
+        log_level=logging.WARNING,
+    ):
+        self.pair_dict = pair_dict
+        self.entry_point_days = entry_point_days
+        self.exit_point_days = exit_point_days
+        self.speed = speed
+        self.monitor_interval = monitor_interval
+        self.log_level = log_level
+        self.clock = SimulatedClock()
+        self.broker = SimulatedBroker(self.clock, balance)
+        self.client = ReplayClient(self.broker)
+        # the subscriptions of the trader
+        self.broker.subscribe(self.client.position_book.on_fill, FillEvent)
+        self.broker.subscribe(self.client.account_cache.on_fill, FillEvent)
+        self.broker.subscribe(self.client.on_order_event)
+        self.prices = {}
+
+    def settle(self):
+        """Publishes the new transactions and refreshes a summary they outdated"""
+        self.broker.dispatch()
+        if self.client.account_cache.invalidated:
+            self.client.account_cache.refresh()
+
+    def run(self, ticks) -> ReplayResult:
+        """Replays (instrument, time_ns, bid, ask) ticks in their order"""
+        level = logger.level
+        logger.setLevel(self.log_level)
+        try:
+            return self._run(ticks)
+        finally:
+            logger.setLevel(level)
+
+    def _run(self, ticks) -> ReplayResult:
+        client = self.client
+        broker = self.broker
+        clock = self.clock
+        pair_dict = self.pair_dict
+        monitor_ns = int(self.monitor_interval * 1e9) if self.monitor_interval else None
+        next_monitor = None
+        start_ns = None
+        count = 0
+        client.schedule_reconcile()
+        began = time.perf_counter()
+        for instrument, time_ns, bid, ask in ticks:
+            if start_ns is None:
+                start_ns = time_ns
+                next_monitor = time_ns + monitor_ns if monitor_ns else None
+            clock.advance(time_ns)
+            if self.speed:
+                ahead = (time_ns - start_ns) / 1e9 / self.speed - (
+                    time.perf_counter() - began
+                )
+                if ahead > 0.001:
+                    time.sleep(ahead)
+            count += 1
+            self.prices[instrument] = (bid, ask)
+            broker.on_price(instrument, bid, ask)
+            if broker.queued:
+                self.settle()
+
+            thresholds = pair_dict.get(instrument)
+            if thresholds is not None:
+                client.ticks = count
+                client.time = format_time_ns(time_ns)
+                client.on_success(
+                    client.time,
+                    bid,
+                    ask,
+                    pair=instrument,
+                    timeframe_high=thresholds["timeframe_high"],
+                    timeframe_low=thresholds["timeframe_low"],
+                    atr=thresholds["atr"],
+                    entry_point_days=self.entry_point_days,
+                    exit_point_days=self.exit_point_days,
+                    timeframe_exit_low=thresholds["timeframe_exit_low"],
+                    timeframe_exit_high=thresholds["timeframe_exit_high"],
+                )
+                if broker.queued:
+                    self.settle()
+
+            if next_monitor is not None and clock.now_ns >= next_monitor:
+                next_monitor = clock.now_ns + monitor_ns
+                positions = broker.get_positions()
+                if positions:
+                    process_open_positions(
+                        client,
+                        positions,
+                        pair_dict,
+                        self.exit_point_days,
+                        prices=self.prices,
+                    )
+                    self.settle()
+        return ReplayResult(
+            self, count, time.perf_counter() - began, start_ns, clock.now_ns
+        )
+
+
+def archive_ticks(archive, start_ns=None, end_ns=None, instruments=None):
+    """(instrument, time_ns, bid, ask) ticks of a TickArchive, in received order"""
+    for names, records in archive.ticks(start_ns, end_ns, instruments):
+        yield from zip(
+            [names[i] for i in records["instrument_id"].tolist()],
+            records["time"].tolist(),
+            records["bid"].tolist(),
+            records["ask"].tolist(),
+        )
+
+
+def synthetic_ticks(
+    instruments, start_ns, end_ns, interval=1.0, start_price=1.0, seed=None
+):
+    """(instrument, time_ns, bid, ask) ticks of a SyntheticPriceFeed, every
+    instrument ticks once per interval seconds
+    params:
+        start_price: float or dict -> initial mid price, per instrument when a dict
+    """
+    feed = SyntheticPriceFeed(instruments, start_price=start_price, seed=seed)
+    step = int(interval * 1e9) // len(instruments)
+    time_ns = start_ns
+    for instrument, bid, ask in feed.ticks(list(instruments)):
+        if time_ns >= end_ns:
+            return
+        yield instrument, time_ns, bid, ask
+        time_ns += step
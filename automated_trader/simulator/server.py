@@ -0,0 +1,391 @@
+"""Local stand-in for the OANDA v20 HTTP endpoints used by the package"""
+from automated_trader.simulator.account import SimulatedAccount
+from automated_trader.simulator.feed import (
+    GRANULARITY_SECONDS,
+    CandleGenerator,
+    SyntheticPriceFeed,
+    format_time,
+    parse_time,
+    price_message,
+)
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+import json
+import queue
+import re
+import threading
+import time
+
+# most candles v20 returns for a single request
+MAX_CANDLES = 5000
+
+
+class SimulatorRequestHandler(BaseHTTPRequestHandler):
+    """Dispatches requests to the routes of the SimulatorServer"""
+
+    protocol_version = "HTTP/1.1"
+    # headers and body go out as separate writes, Nagle would delay the body
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        for route_method, pattern, handler in self.server.routes:
+            match = pattern.fullmatch(url.path)
+            if route_method == method and match is not None:
+                try:
+                    handler(self, query, *map(unquote, match.groups()))
+                except (BrokenPipeError, ConnectionResetError):
+                    # client went away mid stream
+                    self.close_connection = True
+                return
+        self.send_json(404, {"errorMessage": f"No route for {method} {url.path}"})
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def send_line(self, body):
+        line = json.dumps(body).encode("utf-8") + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SimulatorServer(ThreadingHTTPServer):
+    """HTTP server that stands in for the OANDA v20 REST and streaming API
+
+    Serves the endpoints the package uses: account instruments, summary and
+    open positions, instrument candles, market/limit/market-if-touched orders
+    and their lookup by id or @clientID, single transactions, REST prices,
+    the pricing stream and the transaction stream with its sinceid catch-up.
+    Orders are filled by a SimulatedAccount against the ticks of the price
+    feed.  Point a v20.Context at it with ssl disabled, e.g.
+    v20.Context("127.0.0.1", server.server_port, ssl=False, token="test"),
+    or add hostname/port/ssl to the oanda.cfg (see OANDAClient).
+
+    params:
+        address: tuple -> (host, port) to bind, port 0 picks a free one
+        instruments: list -> instruments the server knows about
+        tick_rate: float -> ticks per second per stream, 0 sends as fast as possible
+        heartbeat_interval: float -> seconds between two heartbeats
+        max_ticks: int -> ends every stream after this many ticks
+        seed: int -> seed of the synthetic price feed
+        drop_after: int -> aborts every stream connection after this many
+            ticks, without terminating the response
+        stall_after: int -> goes silent, heartbeats included, after this many
+            ticks of every stream until stall_duration passed
+        stall_duration: float -> seconds a stalled stream stays silent
+        feed: price feed -> replaces the synthetic feed, e.g. a ReplayPriceFeed
+        account: SimulatedAccount -> account orders are filled on
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        instruments=("EUR_USD", "GBP_USD", "USD_JPY"),
+        tick_rate=10.0,
+        heartbeat_interval=5.0,
+        max_ticks=None,
+        seed=None,
+        drop_after=None,
+        stall_after=None,
+        stall_duration=60.0,
+        feed=None,
+        account=None,
+    ):
+        super().__init__(address, SimulatorRequestHandler)
+        self.tick_rate = tick_rate
+        self.heartbeat_interval = heartbeat_interval
+        self.max_ticks = max_ticks
+        self.drop_after = drop_after
+        self.stall_after = stall_after
+        self.stall_duration = stall_duration
+        self.candles = CandleGenerator()
+        if feed is None:
+            now = time.time()
+            feed = SyntheticPriceFeed(
+                instruments,
+                start_price={
+                    instrument: self.candles.last_close(instrument, "D", now)
+                    for instrument in instruments
+                },
+                seed=seed,
+            )
+        self.feed = feed
+        self.instruments = list(feed.instruments)
+        self.account = account if account is not None else SimulatedAccount()
+        for instrument in self.instruments:
+            self.account.on_price(instrument, *self.feed.current_price(instrument))
+
+        self.routes = []
+        account_path = r"/v3/accounts/([^/]+)"
+        self.add_route("GET", account_path + r"/instruments", self.handle_instruments)
+        self.add_route("GET", account_path + r"/summary", self.handle_summary)
+        self.add_route("GET", account_path, self.handle_summary)
+        self.add_route("GET", account_path + r"/openPositions", self.handle_positions)
+        self.add_route("POST", account_path + r"/orders", self.handle_order)
+        self.add_route(
+            "GET", account_path + r"/pendingOrders", self.handle_pending_orders
+        )
+        self.add_route(
+            "GET", account_path + r"/orders/([^/]+)", self.handle_order_lookup
+        )
+        self.add_route(
+            "GET", account_path + r"/transactions/(\d+)", self.handle_transaction
+        )
+        self.add_route("GET", account_path + r"/pricing", self.handle_pricing)
+        self.add_route(
+            "GET", account_path + r"/pricing/stream", self.handle_pricing_stream
+        )
+        self.add_route(
+            "GET", account_path + r"/transactions/sinceid", self.handle_transactions
+        )
+        self.add_route(
+            "GET",
+            account_path + r"/transactions/stream",
+            self.handle_transaction_stream,
+        )
+        self.add_route("GET", r"/v3/instruments/([^/]+)/candles", self.handle_candles)
+        self.closing = False
+        self._thread = None
+
+    def handle_error(self, request, client_address):
+        # clients hanging up on a stream are expected, not worth a traceback
+        pass
+
+    def add_route(self, method, pattern, handler):
+        """Registers handler(request, query, *path_params) for a path regex"""
+        self.routes.append((method, re.compile(pattern), handler))
+
+    def start(self):
+        """Serves requests on a background thread"""
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="oanda-simulator", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving and releases the socket"""
+        self.closing = True
+        self.shutdown()
+        self.server_close()
+
+    def requested_instruments(self, query):
+        return [
+            instrument
+            for instrument in query.get("instruments", "").split(",")
+            if instrument in self.instruments
+        ]
+
+    def handle_instruments(self, request, query, account_id):
+        instruments = [
+            {
+                "name": instrument,
+                "type": "CURRENCY",
+                "displayName": instrument.replace("_", "/"),
+                "pipLocation": -2 if instrument.endswith("JPY") else -4,
+                "displayPrecision": 5,
+                "tradeUnitsPrecision": 0,
+                "minimumTradeSize": "1",
+                "maximumOrderUnits": "100000000",
+                "marginRate": "0.02",
+            }
+            for instrument in self.instruments
+        ]
+        request.send_json(
+            200,
+            {
+                "instruments": instruments,
+                "lastTransactionID": self.account.last_transaction_id,
+            },
+        )
+
+    def handle_summary(self, request, query, account_id):
+        request.send_json(
+            200,
+            {
+                "account": self.account.summary(),
+                "lastTransactionID": self.account.last_transaction_id,
+            },
+        )
+
+    def handle_positions(self, request, query, account_id):
+        request.send_json(
+            200,
+            {
+                "positions": self.account.open_positions(),
+                "lastTransactionID": self.account.last_transaction_id,
+            },
+        )
+
+    def handle_pending_orders(self, request, query, account_id):
+        request.send_json(
+            200,
+            {
+                "orders": self.account.pending(),
+                "lastTransactionID": self.account.last_transaction_id,
+            },
+        )
+
+    def handle_order(self, request, query, account_id):
+        status, body = self.account.submit_order(request.read_json().get("order", {}))
+        request.send_json(status, body)
+
+    def handle_order_lookup(self, request, query, account_id, specifier):
+        order = self.account.order(specifier)
+        if order is None:
+            request.send_json(
+                404, {"errorMessage": f"Order {specifier} does not exist"}
+            )
+            return
+        request.send_json(
+            200,
+            {"order": order, "lastTransactionID": self.account.last_transaction_id},
+        )
+
+    def handle_transaction(self, request, query, account_id, transaction_id):
+        transaction = self.account.transaction(transaction_id)
+        if transaction is None:
+            request.send_json(
+                404, {"errorMessage": f"Transaction {transaction_id} does not exist"}
+            )
+            return
+        request.send_json(
+            200,
+            {
+                "transaction": transaction,
+                "lastTransactionID": self.account.last_transaction_id,
+            },
+        )
+
+    def handle_transactions(self, request, query, account_id):
+        if "id" not in query:
+            request.send_json(400, {"errorMessage": "Missing id"})
+            return
+        request.send_json(
+            200,
+            {
+                "transactions": self.account.transactions_since(query["id"]),
+                "lastTransactionID": self.account.last_transaction_id,
+            },
+        )
+
+    def handle_transaction_stream(self, request, query, account_id):
+        transactions = queue.Queue()
+        self.account.add_listener(transactions.put)
+        try:
+            request.start_stream()
+            while not self.closing:
+                try:
+                    request.send_line(transactions.get(timeout=self.heartbeat_interval))
+                except queue.Empty:
+                    request.send_line(
+                        {
+                            "type": "HEARTBEAT",
+                            "lastTransactionID": self.account.last_transaction_id,
+                            "time": format_time(time.time()),
+                        }
+                    )
+            request.end_stream()
+        finally:
+            self.account.remove_listener(transactions.put)
+
+    def handle_candles(self, request, query, instrument):
+        granularity = query.get("granularity", "S5")
+        if instrument not in self.instruments:
+            request.send_json(400, {"errorMessage": f"Invalid instrument {instrument}"})
+            return
+        now = time.time()
+        step = GRANULARITY_SECONDS[granularity]
+        count = int(query.get("count", 500))
+        # v20 takes from and to, from and count, to and count or count alone
+        if "from" in query:
+            start = parse_time(query["from"])
+            if "to" in query:
+                end = parse_time(query["to"])
+            else:
+                end = min(now, start + count * step)
+        else:
+            end = parse_time(query["to"]) if "to" in query else now
+            start = end - count * step
+        start = max(start, end - MAX_CANDLES * step)
+        candles = self.candles.candles(
+            instrument, granularity, start, end, now, price=query.get("price", "M")
+        )
+        request.send_json(
+            200,
+            {"instrument": instrument, "granularity": granularity, "candles": candles},
+        )
+
+    def handle_pricing(self, request, query, account_id):
+        now = time.time()
+        prices = [
+            price_message(instrument, now, *self.feed.current_price(instrument))
+            for instrument in self.requested_instruments(query)
+        ]
+        request.send_json(200, {"prices": prices, "time": format_time(now)})
+
+    def handle_pricing_stream(self, request, query, account_id):
+        instruments = self.requested_instruments(query)
+        request.start_stream()
+        if query.get("snapshot", "true").lower() == "true":
+            now = time.time()
+            for instrument in instruments:
+                request.send_line(
+                    price_message(instrument, now, *self.feed.current_price(instrument))
+                )
+        ticks = 0
+        last_heartbeat = time.monotonic()
+        interval = 1 / self.tick_rate if self.tick_rate else 0
+        prices = self.feed.ticks(instruments) if instruments else iter(())
+        for instrument, bid, ask in prices:
+            if self.max_ticks is not None and ticks >= self.max_ticks:
+                break
+            self.account.on_price(instrument, bid, ask)
+            request.send_line(price_message(instrument, time.time(), bid, ask))
+            ticks += 1
+            if ticks == self.drop_after:
+                request.close_connection = True
+                return
+            if ticks == self.stall_after:
+                time.sleep(self.stall_duration)
+                request.close_connection = True
+                return
+            if time.monotonic() - last_heartbeat >= self.heartbeat_interval:
+                request.send_line(
+                    {"type": "HEARTBEAT", "time": format_time(time.time())}
+                )
+                last_heartbeat = time.monotonic()
+            if interval:
+                time.sleep(interval)
+        request.end_stream()
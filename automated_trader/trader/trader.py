@@ -1,12 +1,18 @@
 from automated_trader.api_client.client import OANDAClient, StreamingClient
-from automated_trader.data_processor.processor import TurtleProcessor
+from automated_trader.api_client.supervisor import StreamSupervisor
+from automated_trader.api_client.transactions import (
+    FillEvent,
+    TransactionStream,
+    log_event,
+)
+from automated_trader.data_processor.panel import TurtlePanelProcessor, to_pair_dict
 from automated_trader.commons.logger import logger
-from automated_trader.commons.trading_utils import monitor_open_positions
-from datetime import datetime
-from pytz import timezone
-from multiprocessing import Process
+from automated_trader.commons.metrics import MetricsServer, registry
+from automated_trader.commons.scheduler import DailyScheduler
+from automated_trader.commons.threshold_table import ThresholdTable
 import asyncio
-import datetime as dt
+import configparser
+import time
 
 
 class AutomatedTrader:
@@ -15,73 +21,90 @@ class AutomatedTrader:
     def __init__(self, file_path, entry_point_days, exit_point_days):
         self.client = OANDAClient(file_path=file_path)
         self.streaming_client = StreamingClient(file_path)
+        self.stream_supervisor = StreamSupervisor(self.streaming_client)
+        self.transaction_stream = TransactionStream(self.streaming_client)
+        self.transaction_stream.subscribe(
+            self.streaming_client.position_book.on_fill, FillEvent
+        )
+        self.transaction_stream.subscribe(
+            self.streaming_client.account_cache.on_fill, FillEvent
+        )
+        self.transaction_stream.subscribe(self.streaming_client.on_order_event)
+        self.transaction_stream.subscribe(log_event)
         self.entry_point_days = entry_point_days
         self.exit_point_days = exit_point_days
-
-        self.pair_dict = self.process_all_pairs(self.entry_point_days)
-
-        # start monitor thread
-        self.monitor_thread = Process(
-            target=monitor_open_positions,
-            args=(
-                self.client,
-                self.exit_point_days,
-                self.pair_dict,
-            ),
+        self.reprocess_duration = registry.summary(
+            "reprocess_duration_seconds",
+            "Duration of processing the turtle thresholds of every pair",
         )
-        self.monitor_thread.start()
+        self.metrics_server = self.start_metrics_server(file_path)
 
-    @staticmethod
-    def trigger_pair_reprocessing():
-        """Checks if the time has passed 5 PM EST"""
-        tz = timezone("EST")
-        current_datetime = datetime.now(tz)
-        current = dt.time(
-            current_datetime.hour, current_datetime.minute, current_datetime.second
-        )
-        start = dt.time(17, 0, 0)
-        end = dt.time(17, 5, 0)
-        return start <= current <= end
+        self.pair_dict = self.process_all_pairs(self.entry_point_days)
+        # the stream reads the thresholds from here, new ones are published
+        # without interrupting it
+        self.threshold_table = ThresholdTable.create(self.client.instruments)
+        self.threshold_table.publish(self.pair_dict)
 
     def run(self):
         """Runs the automated trader"""
         logger.log(20, f"Pair dictionary values: \n{self.pair_dict}")
+        # the pairs are reprocessed on the scheduler thread once the daily
+        # candle closes, the new thresholds reach the stream through the table
+        self.scheduler = DailyScheduler()
+        self.scheduler.add_job("reprocess pairs", self.reprocess_pairs)
+        self.scheduler.start()
         while 1:
+            # one long-lived stream for every instrument, each price is routed
+            # to its own entry and exit thresholds.  The supervisor reconnects
+            # it whenever it drops.
+            self.streaming_client.stop_stream = False
+            asyncio.run(self.stream())
 
-            if self.trigger_pair_reprocessing():
-                # kill thread
-                self.monitor_thread.terminate()
-                # reprocess pairs
-                self.pair_dict = self.process_all_pairs(
-                    self.entry_point_days, self.exit_point_days
-                )
-                # restart thread
-                self.monitor_thread = Process(
-                    target=monitor_open_positions,
-                    args=(
-                        self.client,
-                        self.exit_point_days,
-                        self.pair_dict,
-                    ),
-                )
-                self.monitor_thread.start()
-                logger.log(
-                    20, f"Reprocessing Pair dictionary values: \n{self.pair_dict}"
-                )
+    async def stream(self):
+        """Streams prices and transactions until the pricing stream is stopped"""
+        # the transaction stream resumes after the last transaction it saw
+        transactions = asyncio.ensure_future(self.transaction_stream.run())
+        try:
+            await self.stream_supervisor.run(
+                ",".join(self.threshold_table.instruments),
+                threshold_table=self.threshold_table,
+                entry_point_days=self.entry_point_days,
+                exit_point_days=self.exit_point_days,
+            )
+        finally:
+            transactions.cancel()
 
-            for pair in self.pair_dict:
-                asyncio.run(
-                    self.streaming_client.stream_data(
-                        pair,
-                        stop=1,
-                        pair=pair,
-                        timeframe_high=self.pair_dict[pair]["timeframe_high"],
-                        timeframe_low=self.pair_dict[pair]["timeframe_low"],
-                        atr=self.pair_dict[pair]["atr"],
-                        entry_point_days=self.entry_point_days,
-                        exit_point_days=self.exit_point_days,
-                    )
-                )
+    def start_metrics_server(self, file_path):
+        """Serves the metrics at http://host:port/metrics when the [metrics]
+        section of the config file sets a port, host defaults to 127.0.0.1
+        returns:
+            MetricsServer, None without a port
+        """
+        config = configparser.ConfigParser()
+        config.read(file_path)
+        if "metrics" not in config or "port" not in config["metrics"]:
+            return None
+        section = config["metrics"]
+        server = MetricsServer(
+            registry, (section.get("host", "127.0.0.1"), section.getint("port"))
+        ).start()
+        logger.log(20, f"Serving metrics on port {server.server_port}")
+        return server
+
+    def reprocess_pairs(self):
+        """Recomputes the thresholds of every pair and publishes them"""
+        pair_dict = self.process_all_pairs(self.entry_point_days, self.exit_point_days)
+        version = self.threshold_table.publish(pair_dict)
+        self.pair_dict = pair_dict
+        logger.log(
+            20,
+            f"Reprocessing Pair dictionary values (version {version}): \n{pair_dict}",
+        )
+        logger.log(
+            20,
+            "Tick to order latency percentiles (microseconds): \n"
+            f"{self.streaming_client.latency.percentiles()}",
+        )
 
     def process_all_pairs(self, entry_point_days=55, exit_point_days=20) -> dict:
         """Process all pairs
@@ -91,26 +114,13 @@ class AutomatedTrader:
             pair_dict: dict -> required data for all pairings
         """
 
-        pair_dict = {}
-
-        for pair in self.client.instruments:
-            data = self.client.get_historical_data(instrument=pair, granularity="D")
-
-            # Do turtle processing
-            turtle_processor = TurtleProcessor(data, entry_point_days, exit_point_days)
-            (
-                timeframe_high,
-                timeframe_low,
-                timeframe_exit_low,
-                timeframe_exit_high,
-                atr,
-            ) = turtle_processor.analyze_turtle_conditions()
+        start = time.perf_counter()
+        frames = self.client.fetch_historical_data(self.client.instruments, "D")
 
-            pair_dict[pair] = dict()
-            pair_dict[pair]["timeframe_high"] = timeframe_high
-            pair_dict[pair]["timeframe_low"] = timeframe_low
-            pair_dict[pair]["timeframe_exit_low"] = timeframe_exit_low
-            pair_dict[pair]["timeframe_exit_high"] = timeframe_exit_high
-            pair_dict[pair]["atr"] = atr
+        # Do turtle processing for every pair in one pass over the price panel
+        self.turtle_conditions = TurtlePanelProcessor.from_frames(
+            frames, entry_point_days, exit_point_days
+        ).analyze_turtle_conditions()
+        self.reprocess_duration.observe(time.perf_counter() - start)
 
-        return pair_dict
+        return to_pair_dict(self.turtle_conditions)
@@ -0,0 +1,156 @@
+"""Backtests the turtle settings of app.py over years of daily bars
+
+Generates 20 years of synthetic daily candles for 28 instruments, or loads
+the daily mid candles of a candle cache directory, and runs the vectorized
+TurtleBacktester with entry_point_days=70 and exit_point_days=8.  A plain
+bar by bar loop over the same signals runs as well, to check that both find
+the same trades and to compare their speed.
+
+    python benchmarks/backtest.py [candle cache directory of a host and account]
+"""
+from automated_trader.commons.candle_store import CandleStore
+from automated_trader.data_processor.backtest import OPEN, TurtleBacktester
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+YEARS = 20
+CURRENCIES = ["EUR", "USD", "JPY", "GBP", "AUD", "CAD", "CHF", "NZD"]
+INSTRUMENTS = [
+    f"{base}_{quote}"
+    for i, base in enumerate(CURRENCIES)
+    for quote in CURRENCIES[i + 1 :]
+]
+
+
+def synthetic_frames(instruments, days, seed=7):
+    """Random walks with slowly changing trends, one bar per calendar day"""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2005-01-01", periods=days, freq="D")
+    frames = {}
+    for instrument in instruments:
+        trend = 0.0003 * np.sin(np.arange(days) / rng.uniform(60, 250))
+        closes = np.exp(np.cumsum(trend + rng.normal(0, 0.006, days)))
+        closes *= 100 if "JPY" in instrument else 1.2
+        opens = np.r_[closes[0], closes[:-1]] * (1 + rng.normal(0, 0.0005, days))
+        wicks = rng.uniform(0, 0.004, (2, days))
+        frames[instrument] = pd.DataFrame(
+            {
+                "o": opens,
+                "h": np.maximum(opens, closes) * (1 + wicks[0]),
+                "l": np.minimum(opens, closes) * (1 - wicks[1]),
+                "c": closes,
+            },
+            index=index,
+        )
+    return frames
+
+
+def cached_frames(directory):
+    store = CandleStore(directory)
+    frames = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith("-D-M.npy"):
+            candles = store.load(name[: -len("-D-M.npy")], "D", "M")
+            frames[name[: -len("-D-M.npy")]] = pd.DataFrame(
+                {column: candles[column] for column in "ohlc"},
+                index=pd.DatetimeIndex(candles["time"].astype("datetime64[ns]")),
+            )
+    return frames
+
+
+def bar_by_bar(backtester, signals):
+    """(row, direction, entry_bar, exit_bar, reason) of the trades, one bar at a time"""
+    trades = []
+    for row in range(len(backtester.instruments)):
+        position = None
+        for bar in range(backtester.closes.shape[1]):
+            if position is None:
+                if signals["longs"][row, bar] or signals["shorts"][row, bar]:
+                    direction = 1 if signals["longs"][row, bar] else -1
+                    level = signals["entry_high" if direction == 1 else "entry_low"]
+                    price = level[row, bar]
+                    if not np.isnan(backtester.opens[row, bar]):
+                        price = (max if direction == 1 else min)(
+                            backtester.opens[row, bar], price
+                        )
+                    stop = price - direction * round(2 * signals["atr"][row, bar], 5)
+                    position = (direction, bar, stop)
+                continue
+            direction, entry, stop = position
+            if direction == 1:
+                level, extreme = (
+                    signals["long_exit"][row, bar],
+                    backtester.lows[row, bar],
+                )
+            else:
+                level, extreme = (
+                    signals["short_exit"][row, bar],
+                    backtester.highs[row, bar],
+                )
+            stopped = direction * (extreme - stop) <= 0
+            exited = direction * (level - extreme) > 0
+            if stopped or exited:
+                closer = stopped and (not exited or direction * (level - stop) <= 0)
+                trades.append(
+                    (row, direction, entry, bar, "stop" if closer else "exit")
+                )
+                position = None
+        if position is not None:
+            last = backtester.closes.shape[1] - 1
+            trades.append((row, position[0], position[1], last, OPEN))
+    return trades
+
+
+def main():
+    if len(sys.argv) > 1:
+        frames = cached_frames(sys.argv[1])
+    else:
+        frames = synthetic_frames(INSTRUMENTS, YEARS * 365)
+
+    began = time.perf_counter()
+    backtester = TurtleBacktester.from_frames(frames, 70, 8)
+    print(
+        f"{len(frames)} instruments x {backtester.closes.shape[1]:,} daily bars, "
+        f"panels built in {time.perf_counter() - began:.3f}s"
+    )
+    began = time.perf_counter()
+    result = backtester.run()
+    elapsed = time.perf_counter() - began
+
+    signals = backtester.signals()
+    began = time.perf_counter()
+    reference = bar_by_bar(backtester, signals)
+    looped = time.perf_counter() - began
+    found = [
+        (
+            backtester.instruments.index(trade["instrument"]),
+            int(trade["direction"]),
+            int(trade["entry_bar"]),
+            int(trade["exit_bar"]),
+            str(trade["reason"]),
+        )
+        for trade in result.trades
+    ]
+    summary = result.summary()
+    print(
+        f"backtest in {elapsed:.3f}s "
+        f"({backtester.closes.size / elapsed:,.0f} bars/sec), bar by bar loop "
+        f"over its signals {looped:.3f}s, same trades: "
+        f"{sorted(found) == sorted(reference)}"
+    )
+    print(
+        f"{summary['trades']:,} trades ({summary['stop_losses']:,} stop "
+        f"losses, {summary['open']} open), win rate {summary['win_rate']}, "
+        f"return {summary['return']:.2%}, max drawdown "
+        f"{summary['max_drawdown']:.2%}"
+    )
+    yearly = result.equity_frame()["equity"].resample("YE").last()
+    print(yearly.map("{:,.0f}".format).to_string())
+
+
+if __name__ == "__main__":
+    main()
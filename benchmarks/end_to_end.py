@@ -0,0 +1,129 @@
+"""Load test of the streaming and order path against the local simulator
+
+Builds the clients from a simulator oanda.cfg, computes the turtle thresholds
+from the simulated candles, streams ticks for every instrument through
+StreamingClient.on_success with thresholds tight enough to trade, and times
+create_order round trips and the throughput of the order pipeline.  Prints
+the tick to order latency percentiles of every instrument and stage.
+
+    python benchmarks/end_to_end.py
+"""
+from automated_trader.api_client.client import OANDAClient, StreamingClient
+from automated_trader.data_processor.processor import TurtleProcessor
+from automated_trader.simulator.server import SimulatorServer
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+INSTRUMENTS = ["EUR_USD", "GBP_USD", "USD_JPY", "AUD_USD", "USD_CAD", "USD_CHF"]
+TICKS = 2000
+ORDERS = 200
+
+
+def write_config(server, directory):
+    """oanda.cfg of the simulator, with the candle cache in directory, the
+    synthetic candles never mix with the real ones
+    """
+    path = os.path.join(directory, "oanda.cfg")
+    with open(path, "w") as config:
+        config.write(
+            "[oanda]\naccount_id = {}\naccess_token = benchmark\n"
+            "account_type = practice\nhostname = 127.0.0.1\nport = {}\n"
+            "ssl = false\ncandle_cache = {}\n".format(
+                server.account.account_id,
+                server.server_port,
+                os.path.join(directory, "candles"),
+            )
+        )
+    return path
+
+
+def main():
+    server = SimulatorServer(instruments=INSTRUMENTS, tick_rate=0, seed=7).start()
+    with tempfile.TemporaryDirectory() as directory:
+        run(server, write_config(server, directory))
+    server.stop()
+
+
+def run(server, config):
+    client = OANDAClient(config)
+    streaming_client = StreamingClient(config)
+
+    pair_dict = {}
+    start = time.perf_counter()
+    for pair in client.instruments:
+        data = client.get_historical_data(instrument=pair, granularity="D")
+        high, low, exit_low, exit_high, atr = TurtleProcessor(
+            data, 70, 8
+        ).analyze_turtle_conditions()
+        bid = server.feed.current_price(pair)[0]
+        # a band around the current price, so the random walk breaks out
+        pair_dict[pair] = dict(
+            timeframe_high=bid * 1.0005,
+            timeframe_low=bid * 0.9995,
+            timeframe_exit_low=exit_low,
+            timeframe_exit_high=exit_high,
+            atr=atr,
+        )
+    print(f"historical data + turtle processing: {time.perf_counter() - start:.2f}s")
+
+    async def stream():
+        await streaming_client.stream_data(
+            ",".join(pair_dict), stop=TICKS, pair_dict=pair_dict
+        )
+        # orders placed by on_success are still on their way
+        await streaming_client.order_pipeline.join()
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(stream())
+    elapsed = time.perf_counter() - start
+    print(
+        f"streamed {TICKS} ticks through on_success in {elapsed:.2f}s "
+        f"({TICKS / elapsed:,.0f} ticks/sec), "
+        f"{len(server.account.transactions)} transactions"
+    )
+    for instrument, stages in streaming_client.latency.percentiles().items():
+        print(
+            f"  {instrument}: "
+            + ", ".join(
+                f"{stage} p50 {summary['p50']:.0f}us p99 {summary['p99']:.0f}us"
+                for stage, summary in stages.items()
+            )
+        )
+
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(ORDERS):
+            start = time.perf_counter()
+            client.create_order(INSTRUMENTS[i % len(INSTRUMENTS)], 100, suppress=True)
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(
+        f"create_order: median {latencies[len(latencies) // 2] * 1e3:.2f}ms, "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1e3:.2f}ms"
+    )
+
+    async def pipeline():
+        orders = [
+            await streaming_client.order_pipeline.enqueue(
+                INSTRUMENTS[i % len(INSTRUMENTS)], 100
+            )
+            for i in range(ORDERS)
+        ]
+        await asyncio.gather(*orders)
+
+    start = time.perf_counter()
+    asyncio.run(pipeline())
+    elapsed = time.perf_counter() - start
+    print(
+        f"order pipeline ({streaming_client.order_pipeline.concurrency} in "
+        f"flight): {ORDERS} orders in {elapsed:.2f}s ({ORDERS / elapsed:,.0f}/sec)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Benchmarks the per tick cost of logging in on_success
+
+Times the tick level log statement of on_success with the previous print
+to stdout (a file here), a synchronous file handler, the queue logger with
+every tick kept and the queue logger with the default tick sampling.  Every
+variant writes to a file of its own in a temporary directory.
+
+    python benchmarks/logging_overhead.py
+"""
+from automated_trader.commons.latency import LogLinearHistogram
+from automated_trader.commons.logger import (
+    NonBlockingQueueHandler,
+    Sampler,
+    StructuredFormatter,
+)
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import time
+
+TICKS = 100000
+PAIR = "EUR_USD"
+
+
+def run(name, log_tick):
+    histogram = LogLinearHistogram()
+    bid = 1.13456
+    start = time.perf_counter()
+    for i in range(TICKS):
+        before = time.perf_counter_ns()
+        log_tick(bid + i * 1e-5)
+        histogram.record(time.perf_counter_ns() - before)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<28} mean {histogram.mean():7.0f}ns  p99 "
+        f"{histogram.percentile(99):7.0f}ns  p99.9 {histogram.percentile(99.9):8.0f}ns"
+        f"  ({TICKS / elapsed:,.0f} ticks/sec)"
+    )
+
+
+def file_logger(name, handler):
+    logger = logging.getLogger(f"benchmark.{name}")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.addHandler(handler)
+    return logger
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        run("no logging", lambda bid: None)
+
+        with open(os.path.join(directory, "stdout.txt"), "w") as stdout:
+
+            def print_tick(bid):
+                print(f"Bid price: {bid}\nPair: {PAIR}", file=stdout)
+
+            run("print", print_tick)
+
+        handler = logging.FileHandler(os.path.join(directory, "sync.log"))
+        handler.setFormatter(StructuredFormatter())
+        sync = file_logger("sync", handler)
+        run(
+            "synchronous file handler",
+            lambda bid: sync.log(
+                10, "Bid price: %s Pair: %s", bid, PAIR, extra={"category": "tick"}
+            ),
+        )
+        handler.close()
+
+        for name, rates in (
+            ("queue, every tick", {}),
+            ("queue, 1 in 100 ticks", {"tick": 100}),
+        ):
+            log_queue = queue.Queue(maxsize=TICKS)
+            handler = logging.FileHandler(os.path.join(directory, f"{name}.log"))
+            handler.setFormatter(StructuredFormatter())
+            listener = logging.handlers.QueueListener(log_queue, handler)
+            listener.start()
+            queued = file_logger(name, NonBlockingQueueHandler(log_queue))
+            sampler = Sampler(rates)
+
+            def queue_tick(bid):
+                if sampler.sample("tick"):
+                    queued.log(
+                        10,
+                        "Bid price: %s Pair: %s",
+                        bid,
+                        PAIR,
+                        extra={"category": "tick", "pair": PAIR, "bid": bid},
+                    )
+
+            run(name, queue_tick)
+            start = time.perf_counter()
+            listener.stop()
+            handler.close()
+            print(
+                f"{'':<28} listener drained the queue in {time.perf_counter() - start:.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
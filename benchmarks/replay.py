@@ -0,0 +1,69 @@
+"""Replays a day of ticks of every instrument through on_success
+
+Generates a day of synthetic ticks, one per second per instrument, or reads
+the ticks of a tick archive directory, and replays them as fast as possible
+through StreamingClient.on_success and process_open_positions against the
+simulated broker.  The thresholds are a band around the first price of every
+instrument, tight enough to trade.
+
+    python benchmarks/replay.py [archive directory]
+"""
+from automated_trader.commons.tick_recorder import DAY_NS, TickArchive
+from automated_trader.simulator.replay import (
+    ReplayEngine,
+    archive_ticks,
+    synthetic_ticks,
+)
+import sys
+import time
+
+INSTRUMENTS = ["EUR_USD", "GBP_USD", "USD_JPY", "AUD_USD", "USD_CAD", "USD_CHF"]
+
+
+def band(prices):
+    return {
+        instrument: dict(
+            timeframe_high=price * 1.01,
+            timeframe_low=price * 0.99,
+            timeframe_exit_low=price * 0.995,
+            timeframe_exit_high=price * 1.005,
+            atr=price * 0.01,
+        )
+        for instrument, price in prices.items()
+    }
+
+
+def main():
+    if len(sys.argv) > 1:
+        archive = TickArchive(sys.argv[1])
+        ticks = list(archive_ticks(archive))
+        prices = {}
+        for instrument, _, bid, _ in ticks:
+            prices.setdefault(instrument, bid)
+    else:
+        start = (time.time_ns() // DAY_NS - 1) * DAY_NS
+        prices = {instrument: 1.0 + 0.1 * i for i, instrument in enumerate(INSTRUMENTS)}
+        ticks = list(
+            synthetic_ticks(
+                INSTRUMENTS, start, start + DAY_NS, start_price=prices, seed=4
+            )
+        )
+
+    engine = ReplayEngine(band(prices), 70, 8, monitor_interval=1.0)
+    result = engine.run(ticks)
+    summary = result.summary()
+    print(
+        f"replayed {summary['ticks']:,} ticks ({summary['simulated_seconds'] / 3600:.1f}"
+        f" simulated hours, {len(prices)} instruments) in "
+        f"{summary['elapsed_seconds']:.2f}s, {summary['speedup']:,.0f}x real time, "
+        f"{result.elapsed / result.ticks * 1e6:.1f}us per tick"
+    )
+    print(
+        f"{summary['fills']} fills ({summary['stop_losses']} stop losses), "
+        f"balance {summary['balance']:,.2f}, NAV {summary['nav']:,.2f}"
+    )
+    print(f"open positions: {summary['positions']}")
+
+
+if __name__ == "__main__":
+    main()
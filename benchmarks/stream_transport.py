@@ -0,0 +1,60 @@
+"""Benchmarks the threaded pricing stream transport against the local simulator
+
+Reports the tick throughput and how late a 10ms housekeeping task on the same
+event loop wakes up while the stream is being consumed.
+
+    python benchmarks/stream_transport.py
+"""
+from automated_trader.api_client.transport import ThreadedStreamReader
+from automated_trader.simulator.server import SimulatorServer
+import asyncio
+import time
+import v20
+
+TICKS = 50000
+
+
+async def housekeeping(lags, done):
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - start - 0.01)
+
+
+async def consume(ctx):
+    lags = []
+    done = asyncio.Event()
+    task = asyncio.create_task(housekeeping(lags, done))
+    reader = ThreadedStreamReader(
+        lambda: ctx.pricing.stream("sim", snapshot=False, instruments="EUR_USD,GBP_USD")
+    )
+    ticks = 0
+    start = time.perf_counter()
+    async for msg_type, msg in reader:
+        if msg_type == "pricing.ClientPrice":
+            ticks += 1
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    done.set()
+    await task
+    return ticks, elapsed, lags
+
+
+def main():
+    server = SimulatorServer(tick_rate=0, max_ticks=TICKS).start()
+    ctx = v20.Context("127.0.0.1", server.server_port, ssl=False, token="benchmark")
+    try:
+        ticks, elapsed, lags = asyncio.run(consume(ctx))
+    finally:
+        server.stop()
+    lags.sort()
+    print(f"ticks: {ticks} in {elapsed:.2f}s -> {ticks / elapsed:,.0f} ticks/sec")
+    if lags:
+        print(
+            f"housekeeping wake-up lag: median {lags[len(lags) // 2] * 1e3:.2f}ms, "
+            f"max {lags[-1] * 1e3:.2f}ms over {len(lags)} wake-ups"
+        )
+
+
+if __name__ == "__main__":
+    main()
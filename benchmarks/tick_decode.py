@@ -0,0 +1,59 @@
+"""Benchmarks decoding pricing stream lines: v20 objects vs the raw fast path
+
+Compares the ticks/sec of the previous per tick work (v20 ClientPrice objects,
+.dict() lookups and the format/parse round trip of on_success) against
+PriceDecoder.decode_line.
+
+    python benchmarks/tick_decode.py
+"""
+from automated_trader.api_client.decoder import PriceDecoder
+from automated_trader.commons.tick_buffer import TickRingBuffer
+from automated_trader.simulator.feed import SyntheticPriceFeed, price_message
+import json
+import time
+import v20
+
+TICKS = 100000
+INSTRUMENTS = ["EUR_USD", "GBP_USD", "USD_JPY", "AUD_USD", "USD_CAD"]
+
+
+def make_lines():
+    feed = SyntheticPriceFeed(INSTRUMENTS, seed=1)
+    now = time.time()
+    lines = []
+    for i in range(TICKS):
+        instrument = INSTRUMENTS[i % len(INSTRUMENTS)]
+        message = price_message(
+            instrument, now + i / 1000, *feed.next_price(instrument)
+        )
+        lines.append(json.dumps(message).encode("utf-8"))
+    return lines
+
+
+def v20_path(lines):
+    ctx = v20.Context("localhost", ssl=False)
+    for line in lines:
+        msg = ctx.pricing.ClientPrice.from_dict(json.loads(line.decode("utf-8")), ctx)
+        bid = float(msg.bids[0].dict()["price"])
+        float(msg.asks[0].dict()["price"])
+        bid = float("{:.5f}".format(bid))
+
+
+def raw_path(lines):
+    decoder = PriceDecoder(TickRingBuffer(INSTRUMENTS))
+    for line in lines:
+        decoder.decode_line(line)
+        round(decoder.bid, 5)
+
+
+def main():
+    lines = make_lines()
+    for name, path in (("v20 objects", v20_path), ("raw decoder", raw_path)):
+        start = time.perf_counter()
+        path(lines)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>12}: {TICKS / elapsed:>12,.0f} ticks/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmarks the tick recorder at full multi-instrument rates
+
+Records synthetic ticks of every instrument across a UTC day boundary as
+fast as the calling thread can, times the per tick cost of record() on the
+calling thread and how long the writer thread needs to catch up, and reads
+the archive back.
+
+    python benchmarks/tick_recorder.py
+"""
+from automated_trader.commons.latency import LogLinearHistogram
+from automated_trader.commons.tick_recorder import DAY_NS, TickArchive, TickRecorder
+from automated_trader.simulator.feed import SyntheticPriceFeed
+import os
+import tempfile
+import time
+
+TICKS = 1_000_000
+INSTRUMENTS = ["EUR_USD", "GBP_USD", "USD_JPY", "AUD_USD", "USD_CAD", "USD_CHF"]
+
+
+def main():
+    feed = SyntheticPriceFeed(INSTRUMENTS, seed=1)
+    prices = [
+        (INSTRUMENTS[i % len(INSTRUMENTS)], *feed.next_price(INSTRUMENTS[i % 6]))
+        for i in range(10_000)
+    ]
+    # the last ticks of a day and the first of the next
+    start = (time.time_ns() // DAY_NS) * DAY_NS - 50_000_000_000
+    step = 100_000_000_000 // TICKS
+
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = TickRecorder(directory).start()
+        histogram = LogLinearHistogram()
+        began = time.perf_counter()
+        for i in range(TICKS):
+            instrument, bid, ask = prices[i % len(prices)]
+            before = time.perf_counter_ns()
+            recorder.record(instrument, start + i * step, bid, ask, 1e7, 1e7)
+            histogram.record(time.perf_counter_ns() - before)
+        recorded = time.perf_counter() - began
+        recorder.stop()
+        stopped = time.perf_counter() - began
+        print(
+            f"record(): {TICKS:,} ticks in {recorded:.2f}s "
+            f"({TICKS / recorded:,.0f} ticks/sec), mean {histogram.mean():.0f}ns, "
+            f"p99 {histogram.percentile(99)}ns, p99.9 {histogram.percentile(99.9)}ns"
+        )
+        print(
+            f"writer caught up {stopped - recorded:.2f}s later, "
+            f"{recorder.recorded:,} written, {recorder.dropped} dropped"
+        )
+
+        archive = TickArchive(directory)
+        began = time.perf_counter()
+        total = 0
+        for day in archive.days():
+            instruments, records = archive.load(day)
+            size = os.path.getsize(os.path.join(directory, f"{day}.ticks"))
+            total += len(records)
+            print(f"  {day}: {len(records):,} ticks, {size / 1e6:.1f}MB")
+        middle = start + TICKS // 2 * step
+        window = sum(
+            len(records)
+            for _, records in archive.ticks(middle, middle + 1000 * step, ["EUR_USD"])
+        )
+        print(
+            f"read back {total:,} ticks and a 1000 tick window ({window} EUR_USD) "
+            f"in {(time.perf_counter() - began) * 1e3:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Fixtures running the clients against the local simulator"""
+from automated_trader.simulator.server import SimulatorServer
+import os
+
+import pytest
+
+INSTRUMENTS = ["EUR_USD", "GBP_USD", "USD_JPY"]
+
+
+def write_config(server, directory, **options):
+    """oanda.cfg pointing at the simulator, extra [oanda] keys from options"""
+    path = os.path.join(directory, "oanda.cfg")
+    options.setdefault("candle_cache", os.path.join(directory, "candles"))
+    with open(path, "w") as config:
+        config.write(
+            "[oanda]\naccount_id = {}\naccess_token = test\n"
+            "account_type = practice\nhostname = 127.0.0.1\nport = {}\n"
+            "ssl = false\n".format(server.account.account_id, server.server_port)
+        )
+        for key, value in options.items():
+            config.write(f"{key} = {value}\n")
+    return path
+
+
+@pytest.fixture
+def simulator():
+    """Starts SimulatorServers with the given arguments, stops them afterwards"""
+    servers = []
+
+    def start(**kwargs):
+        kwargs.setdefault("instruments", INSTRUMENTS)
+        kwargs.setdefault("seed", 1)
+        server = SimulatorServer(**kwargs).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def config(tmp_path):
+    """Writes the oanda.cfg of a simulator into the test directory"""
+
+    def make(server, **options):
+        return write_config(server, str(tmp_path), **options)
+
+    return make
@@ -0,0 +1,61 @@
+from automated_trader.data_processor.backtest import EXIT, TRADE_DTYPE, TurtleBacktester
+
+import numpy as np
+import pytest
+
+from test_processor import candles
+
+
+def backtester(prices, **kwargs):
+    rng = np.random.default_rng(5)
+    frames = {
+        instrument: candles(rng, 600, price) for instrument, price in prices.items()
+    }
+    return TurtleBacktester.from_frames(frames, 20, 10, **kwargs)
+
+
+def test_profits_are_converted_to_the_account_currency():
+    tester = backtester({"EUR_USD": 1.1, "USD_JPY": 110.0, "EUR_JPY": 120.0})
+    result = tester.run()
+    trades = result.trades
+    assert len(trades) and (trades["units"] > 0).all()
+
+    usd_jpy = tester.closes[tester.instruments.index("USD_JPY")]
+    rates = np.where(
+        trades["instrument"] == "EUR_USD", 1.0, 1.0 / usd_jpy[trades["exit_bar"]]
+    )
+    expected = (
+        trades["units"]
+        * trades["direction"]
+        * (trades["exit_price"] - trades["entry_price"])
+        * rates
+    )
+    np.testing.assert_allclose(trades["pl"], expected, rtol=1e-12)
+    # open trades are marked at the last close, like the equity curve
+    assert result.equity[-1] == pytest.approx(tester.balance + trades["pl"].sum())
+
+
+def test_missing_conversion_instrument_raises():
+    tester = backtester({"EUR_USD": 1.1, "EUR_GBP": 0.85})
+    with pytest.raises(ValueError, match="GBP_USD"):
+        tester.run()
+    assert backtester({"EUR_GBP": 0.85}, account_currency="GBP").run().trades.size
+
+
+def test_no_trade_once_the_balance_is_gone():
+    tester = backtester({"EUR_USD": 1.1}, balance=1000.0)
+    trades = np.zeros(3, dtype=TRADE_DTYPE)
+    trades["instrument"] = "EUR_USD"
+    trades["direction"] = 1
+    trades["entry_bar"] = [30, 50, 70]
+    trades["exit_bar"] = [40, 60, 80]
+    trades["atr"] = 0.01
+    trades["entry_price"] = 1.0
+    # the first trade loses more than the balance
+    trades["exit_price"] = [0.9, 1.1, 1.1]
+    trades["reason"] = EXIT
+    sized = tester.size_trades(trades, np.ones(tester.closes.shape))
+
+    assert sized["units"][0] == 25000
+    assert sized["pl"][0] == pytest.approx(-2500.0)
+    assert list(sized["units"][1:]) == [0, 0]
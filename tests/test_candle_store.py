@@ -0,0 +1,69 @@
+from automated_trader.api_client.client import OANDAClient
+from automated_trader.commons.candle_store import CANDLE_DTYPE, CandleStore
+from automated_trader.commons.rate_limiter import TokenBucket
+import os
+
+import numpy as np
+
+
+def records(times):
+    candles = np.zeros(len(times), dtype=CANDLE_DTYPE)
+    candles["time"] = times
+    candles["c"] = np.arange(len(times), dtype=float)
+    return candles
+
+
+class CountingBucket(TokenBucket):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.acquired = 0
+
+    def acquire(self, tokens=1):
+        self.acquired += tokens
+        return super().acquire(tokens)
+
+
+def test_append_replaces_a_file_that_was_read(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.append("EUR_USD", "D", "M", records([1, 2, 3]))
+    stored = store.read("EUR_USD", "D", "M")
+    # no map of the old file is left open while it is replaced
+    assert not isinstance(stored, np.memmap)
+    assert store.append("EUR_USD", "D", "M", records([2, 3, 4, 5])) == 2
+    assert list(store.load("EUR_USD", "D", "M")["time"]) == [1, 2, 3, 4, 5]
+    assert list(stored["time"]) == [1, 2, 3]
+    assert store.last_time("EUR_USD", "D", "M") == 5
+
+
+def test_cache_is_kept_per_host_and_account(simulator, config, tmp_path):
+    server = simulator()
+    client = OANDAClient(config(server))
+    data = client.get_historical_data(instrument="EUR_USD", granularity="D")
+    assert len(data)
+
+    directory = os.path.join(
+        str(tmp_path), "candles", f"127.0.0.1-{server.account.account_id}"
+    )
+    assert client.candle_store.directory == directory
+    assert os.listdir(directory)
+    assert os.listdir(os.path.join(str(tmp_path), "candles")) == [
+        os.path.basename(directory)
+    ]
+
+
+def test_every_page_of_candles_takes_a_token(simulator, config):
+    server = simulator()
+    client = OANDAClient(config(server))
+    client.rate_limiter = CountingBucket(rate=1000)
+    client.max_candles = 10
+    requests = []
+    candles = client.ctx.instrument.candles
+    client.ctx.instrument.candles = lambda *args, **kwargs: (
+        requests.append(kwargs["fromTime"]) or candles(*args, **kwargs)
+    )
+
+    data = client.fetch_historical_data(["EUR_USD"], "D")["EUR_USD"]
+    assert len(data) > 3 * client.max_candles
+    assert len(requests) > 3
+    assert client.rate_limiter.acquired == len(requests)
+    assert set(client.rate_limited) == {"EUR_USD"}
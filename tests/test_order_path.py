@@ -0,0 +1,244 @@
+from automated_trader.api_client.client import StreamingClient
+from automated_trader.commons.account_cache import AccountCache
+from automated_trader.commons.metrics import MetricsRegistry
+from automated_trader.commons.order_state import (
+    CLOSING,
+    FLAT,
+    OPEN,
+    PENDING,
+    OrderStateMachine,
+)
+from automated_trader.data_processor.panel import TurtlePanelProcessor, to_pair_dict
+from automated_trader.simulator.replay import ReplayEngine
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def thresholds(entry_point_days=70, exit_point_days=8):
+    """Thresholds as process_all_pairs gets them, from daily candles whose
+    entry channel spans 0.8 to 1.2 and whose exit channel spans 0.99 to 1.01
+    """
+    length = entry_point_days + 1
+    narrow = np.arange(length) >= length - exit_point_days - 1
+    frame = pd.DataFrame(
+        {
+            "h": np.where(narrow, 1.01, 1.2),
+            "l": np.where(narrow, 0.99, 0.8),
+            "c": np.ones(length),
+        },
+        index=pd.date_range("2024-01-01", periods=length, freq="D"),
+    )
+    panel = TurtlePanelProcessor.from_frames(
+        {"EUR_USD": frame}, entry_point_days, exit_point_days
+    )
+    return to_pair_dict(panel.analyze_turtle_conditions())["EUR_USD"]
+
+
+THRESHOLDS = thresholds()
+
+
+def engine_with_position(units=1000):
+    """ReplayEngine whose broker holds a EUR_USD position opened at 1.0"""
+    engine = ReplayEngine({"EUR_USD": THRESHOLDS})
+    engine.broker.on_price("EUR_USD", 1.0, 1.0001)
+    engine.broker.create_order("EUR_USD", units)
+    return engine
+
+
+def tick(client, bid):
+    client.on_success(
+        "2024-01-02T00:00:00Z", bid, bid + 0.0001, pair="EUR_USD", **THRESHOLDS
+    )
+
+
+def test_existing_position_is_closed_once():
+    engine = engine_with_position()
+    ticks = [
+        ("EUR_USD", i * 10**9, bid, bid + 0.0001)
+        for i, bid in enumerate([1.0, 0.995, 0.985, 0.984, 0.983])
+    ]
+    result = engine.run(ticks)
+
+    closes = [fill for fill in result.fills if float(fill["units"]) == -1000]
+    assert len(closes) == 1
+    assert result.positions == {}
+    assert engine.client.order_states.state("EUR_USD") == FLAT
+
+
+def test_thresholds_are_production_shaped():
+    assert THRESHOLDS["timeframe_exit_low"] == 0.99
+    assert THRESHOLDS["timeframe_exit_high"] == 1.01
+
+
+@pytest.mark.parametrize("units", [1000, -1000])
+def test_position_inside_the_exit_channel_stays_open(units):
+    engine = engine_with_position(units)
+    # a long exits below the channel low only, a short above its high only
+    inside = [1.0, 0.9995, 1.0005, 0.991, 1.0089]
+    outside = 0.985 if units > 0 else 1.015
+    ticks = [
+        ("EUR_USD", i * 10**9, bid, bid + 0.0001)
+        for i, bid in enumerate(inside + [outside])
+    ]
+    result = engine.run(ticks)
+
+    closes = [fill for fill in result.fills if float(fill["units"]) == -units]
+    assert len(closes) == 1
+    assert float(closes[0]["price"]) == pytest.approx(
+        outside if units > 0 else outside + 0.0001
+    )
+    assert result.positions == {}
+
+
+def test_no_exit_before_the_order_states_caught_up():
+    engine = engine_with_position()
+    client = engine.client
+    transactions = len(engine.broker.account.transactions)
+    # the book already knows the position, the order states do not
+    client.position_book.reset(
+        engine.broker.get_positions(), engine.broker.account.last_transaction_id
+    )
+    tick(client, 0.985)
+    assert len(engine.broker.account.transactions) == transactions
+
+    client.apply_positions(
+        engine.broker.get_positions(), engine.broker.account.last_transaction_id
+    )
+    assert client.order_states.state("EUR_USD") == OPEN
+    tick(client, 0.985)
+    assert engine.broker.account.transactions[-1]["type"] == "ORDER_FILL"
+    assert client.position_book.units("EUR_USD") == 0
+
+
+def test_entry_the_order_states_refuse_is_not_placed():
+    engine = engine_with_position()
+    client = engine.client
+    client.apply_positions(
+        engine.broker.get_positions(), engine.broker.account.last_transaction_id
+    )
+    transactions = len(engine.broker.account.transactions)
+    assert client.submit_order("EUR_USD", 1000, price=1.0) is None
+    assert len(engine.broker.account.transactions) == transactions
+    assert client.order_states.state("EUR_USD") == OPEN
+
+
+class FullPipeline:
+    def next_client_id(self):
+        return "full-1"
+
+    def submit(self, instrument, units, client_id=None, **kwargs):
+        raise asyncio.QueueFull()
+
+
+def test_full_queue_rolls_the_state_back():
+    engine = engine_with_position()
+    client = engine.client
+    client.apply_positions(
+        engine.broker.get_positions(), engine.broker.account.last_transaction_id
+    )
+    client.order_pipeline = FullPipeline()
+    assert client.submit_order("EUR_USD", -1000, closing=True) is None
+    assert client.order_states.state("EUR_USD") == OPEN
+    assert client.order_states.in_flight == {}
+    assert client.submit_order("GBP_USD", 1000) is None
+    assert client.order_states.state("GBP_USD") != PENDING
+
+
+def test_cancel_before_the_response_ends_the_entry():
+    states = OrderStateMachine()
+    states.entry_submitted("EUR_USD", "c-1")
+    # the transaction stream was faster than the order response
+    states.order_cancelled("7")
+    states.order_resolved("EUR_USD", "c-1", {"type": "LIMIT_ORDER", "id": "7"}, 0.0)
+    assert states.state("EUR_USD") == FLAT
+    assert states.resting == {}
+    assert states.cancelled == {}
+
+
+def test_cancelled_exit_reopens_the_pair():
+    states = OrderStateMachine()
+    states.position_changed("EUR_USD", 1000)
+    states.exit_submitted("EUR_USD", "c-1")
+    states.order_resolved("EUR_USD", "c-1", {"type": "MARKET_ORDER", "id": "9"}, 1000)
+    assert states.state("EUR_USD") == CLOSING
+    states.order_cancelled("9")
+    assert states.state("EUR_USD") == OPEN
+    assert states.resting == {}
+
+    # a cancel in the response itself
+    states.exit_submitted("EUR_USD", "c-2")
+    cancel = {"type": "ORDER_CANCEL", "id": "11", "orderID": "10"}
+    states.order_resolved("EUR_USD", "c-2", cancel, 1000)
+    assert states.state("EUR_USD") == OPEN
+    assert states.resting == {}
+
+
+def test_cancels_kept_are_bounded():
+    states = OrderStateMachine()
+    for order_id in range(states.cancels_kept + 10):
+        states.order_cancelled(str(order_id))
+    assert len(states.cancelled) == states.cancels_kept
+    assert "9" not in states.cancelled and "10" in states.cancelled
+
+
+def test_reconcile_expires_orders_no_longer_pending():
+    engine = ReplayEngine({"EUR_USD": THRESHOLDS})
+    engine.broker.on_price("EUR_USD", 1.0, 1.0001)
+    client = engine.client
+    client.reconcile_positions()
+    assert client.submit_order("EUR_USD", 1000, price=0.9) is not None
+    (order_id,) = client.order_states.resting
+    assert client.order_states.state("EUR_USD") == PENDING
+
+    # still pending over REST, the pair keeps waiting
+    client.reconcile_positions()
+    assert client.order_states.resting == {order_id: "EUR_USD"}
+    assert client.order_states.state("EUR_USD") == PENDING
+
+    # gone without its cancel ever reaching the transaction stream
+    engine.broker.account.pending_orders.clear()
+    client.reconcile_positions()
+    assert client.order_states.resting == {}
+    assert client.order_states.state("EUR_USD") == FLAT
+
+
+def test_reconcile_resets_book_and_states_together(simulator, config):
+    server = simulator()
+    client = StreamingClient(config(server))
+    client.create_order("EUR_USD", 100, suppress=True)
+
+    async def main():
+        client.schedule_reconcile()
+        # the positions are fetched on a worker thread, the book stays as it
+        # was until the loop applies them
+        assert not client.position_book.synced
+        await client.reconciling
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert client.position_book.units("EUR_USD") == 100
+    assert client.order_states.state("EUR_USD") == OPEN
+
+
+def test_account_cache_staleness_is_exported():
+    registry = MetricsRegistry()
+    cache = AccountCache(lambda: {"balance": "100"}, summary={"balance": "90"})
+    registry.register("account_summary", cache)
+    cache.get()
+    cache.invalidate()
+    cache.get()
+
+    exposition = registry.render()
+    assert "automated_trader_account_summary_stale 1" in exposition
+    assert "automated_trader_account_summary_stale_reads_total 1" in exposition
+    assert "automated_trader_account_summary_reads_total 2" in exposition
+    assert "automated_trader_account_summary_refreshes_total 0" in exposition
+
+    cache.refresh()
+    exposition = registry.render()
+    assert "automated_trader_account_summary_stale 0" in exposition
+    assert "automated_trader_account_summary_refreshes_total 1" in exposition
+    assert "automated_trader_account_summary_age_seconds " in exposition
@@ -0,0 +1,81 @@
+from automated_trader.api_client.client import OANDAClient
+from automated_trader.api_client.order_pipeline import OrderPipeline
+from automated_trader.commons.order_state import FLAT, PENDING, OrderStateMachine
+import asyncio
+import v20
+
+import pytest
+
+
+class LostResponseClient(OANDAClient):
+    """Places every order, the first lost of them raise V20Timeout afterwards
+    as if their response never made it back
+    """
+
+    lost = 1
+
+    def create_order(self, *args, **kwargs):
+        result = super().create_order(*args, **kwargs)
+        if self.lost:
+            self.lost -= 1
+            raise v20.errors.V20Timeout("order", "read")
+        return result
+
+
+def place(client, instrument, units, **kwargs):
+    pipeline = OrderPipeline(client, retry_delay=0.01)
+    states = OrderStateMachine()
+
+    async def main():
+        order = pipeline.submit(instrument, units, **kwargs)
+        states.entry_submitted(instrument, order.client_id)
+        result = await order
+        states.order_resolved(instrument, order.client_id, result, 0.0)
+        return order, result
+
+    order, result = asyncio.run(main())
+    return order, result, states
+
+
+@pytest.mark.parametrize("touch", [False, True])
+def test_retry_finds_the_resting_order(simulator, config, touch):
+    server = simulator()
+    client = LostResponseClient(config(server))
+    bid, ask = server.feed.current_price("EUR_USD")
+    # far from the market, the order rests
+    price = round(ask * (0.95 if not touch else 1.05), 5)
+    order, result, states = place(client, "EUR_USD", 100, price=price, touch=touch)
+
+    assert order.attempts == 2
+    assert result["type"] == ("MARKET_IF_TOUCHED_ORDER" if touch else "LIMIT_ORDER")
+    assert result["clientExtensions"]["id"] == order.client_id
+    # still waiting for the fill, no second entry is taken
+    assert states.state("EUR_USD") == PENDING
+    assert states.resting == {result["id"]: "EUR_USD"}
+    assert len(server.account.pending_orders) == 1
+
+
+@pytest.mark.parametrize("time_in_force", ["FOK", "IOC"])
+def test_order_cancelled_right_away_is_resolved(simulator, config, time_in_force):
+    server = simulator()
+    client = OANDAClient(config(server))
+    bid, ask = server.feed.current_price("EUR_USD")
+    price = round(ask * 0.95, 5)
+    order, result, states = place(
+        client, "EUR_USD", 100, price=price, time_in_force=time_in_force
+    )
+
+    assert result["type"] == "ORDER_CANCEL"
+    assert states.state("EUR_USD") == FLAT
+    assert states.resting == {}
+    assert server.account.pending_orders == []
+
+
+def test_retry_finds_the_fill(simulator, config):
+    server = simulator()
+    client = LostResponseClient(config(server))
+    order, result, states = place(client, "EUR_USD", 100)
+
+    assert order.attempts == 2
+    assert result["type"] == "ORDER_FILL"
+    assert server.account.position("EUR_USD")["long"][0] == 100
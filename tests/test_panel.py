@@ -0,0 +1,57 @@
+from automated_trader.data_processor.panel import TurtlePanelProcessor, to_pair_dict
+from automated_trader.data_processor.processor import TurtleProcessor
+
+import numpy as np
+import pytest
+
+from test_processor import WINDOWS, candles, spiky_candles
+
+
+@pytest.mark.parametrize("entry_point_days, exit_point_days", WINDOWS)
+def test_panel_matches_turtle_processor(entry_point_days, exit_point_days):
+    rng = np.random.default_rng(entry_point_days + 1)
+    for _ in range(30):
+        # histories from just long enough to several times the window
+        lengths = rng.integers(entry_point_days + 1, 3 * entry_point_days, 10)
+        frames = {
+            f"PAIR_{i}": candles(rng, int(length), 100.0 if i % 2 else 1.2)
+            for i, length in enumerate(lengths)
+        }
+        result = to_pair_dict(
+            TurtlePanelProcessor.from_frames(
+                frames, entry_point_days, exit_point_days
+            ).analyze_turtle_conditions()
+        )
+        for instrument, frame in frames.items():
+            expected = TurtleProcessor(
+                frame, entry_point_days, exit_point_days
+            ).analyze_turtle_conditions()
+            assert tuple(result[instrument].values()) == expected
+
+
+def test_panel_atr_matches_turtle_processor_after_spikes():
+    rng = np.random.default_rng(11)
+    for _ in range(30):
+        lengths = rng.integers(9, 400, 10)
+        frames = {
+            f"PAIR_{i}": spiky_candles(rng, int(length), 100.0 if i % 2 else 1.2)
+            for i, length in enumerate(lengths)
+        }
+        atr = TurtlePanelProcessor.from_frames(frames, 8, 4).atr()
+        expected = [
+            TurtleProcessor(frame, 8, 4).build_atr().value for frame in frames.values()
+        ]
+        # too short histories are nan on both sides
+        np.testing.assert_array_equal(atr, expected)
+
+
+@pytest.mark.parametrize("missing", [0, 1, 30])
+def test_short_history_raises(missing):
+    rng = np.random.default_rng(missing)
+    frames = {
+        "EUR_USD": candles(rng, 100),
+        "GBP_USD": candles(rng, 70 - missing),
+    }
+    panel = TurtlePanelProcessor.from_frames(frames, 70, 8)
+    with pytest.raises(ValueError, match="GBP_USD"):
+        panel.analyze_turtle_conditions()
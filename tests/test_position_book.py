@@ -0,0 +1,49 @@
+from automated_trader.commons.position_book import PositionBook
+
+
+def fill(transaction_id, units, instrument="EUR_USD"):
+    return {
+        "type": "ORDER_FILL",
+        "id": str(transaction_id),
+        "instrument": instrument,
+        "units": str(units),
+    }
+
+
+def position(units, instrument="EUR_USD"):
+    long, short = (units, 0) if units > 0 else (0, units)
+    return {
+        "instrument": instrument,
+        "long": {"units": str(long)},
+        "short": {"units": str(short)},
+    }
+
+
+def test_fills_after_the_snapshot_survive_a_reset():
+    book = PositionBook()
+    book.reset([], "100")
+    assert book.apply_fill(fill(105, 1000))
+
+    # the REST response was put together before fill 105
+    assert book.reset([], "103") == {}
+    assert book.units("EUR_USD") == 1000
+    assert not book.apply_fill(fill(105, 1000))
+
+    # a later snapshot contains it
+    assert book.reset([position(1000)], "105") == {}
+    assert book.units("EUR_USD") == 1000
+    assert book.applied == {}
+
+
+def test_reset_corrects_the_book_around_newer_fills():
+    book = PositionBook()
+    book.reset([position(500)], "100")
+    assert book.apply_fill(fill(104, -500))
+    assert book.apply_fill(fill(106, 200, "GBP_USD"))
+
+    # fill 104 is in the snapshot, GBP_USD was missed and 106 is not yet in it
+    differences = book.reset([position(300, "USD_JPY")], "105")
+    assert differences == {"USD_JPY": (0.0, 300.0)}
+    assert book.positions == {"USD_JPY": 300.0, "GBP_USD": 200.0}
+    assert not book.apply_fill(fill(104, -500))
+    assert not book.apply_fill(fill(106, 200, "GBP_USD"))
@@ -0,0 +1,111 @@
+from automated_trader.data_processor.atr import AverageTrueRange
+from automated_trader.data_processor.donchian import DonchianChannel
+from automated_trader.data_processor.processor import TurtleProcessor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+WINDOWS = [(70, 8), (55, 20), (20, 10)]
+
+
+def baseline_turtle_conditions(data, entry_point_days, exit_point_days):
+    """analyze_turtle_conditions as it was before the incremental channels"""
+    highs = data["h"]
+    lows = data["l"]
+    sliced_highs = highs.iloc[len(highs) - entry_point_days - 1 : len(highs) - 1]
+    sliced_lows = lows.iloc[len(lows) - entry_point_days - 1 : len(lows) - 1]
+    timeframe_high = max(sliced_highs)
+    timeframe_low = min(sliced_lows)
+
+    high_low = data["h"] - data["l"]
+    high_close = np.abs(data["h"] - data["c"].shift())
+    low_close = np.abs(data["l"] - data["c"].shift())
+    ranges = pd.concat([high_low, high_close, low_close], axis=1)
+    true_range = np.max(ranges, axis=1)
+    atr = true_range.rolling(20).sum() / 20
+
+    exit_highs = highs.iloc[len(highs) - exit_point_days - 1 : len(highs) - 1]
+    exit_lows = lows.iloc[len(lows) - exit_point_days - 1 : len(lows) - 1]
+    return (
+        timeframe_high,
+        timeframe_low,
+        min(exit_lows),
+        max(exit_highs),
+        atr.iloc[-1],
+    )
+
+
+def candles(rng, length, price=1.2):
+    closes = price * np.exp(np.cumsum(rng.normal(0, 0.006, length)))
+    opens = np.r_[closes[0], closes[:-1]]
+    return pd.DataFrame(
+        {
+            "o": opens,
+            "h": np.maximum(opens, closes) * (1 + rng.uniform(0, 0.004, length)),
+            "l": np.minimum(opens, closes) * (1 - rng.uniform(0, 0.004, length)),
+            "c": closes,
+        },
+        index=pd.date_range("2020-01-01", periods=length, freq="D"),
+    )
+
+
+def spiky_candles(rng, length, price=1.2, spikes=5):
+    """candles with a few bars whose high is many times the price"""
+    data = candles(rng, length, price)
+    bars = rng.integers(0, length, spikes)
+    data.iloc[bars, data.columns.get_loc("h")] *= rng.uniform(2, 50, spikes)
+    return data
+
+
+@pytest.mark.parametrize("entry_point_days, exit_point_days", WINDOWS)
+def test_turtle_conditions_match_the_baseline(entry_point_days, exit_point_days):
+    rng = np.random.default_rng(entry_point_days)
+    for length in rng.integers(entry_point_days + 1, 400, 50):
+        price = 100.0 if length % 2 else 1.2
+        data = candles(rng, int(length), price)
+        result = TurtleProcessor(
+            data, entry_point_days, exit_point_days
+        ).analyze_turtle_conditions()
+        expected = baseline_turtle_conditions(data, entry_point_days, exit_point_days)
+        assert result == expected
+
+
+@pytest.mark.parametrize("entry_point_days, exit_point_days", WINDOWS)
+def test_atr_matches_the_baseline_after_spikes(entry_point_days, exit_point_days):
+    # a running sum without compensation drifts once a spike left the window
+    rng = np.random.default_rng(entry_point_days + 1)
+    for length in rng.integers(entry_point_days + 1, 400, 100):
+        price = 100.0 if length % 2 else 1.2
+        data = spiky_candles(rng, int(length), price)
+        result = TurtleProcessor(
+            data, entry_point_days, exit_point_days
+        ).analyze_turtle_conditions()
+        expected = baseline_turtle_conditions(data, entry_point_days, exit_point_days)
+        assert result == expected
+
+
+@pytest.mark.parametrize("window", [1, 2, 8, 70])
+def test_donchian_channel_matches_sliding_max_and_min(window):
+    rng = np.random.default_rng(window)
+    highs = rng.random(500)
+    # repeated values keep the deques honest about equal prices
+    lows = np.round(rng.random(500), 1)
+    channel = DonchianChannel(window)
+    for i, (high, low) in enumerate(zip(highs, lows)):
+        channel.update(high, low)
+        first = max(i + 1 - window, 0)
+        assert channel.upper == highs[first : i + 1].max()
+        assert channel.lower == lows[first : i + 1].min()
+        assert channel.ready == (i + 1 >= window)
+
+
+def test_atr_state_round_trip(tmp_path):
+    rng = np.random.default_rng(3)
+    data = spiky_candles(rng, 120)
+    atr = AverageTrueRange(20)
+    atr.extend(data["h"][:100], data["l"][:100], data["c"][:100])
+    atr.save(tmp_path / "atr.json")
+    restored = AverageTrueRange.load(tmp_path / "atr.json")
+    for high, low, close in zip(data["h"][100:], data["l"][100:], data["c"][100:]):
+        assert restored.update(high, low, close) == atr.update(high, low, close)
@@ -0,0 +1,124 @@
+from automated_trader.api_client.client import StreamingClient
+from automated_trader.api_client.supervisor import StreamSupervisor, backoff_delay
+from automated_trader.commons.metrics import registry
+import asyncio
+
+import pytest
+
+BASE = 0.02
+MAXIMUM = 0.1
+
+
+class RecordingSupervisor(StreamSupervisor):
+    """Keeps the (attempt, delay) of every reconnect"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delays = []
+
+    def backoff(self, attempt):
+        delay = super().backoff(attempt)
+        self.delays.append((attempt, delay))
+        return delay
+
+
+def supervise(client, instrument, until, **kwargs):
+    """Runs a RecordingSupervisor until until(supervisor) holds"""
+    supervisor = RecordingSupervisor(
+        client,
+        backoff_base=BASE,
+        backoff_max=MAXIMUM,
+        check_interval=0.02,
+        **kwargs,
+    )
+
+    async def main():
+        async def stop_when_done():
+            while not until(supervisor):
+                await asyncio.sleep(0.01)
+            client.stop_stream = True
+
+        stopper = asyncio.ensure_future(stop_when_done())
+        await asyncio.wait_for(
+            supervisor.run(instrument, callback=lambda *tick: None), timeout=30
+        )
+        stopper.cancel()
+
+    asyncio.run(main())
+    return supervisor
+
+
+def assert_within_bounds(delays):
+    for attempt, delay in delays:
+        ceiling = min(MAXIMUM, BASE * 2**attempt)
+        assert ceiling / 2 <= delay <= ceiling
+
+
+@pytest.mark.parametrize("attempt", range(12))
+def test_backoff_delay_bounds(attempt):
+    for _ in range(100):
+        delay = backoff_delay(attempt, 1.0, 60.0)
+        assert min(60.0, 2**attempt) / 2 <= delay <= min(60.0, 2**attempt)
+
+
+def test_reconnects_after_dropped_connections(simulator, config):
+    server = simulator(tick_rate=500, drop_after=15)
+    client = StreamingClient(config(server))
+    supervisor = supervise(
+        client, "EUR_USD,GBP_USD", lambda s: s.metrics.connections >= 4
+    )
+
+    metrics = supervisor.metrics
+    assert metrics.connections >= 4
+    # every drop was followed by a reconnect that delivered data again
+    assert metrics.reconnects >= 3
+    # every lost connection waited a backoff before the next one
+    assert len(supervisor.delays) >= metrics.connections - 1
+    assert metrics.stalls == 0
+    # the dropped connections had delivered ticks, the backoff starts over
+    assert [attempt for attempt, _ in supervisor.delays] == [0] * len(supervisor.delays)
+    assert_within_bounds(supervisor.delays)
+    assert metrics.total_downtime() > 0
+
+    exposition = registry.render()
+    assert (
+        f"automated_trader_pricing_stream_reconnects_total {metrics.reconnects}\n"
+        in exposition
+    )
+    assert (
+        f"automated_trader_pricing_stream_connections_total {metrics.connections}\n"
+        in exposition
+    )
+
+
+def test_detects_stalled_stream(simulator, config):
+    server = simulator(tick_rate=500, stall_after=5, stall_duration=2.0)
+    client = StreamingClient(config(server))
+    supervisor = supervise(
+        client, "EUR_USD", lambda s: s.metrics.stalls >= 2, stall_timeout=0.2
+    )
+
+    metrics = supervisor.metrics
+    assert metrics.stalls >= 2
+    assert metrics.connections >= 2
+    assert metrics.reconnects >= 1
+    assert_within_bounds(supervisor.delays)
+    assert (
+        f"automated_trader_pricing_stream_stalls_total {metrics.stalls}\n"
+        in registry.render()
+    )
+
+
+def test_backoff_grows_while_no_data_arrives(simulator, config):
+    server = simulator(tick_rate=500)
+    client = StreamingClient(config(server))
+    # the simulator does not quote XAU_USD, every connection ends without data
+    supervisor = supervise(client, "XAU_USD", lambda s: s.metrics.connections >= 6)
+
+    attempts = [attempt for attempt, _ in supervisor.delays]
+    assert attempts[:5] == [0, 1, 2, 3, 4]
+    assert supervisor.metrics.reconnects == 0
+    assert supervisor.metrics.down_since is not None
+    assert_within_bounds(supervisor.delays)
+    # capped at backoff_max from attempt 3 on
+    assert all(delay <= MAXIMUM for _, delay in supervisor.delays)
@@ -0,0 +1,70 @@
+from automated_trader.commons.tick_recorder import DAY_NS, TickArchive, TickRecorder
+import os
+
+DAY = 19_723 * DAY_NS
+
+
+def record(recorder, ticks):
+    for instrument, second in ticks:
+        recorder.record(instrument, DAY + second * 10**9, 1.0 + second, 1.1 + second)
+    recorder.flush()
+
+
+def crash(recorder):
+    """Drops a recorder without closing its files or writing a last index"""
+    for tick_file in recorder.files.values():
+        tick_file.records.flush()
+        tick_file.header.flush()
+    recorder.files = {}
+
+
+def named_ticks(directory):
+    return [
+        (names[instrument_id], int(time // 10**9 - DAY // 10**9))
+        for names, records in TickArchive(directory).ticks()
+        for instrument_id, time in zip(records["instrument_id"], records["time"])
+    ]
+
+
+def test_reopened_file_keeps_its_instruments(tmp_path):
+    directory = str(tmp_path)
+    first = TickRecorder(directory)
+    record(first, [("EUR_USD", 1), ("GBP_USD", 2)])
+    # no index write of the writer thread happened since
+    record(first, [("USD_JPY", 3), ("EUR_USD", 4)])
+    crash(first)
+
+    second = TickRecorder(directory)
+    record(second, [("AUD_USD", 5), ("USD_JPY", 6)])
+    tick_file = next(iter(second.files.values()))
+    assert tick_file.instruments == ["EUR_USD", "GBP_USD", "USD_JPY", "AUD_USD"]
+    assert tick_file.instrument_counts == [2, 1, 2, 1]
+    crash(second)
+
+    assert named_ticks(directory) == [
+        ("EUR_USD", 1),
+        ("GBP_USD", 2),
+        ("USD_JPY", 3),
+        ("EUR_USD", 4),
+        ("AUD_USD", 5),
+        ("USD_JPY", 6),
+    ]
+
+
+def test_unindexed_ids_are_not_reused(tmp_path):
+    directory = str(tmp_path)
+    first = TickRecorder(directory)
+    record(first, [("EUR_USD", 1), ("GBP_USD", 2)])
+    crash(first)
+    # a file of an older recorder that never wrote its index
+    os.remove(os.path.join(directory, "2024-01-01.idx.npz"))
+
+    second = TickRecorder(directory)
+    record(second, [("USD_JPY", 3)])
+    second.stop()
+
+    assert named_ticks(directory) == [
+        ("unknown-0", 1),
+        ("unknown-1", 2),
+        ("USD_JPY", 3),
+    ]
@@ -0,0 +1,66 @@
+from automated_trader.api_client.client import StreamingClient
+from automated_trader.api_client.transactions import FillEvent, TransactionStream
+from automated_trader.commons.metrics import registry
+import asyncio
+
+
+def stream_until(stream, until, timeout=10):
+    """Runs the transaction stream until until() holds"""
+
+    async def main():
+        task = asyncio.ensure_future(stream.run())
+        try:
+            async with asyncio.timeout(timeout):
+                while not until():
+                    await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+
+    asyncio.run(main())
+
+
+def test_stream_survives_heartbeats(simulator, config):
+    # the simulator sends {"type": "HEARTBEAT", "lastTransactionID", "time"}
+    server = simulator(heartbeat_interval=0.02)
+    client = StreamingClient(config(server))
+    stream = TransactionStream(client, stall_timeout=1.0)
+    events = []
+    stream.subscribe(events.append)
+    polls = 0
+
+    def until():
+        nonlocal polls
+        polls += 1
+        # a few dozen heartbeats go by before the order
+        if polls == 50:
+            client.create_order("EUR_USD", 100, suppress=True)
+        return any(isinstance(event, FillEvent) for event in events)
+
+    stream_until(stream, until)
+    assert stream.metrics.connections == 1
+    assert stream.metrics.errors == 0
+    assert stream.metrics.stalls == 0
+    exposition = registry.render()
+    assert "automated_trader_transaction_stream_connections_total 1\n" in exposition
+    assert "automated_trader_transaction_stream_down 0\n" in exposition
+
+
+def test_heartbeat_with_a_newer_id_catches_up(simulator, config):
+    server = simulator(heartbeat_interval=0.02)
+    client = StreamingClient(config(server))
+    stream = TransactionStream(client, stall_timeout=1.0)
+    events = []
+    stream.subscribe(events.append)
+
+    def until():
+        if stream.last_id is not None and not server.account.transactions:
+            # logged without reaching the stream, only the heartbeat tells
+            server.account.transactions.append(
+                {"id": "1", "type": "ORDER_CANCEL", "orderID": "0"}
+            )
+        return bool(events)
+
+    stream_until(stream, until)
+    assert [event.id for event in events] == [1]
+    assert stream.metrics.connections == 1
+    assert stream.metrics.errors == 0
@@ -0,0 +1,110 @@
+from automated_trader.api_client.client import StreamingClient
+from automated_trader.api_client.transport import ThreadedStreamReader
+import asyncio
+import time
+
+import pytest
+
+
+def test_reader_thread_keeps_the_event_loop_free():
+    def slow_parts(response):
+        for i in range(5):
+            time.sleep(0.05)
+            yield i
+
+    async def main():
+        spins = 0
+
+        async def spin():
+            nonlocal spins
+            while True:
+                spins += 1
+                await asyncio.sleep(0.001)
+
+        spinner = asyncio.ensure_future(spin())
+        parts = [part async for part in ThreadedStreamReader(lambda: None, slow_parts)]
+        spinner.cancel()
+        return parts, spins
+
+    parts, spins = asyncio.run(main())
+    assert parts == [0, 1, 2, 3, 4]
+    # the blocking generator ran for 250ms without holding up the loop
+    assert spins > 50
+
+
+def test_reader_timed_parts_and_errors():
+    def failing(response):
+        yield "a"
+        raise ConnectionResetError("dropped")
+
+    async def main():
+        received = []
+        with pytest.raises(ConnectionResetError):
+            async for stamp, part in ThreadedStreamReader(
+                lambda: None, failing, timed=True
+            ):
+                received.append((stamp, part))
+        return received
+
+    received = asyncio.run(main())
+    assert [part for _, part in received] == ["a"]
+    assert isinstance(received[0][0], int)
+
+
+@pytest.mark.parametrize("raw", [True, False])
+def test_stream_data_shares_the_loop(simulator, config, raw):
+    server = simulator(tick_rate=200)
+    client = StreamingClient(config(server))
+    seen = []
+
+    async def main():
+        spins = 0
+
+        async def spin():
+            nonlocal spins
+            while True:
+                spins += 1
+                await asyncio.sleep(0.001)
+
+        spinner = asyncio.ensure_future(spin())
+        await client.stream_data(
+            "EUR_USD,GBP_USD",
+            stop=40,
+            raw=raw,
+            callback=lambda instrument, time, bid, ask: seen.append(instrument),
+        )
+        spinner.cancel()
+        return spins
+
+    spins = asyncio.run(main())
+    assert client.ticks == 40
+    assert set(seen) == {"EUR_USD", "GBP_USD"}
+    # about 200ms of streaming, the spinner ran in between the ticks
+    assert spins > 20
+
+
+def test_close_gives_the_connection_up(simulator, config):
+    # silent after three ticks, the reader thread blocks on the socket
+    server = simulator(tick_rate=50, stall_after=3, stall_duration=30.0)
+    client = StreamingClient(config(server))
+
+    async def main():
+        reader = ThreadedStreamReader(
+            lambda: client.ctx_stream.pricing.stream(
+                client.account_id, instruments="EUR_USD"
+            )
+        )
+        parts = 0
+        async for _ in reader:
+            parts += 1
+            if parts == 3:
+                break
+        await asyncio.sleep(0.2)
+        started = time.perf_counter()
+        reader.close()
+        return reader, time.perf_counter() - started
+
+    reader, elapsed = asyncio.run(main())
+    assert elapsed < 1.0
+    assert not reader._thread.is_alive()
+    assert reader._response.http_response.raw.closed